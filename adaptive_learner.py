@@ -1,49 +1,184 @@
 # adaptive_learner.py
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
 import pickle
-import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from learning_store import LearningLog
+from ngram_store import create_ngram_counter
+
+# خيط واحد يكتب سجلات ولقطات كل المتعلمين بالترتيب، فلا تحجب الكتابة (fsync والضغط) حلقة الأحداث
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="learning-writer")
 
 class AdaptiveLearner:
-    def __init__(self, dialect: str):
+    def __init__(self, dialect: str, save_interval_minutes: float = 30,
+                 max_pending: int = 1000, compact_threshold_bytes: int = 4 * 1024 * 1024,
+                 ngram_mode: str = "exact", ngram_memory_kb: int = 4096,
+                 decay_factor: float = 0.9, decay_every: int = 1000, max_responses: int = 5000,
+                 read_only: bool = False):
         self.dialect = dialect
+        # قارئ فقط (لوحة التحكم): لا يكتب ولا يصلح ملفات الكاتب المالك لها
+        self.read_only = read_only
         self.learning_file = f"data/learned_{dialect}.pkl"
-        self.learned_patterns = self.load_learned()
+        self.log_file = f"data/learned_{dialect}.log"
         
-        # ناقل الكلمات للتعرف على الأنماط
-        self.vectorizer = CountVectorizer(
-            ngram_range=(1, 3),
-            max_features=1000
-        )
+        # التفاعلات الجديدة تُجمع في الذاكرة وتُكتب دفعة واحدة
+        self.save_interval = save_interval_minutes * 60
+        self.max_pending = max_pending
+        self.compact_threshold = compact_threshold_bytes
+        self._store = LearningLog(self.learning_file, self.log_file)
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._last_seq = 0
+        # يحمي الأنماط من التعديل أثناء تسلسلها للقطة في خيط الكتابة
+        self._lock = threading.Lock()
+        self._last_write = None
+        # مؤقت يكتب المعلقة بعد save_interval إن لم يصل تفاعل جديد يكتبها
+        self._timer = None
+        
+        # عداد n-grams محدود الذاكرة مع تقليل دوري لوزن الأنماط القديمة
+        self.ngram_mode = ngram_mode
+        self.ngram_memory_kb = ngram_memory_kb
+        self.decay_factor = decay_factor
+        self.decay_every = decay_every
+        # نافذة آخر الردود الناجحة (تُحفظ في اللقطة كما هي)
+        self.max_responses = max(max_responses, 1)
+        
+        self.learned_patterns = self.load_learned()
     
     def load_learned(self):
-        """تحميل الأنماط المتعلمة"""
-        if os.path.exists(self.learning_file):
-            with open(self.learning_file, 'rb') as f:
-                return pickle.load(f)
-        return {"patterns": [], "responses": []}
+        """تحميل الأنماط المتعلمة (آخر لقطة + سجل الإلحاق)"""
+        snapshot, records = self._store.load(repair=not self.read_only)
+        learned = snapshot or {"patterns": [], "responses": []}
+        self._last_seq = learned.get("last_seq", 0)
+        
+        # اللقطات القديمة تحفظ الأنماط كقائمة نصوص
+        if isinstance(learned["patterns"], list):
+            counter = create_ngram_counter(self.ngram_mode, self.ngram_memory_kb)
+            counter.add_many(learned["patterns"])
+            learned["patterns"] = counter
+        
+        # اللقطات القديمة لا تحفظ عدد التفاعلات، وكل ما فيها تفاعلات ناجحة
+        if "interaction_count" not in learned:
+            learned["interaction_count"] = learned["success_count"] = len(learned["responses"])
+        
+        # responses_total يعد كل الردود المضافة حتى بعد خروج القديم منها من النافذة
+        learned.setdefault("responses_total", len(learned["responses"]))
+        learned["responses"] = deque(learned["responses"], maxlen=self.max_responses)
+        
+        for record in records:
+            # سجل قد يكون موجودًا في اللقطة إذا انقطع التشغيل أثناء الضغط
+            if record["seq"] > self._last_seq:
+                self._apply(learned, record)
+                self._last_seq = record["seq"]
+        
+        return learned
     
     def save_learned(self):
-        """حفظ الأنماط المتعلمة"""
-        os.makedirs("data", exist_ok=True)
-        with open(self.learning_file, 'wb') as f:
-            pickle.dump(self.learned_patterns, f)
+        """حفظ الأنماط المتعلمة كلقطة كاملة (ضغط السجل)"""
+        if self.read_only:
+            raise RuntimeError(f"متعلم {self.dialect} للقراءة فقط")
+        # اللقطة تشمل كل ما تعلمه حتى الآن، والتفاعلات المعلقة تُتجاهل عند التحميل حسب رقمها
+        with self._lock:
+            self.learned_patterns["last_seq"] = self._last_seq
+            payload = pickle.dumps(self.learned_patterns, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store.write_snapshot_bytes(payload)
+    
+    def flush(self):
+        """تسليم التفاعلات المعلقة لخيط الكتابة؛ ترجع Future الكتابة"""
+        if self.read_only:
+            raise RuntimeError(f"متعلم {self.dialect} للقراءة فقط")
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            # التسليم داخل القفل حتى تصل الدفعات لخيط الكتابة بترتيب أرقامها
+            self._last_write = _WRITER.submit(self._write, batch)
+        return self._last_write
+    
+    def _flush_due(self):
+        """انقضت مدة الحفظ دون تفاعل جديد: كتابة المعلقة حتى لا تبقى في الذاكرة فقط"""
+        if self._pending:
+            self.flush()
+    
+    def _write(self, batch: list):
+        """إلحاق الدفعة بالسجل (في خيط الكتابة)"""
+        self._store.append(batch)
+        
+        # ضغط دوري: استبدال السجل الطويل بلقطة جديدة
+        if self._store.log_size() > self.compact_threshold:
+            self.save_learned()
+    
+    def close(self):
+        """حفظ كل ما تبقى عند الإيقاف وانتظار اكتمال الكتابة"""
+        if not self.read_only:
+            self.flush().result()
     
     def learn_from_interaction(self, user_input: str, bot_response: str, success_score: float):
         """التعلم من التفاعل الناجح"""
-        if success_score > 0.7:  # إذا كان التفاعل ناجحًا
-            # استخراج n-grams من المدخلات
-            patterns = self.extract_patterns(user_input)
-            
-            # إضافة إلى الأنماط المتعلمة
-            self.learned_patterns["patterns"].extend(patterns)
-            self.learned_patterns["responses"].append({
-                "pattern": patterns[0] if patterns else user_input[:50],
+        with self._lock:
+            self._last_seq += 1
+            record = {
+                "seq": self._last_seq,
+                "input": user_input,
                 "response": bot_response,
                 "score": success_score
-            })
-            
-            self.save_learned()
+            }
+            self._apply(self.learned_patterns, record)
+            self._pending.append(record)
+            if self._timer is None:
+                self._timer = threading.Timer(self.save_interval, self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+        
+        # الكتابة على القرص حسب الجدول الزمني وليس مع كل رسالة، وفي خيط الكتابة
+        if (len(self._pending) >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.save_interval):
+            self.flush()
+    
+    def _apply(self, learned: dict, record: dict):
+        """إضافة تفاعل إلى الأنماط المتعلمة"""
+        learned["interaction_count"] = learned.get("interaction_count", 0) + 1
+        if record["score"] <= 0.7:  # التعلم من التفاعلات الناجحة فقط
+            return
+        learned["success_count"] = learned.get("success_count", 0) + 1
+        
+        # استخراج n-grams من المدخلات
+        patterns = self.extract_patterns(record["input"])
+        
+        # إضافة إلى الأنماط المتعلمة
+        learned["patterns"].add_many(patterns)
+        learned["since_decay"] = learned.get("since_decay", 0) + 1
+        if learned["since_decay"] >= self.decay_every:
+            learned["patterns"].decay(self.decay_factor)
+            learned["since_decay"] = 0
+        learned["responses"].append({
+            "pattern": patterns[0] if patterns else record["input"][:50],
+            "input": record["input"],
+            "response": record["response"],
+            "score": record["score"]
+        })
+        learned["responses_total"] = learned.get("responses_total", 0) + 1
+    
+    def get_stats(self) -> dict:
+        """إحصائيات تقدم تعلم اللهجة"""
+        patterns = self.learned_patterns["patterns"]
+        interactions = self.learned_patterns.get("interaction_count", 0)
+        successes = self.learned_patterns.get("success_count", 0)
+        return {
+            "dialect": self.dialect,
+            "learned_words": sum(1 for pattern in patterns.keys() if " " not in pattern),
+            "learned_phrases": len(patterns),
+            "interaction_count": interactions,
+            "success_rate": successes / interactions if interactions else 0.0
+        }
+    
+    def top_patterns(self, k: int = 20):
+        """أكثر العبارات تكرارًا في هذه اللهجة"""
+        return self.learned_patterns["patterns"].top_k(k)
     
     def extract_patterns(self, text: str):
         """استخراج أنماط لغوية من النص"""
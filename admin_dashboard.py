@@ -1,36 +1,148 @@
 # admin_dashboard.py
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request, abort
 import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+from telemetry import connect, ensure_schema, LATENCY_BUCKETS
 
 app = Flask(__name__)
 
+DB_PATH = 'bot_data.db'
+
+# اتصال قراءة واحد لكل خيط بدل فتح اتصال جديد مع كل طلب
+_local = threading.local()
+
+# البوت عند تشغيل اللوحة في نفس العملية، وإلا تُحمّل المتعلمات من القرص
+_bot = None
+_learner_cache = {}
+LEARNER_CACHE_SECONDS = 60
+
+
+def get_read_connection() -> sqlite3.Connection:
+    """اتصال القراءة الخاص بالخيط الحالي"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = connect(DB_PATH)
+        ensure_schema(conn)
+        _local.conn = conn
+    return conn
+
+
+def start_server(host: str = '127.0.0.1', port: int = 5000):
+    """تشغيل اللوحة في خيط daemon داخل عملية البوت حتى تعرض /metrics مقاييسه الحية
+
+    ترجع الخادم (server_port للمنفذ الفعلي، وshutdown للإيقاف).
+    """
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='admin-dashboard', daemon=True).start()
+    return server
+
+
+def attach_bot(bot):
+    """ربط اللوحة ببوت يعمل في نفس العملية لقراءة إحصائيات التعلم الحية"""
+    global _bot
+    _bot = bot
+
+
+def get_learner(dialect: str):
+    """المتعلم الخاص باللهجة (من البوت المرتبط أو من القرص مع تحديث دوري)"""
+    # اسم اللهجة يدخل في مسار الملف
+    if not dialect.isidentifier():
+        abort(404)
+    
+    if _bot is not None and dialect in _bot.learners:
+        return _bot.learners[dialect]
+
+    cached = _learner_cache.get(dialect)
+    if cached is None or time.monotonic() - cached[0] > LEARNER_CACHE_SECONDS:
+        from adaptive_learner import AdaptiveLearner
+        # للقراءة فقط: البوت هو المالك الوحيد للملفات وهو من يصلح ذيل السجل
+        cached = (time.monotonic(), AdaptiveLearner(dialect, read_only=True))
+        _learner_cache[dialect] = cached
+    return cached[1]
+
 @app.route('/dashboard')
 def dashboard():
     """لوحة تحكم لمراقبة أداء البوت"""
-    conn = sqlite3.connect('bot_data.db')
-    cursor = conn.cursor()
+    cursor = get_read_connection().cursor()
     
-    # إحصائيات البوت
+    # إحصائيات البوت من الجداول المجمّعة (لا تمر على كل التفاعلات)
     stats = cursor.execute('''
         SELECT 
-            COUNT(DISTINCT chat_id) as active_groups,
-            COUNT(*) as total_messages,
-            AVG(response_time) as avg_response_time,
-            dialect,
-            COUNT(*) as dialect_count
-        FROM interactions 
-        GROUP BY dialect
+            COALESCE(g.active_groups, 0) as active_groups,
+            r.message_count as total_messages,
+            r.latency_sum / r.message_count as avg_response_time,
+            r.dialect,
+            r.message_count as dialect_count
+        FROM dialect_rollup r
+        LEFT JOIN (
+            SELECT dialect, COUNT(*) as active_groups FROM dialect_groups GROUP BY dialect
+        ) g ON g.dialect = r.dialect
     ''').fetchall()
     
     return render_template('dashboard.html', stats=stats)
 
+@app.route('/api/latency/<dialect>')
+def dialect_latency(dialect):
+    """زمن الاستجابة لكل ساعة مع التوزيع التقريبي للهجة"""
+    hours = request.args.get('hours', 24, type=int)
+    cursor = get_read_connection().cursor()
+    
+    since_hour = int(time.time() // 3600) - hours
+    hourly = cursor.execute('''
+        SELECT hour, message_count, latency_sum / message_count, latency_min, latency_max, cache_hits
+        FROM hourly_rollup
+        WHERE dialect = ? AND hour > ?
+        ORDER BY hour
+    ''', (dialect, since_hour)).fetchall()
+    
+    histogram = dict(cursor.execute(
+        'SELECT bucket, count FROM latency_histogram WHERE dialect = ?', (dialect,)
+    ).fetchall())
+    
+    return jsonify({
+        "dialect": dialect,
+        "hourly": [
+            {
+                "hour": hour * 3600,
+                "messages": count,
+                "avg_response_time": avg,
+                "min_response_time": low,
+                "max_response_time": high,
+                "cache_hits": hits
+            }
+            for hour, count, avg, low, high, hits in hourly
+        ],
+        "histogram": [
+            {"le": bound, "count": histogram.get(i, 0)}
+            for i, bound in enumerate(list(LATENCY_BUCKETS) + ["+Inf"])
+        ]
+    })
+
 @app.route('/api/dialect_progress/<dialect>')
 def dialect_progress(dialect):
     """تتبع تقدم تعلم اللهجة"""
     # بيانات لرسوم بيانية
+    stats = get_learner(dialect).get_stats()
     return jsonify({
         "dialect": dialect,
-        "learned_words": 150,
-        "interaction_count": 1200,
-        "success_rate": 0.85
-    })
\ No newline at end of file
+        "learned_words": stats["learned_words"],
+        "interaction_count": stats["interaction_count"],
+        "success_rate": stats["success_rate"]
+    })
+
+@app.route('/ready')
+def ready():
+    """فحص الجاهزية: 200 بعد تحميل النموذج وتسخينه و503 قبل ذلك"""
+    if _bot is None:
+        return jsonify({"ready": False, "error": "no bot attached"}), 503
+    status = _bot.get_status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+def metrics():
+    """مقاييس الأداء بصيغة Prometheus النصية (من عملية البوت عند تشغيل اللوحة بـ start_server)"""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
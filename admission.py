@@ -0,0 +1,174 @@
+# admission.py
+"""قبول طلبات التوليد أو تخفيضها قبل دخولها طابور المُجدول
+
+كل رسالة تحتاج النموذج تمر من هنا: طابور محدود، ومهلة لكل طلب
+(performance.response_timeout_seconds)، وتقدير لزمن الانتظار من سرعة
+الدفعات الأخيرة. الطلب الذي لن ينتهي في مهلته يُقصّر (max_new_tokens أقل)
+أو يُرد عليه بدون النموذج، فيبقى ذيل زمن الاستجابة محدودًا عند الضغط
+بدل أن يطول مع طول الطابور.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from metrics import REGISTRY
+
+_ADMISSIONS = {
+    outcome: REGISTRY.counter("bot_admission_total", "قرارات قبول طلبات التوليد", outcome=outcome)
+    for outcome in ("admitted", "shortened", "queue_full", "evicted", "deadline", "expired")
+}
+
+
+class DeadlineExceeded(Exception):
+    """انتهت مهلة الطلب قبل أن يبدأ توليده"""
+
+
+class Evicted(Exception):
+    """أُخرج الطلب من الطابور لطلب مجموعة أخرى قبل أن يبدأ توليده"""
+
+
+@dataclass(eq=False)
+class Admission:
+    """قرار القبول لطلب واحد"""
+    group_id: str
+    # generate: الرد كاملًا، shorten: بعدد رموز أقل، shed: بدون النموذج
+    action: str
+    # سبب التخفيض: queue_full أو deadline
+    reason: str = None
+    # time.monotonic() الذي يجب أن ينتهي الرد قبله
+    deadline: float = None
+    # حد الرموز المولدة (None = حد اللهجة الافتراضي)
+    max_new_tokens: int = None
+    # يُخرج الطلب من طابور المُجدول إن لم يبدأ توليده ويُرجع True (False إن بدأ)؛
+    # الطلب بدون dequeue لا يُخرج لغيره
+    dequeue: Callable[[], bool] = field(default=None, repr=False)
+    # أُخرج من الطابور لطلب مجموعة أخرى
+    evicted: bool = False
+
+    @property
+    def admitted(self) -> bool:
+        return self.action != "shed"
+
+    def remaining(self) -> float:
+        """الثواني المتبقية حتى المهلة"""
+        return max(self.deadline - time.monotonic(), 0.0)
+
+
+class AdmissionController:
+    """طابور محدود بنصيب عادل لكل مجموعة وتقدير لزمن الانتظار من سرعة التوليد
+
+    max_queue حد صارم لعدد الطلبات المقبولة. عند امتلاء الطابور يُرفض طلب
+    المجموعة التي بلغت نصيبها (max_queue ÷ عدد المجموعات)، وطلب مجموعة دون
+    نصيبها يأخذ مكان أحدث طلب لم يبدأ توليده من المجموعات المتجاوزة لنصيبها.
+    الطلب الذي بدأ توليده لا يُخرج، فلا يتجاوز عمل النموذج max_queue أبدًا.
+    slots: عدد الطلبات التي تُخدم معًا (حجم الدفعة × الدفعات المتزامنة).
+    الانتظار يُقدّر بافتراض أن المُجدول يأخذ من المجموعات بالتناوب، فطلب
+    مجموعة هادئة لا ينتظر خلف كل طلبات مجموعة مزدحمة.
+    """
+
+    def __init__(self, timeout_seconds: float = 10, max_queue: int = 256, slots: int = 8,
+                 min_new_tokens: int = 16, smoothing: float = 0.2):
+        self.timeout = timeout_seconds
+        self.max_queue = max(max_queue, 1)
+        self.slots = max(slots, 1)
+        self.min_new_tokens = max(min_new_tokens, 1)
+        self.smoothing = smoothing
+
+        # طلبات مقبولة لم تنتهِ بعد (في الطابور أو قيد التوليد) لكل مجموعة، بترتيب وصولها
+        self._pending = {}
+        self.pending = 0
+
+        # متوسط متحرك لزمن الدفعة ولزمن الرمز الواحد (None قبل أول دفعة)
+        self.batch_seconds = None
+        self.token_seconds = None
+
+    def admit(self, group_id: str, max_new_tokens: int, slots: int = None) -> Admission:
+        """قرار لطلب جديد من المجموعة؛ الطلب المقبول يُحرَّر بـ release بعد انتهائه
+
+        slots: عدد ما يُخدم معًا لهذا النوع من الطلبات (البث يُخدم طلبًا طلبًا)
+        """
+        deadline = time.monotonic() + self.timeout
+        own = len(self._pending.get(group_id, ()))
+
+        # الطابور الممتلئ لا يكبر: إما يُرفض الطلب أو يأخذ مكان طلب مجموعة تجاوزت نصيبها
+        share = None
+        if self.pending >= self.max_queue:
+            share = max(self.max_queue // (len(self._pending) + (own == 0)), 1)
+            if own >= share:
+                return self._shed(group_id, "queue_full")
+
+        admission = Admission(group_id, "generate", deadline=deadline)
+        if self.token_seconds is not None:
+            # الطلبات قبله بالتناوب: own من مجموعته وحتى own + 1 من كل مجموعة أخرى
+            ahead = own + sum(
+                min(len(queued), own + 1) for group, queued in self._pending.items() if group != group_id
+            )
+            budget = self.timeout - (ahead // (slots or self.slots)) * self.batch_seconds
+            tokens = int(budget / self.token_seconds)
+            if tokens < self.min_new_tokens:
+                return self._shed(group_id, "deadline")
+            if tokens < max_new_tokens:
+                admission.action = "shorten"
+                admission.max_new_tokens = tokens
+
+        if share is not None and not self._evict_waiting(share):
+            return self._shed(group_id, "queue_full")
+        self._pending.setdefault(group_id, []).append(admission)
+        self.pending += 1
+        _ADMISSIONS["admitted" if admission.action == "generate" else "shortened"].inc()
+        return admission
+
+    def _shed(self, group_id: str, reason: str) -> Admission:
+        _ADMISSIONS[reason].inc()
+        return Admission(group_id, "shed", reason)
+
+    def _evict_waiting(self, share: int) -> bool:
+        """إخراج أحدث طلب لم يبدأ توليده من المجموعات التي تجاوزت share، بدءًا بأكثرها تجاوزًا"""
+        for _, queued in sorted(self._pending.items(), key=lambda item: len(item[1]), reverse=True):
+            if len(queued) <= share:
+                break
+            for admission in reversed(queued):
+                if admission.dequeue is not None and admission.dequeue():
+                    self._remove(admission)
+                    admission.action = "shed"
+                    admission.reason = "queue_full"
+                    admission.evicted = True
+                    _ADMISSIONS["evicted"].inc()
+                    return True
+        return False
+
+    def _remove(self, admission: Admission):
+        queued = self._pending.get(admission.group_id, [])
+        for index, pending in enumerate(queued):
+            if pending is admission:
+                del queued[index]
+                self.pending -= 1
+                break
+        if not queued:
+            self._pending.pop(admission.group_id, None)
+
+    def release(self, admission: Admission, expired: bool = False):
+        """انتهاء طلب مقبول؛ expired: تجاوز مهلته قبل أن يكتمل"""
+        if not admission.admitted:
+            return
+        if expired:
+            _ADMISSIONS["expired"].inc()
+        self._remove(admission)
+
+    def observe(self, seconds: float, tokens: int):
+        """تحديث التقدير من دفعة منتهية: زمنها وأطول رد فيها بالرموز"""
+        token_seconds = seconds / max(tokens, 1)
+        if self.batch_seconds is None:
+            self.batch_seconds, self.token_seconds = seconds, token_seconds
+            return
+        self.batch_seconds += self.smoothing * (seconds - self.batch_seconds)
+        self.token_seconds += self.smoothing * (token_seconds - self.token_seconds)
+
+    def get_stats(self) -> dict:
+        """إحصائيات القبول"""
+        return {
+            "pending": self.pending,
+            "groups": len(self._pending),
+            "batch_seconds": self.batch_seconds or 0.0,
+            "token_seconds": self.token_seconds or 0.0
+        }
@@ -0,0 +1,101 @@
+# aho_corasick.py
+import unicodedata
+from collections import deque
+from typing import Iterator, List, Tuple
+
+
+def is_word_char(char: str) -> bool:
+    """هل الحرف جزء من كلمة (حروف وأرقام وعلامات التشكيل)"""
+    return char.isalnum() or char == '_' or unicodedata.category(char) == 'Mn'
+
+
+class AhoCorasick:
+    """أتمتة Aho-Corasick لمطابقة عدد كبير من الأنماط في مرور واحد على النص"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+        self.pattern_count = 0
+
+    def add(self, pattern: str, payload=None):
+        """إضافة نمط مع قيمة مرتبطة به تُعاد عند المطابقة"""
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), payload))
+        self.pattern_count += 1
+        self._built = False
+
+    def build(self):
+        """حساب روابط الفشل (بحث بالعرض على الشجرة)"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # دمج مخرجات حالة الفشل حتى لا نتبع السلسلة وقت البحث
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+        self._built = True
+
+    def iter_matches(self, text: str, whole_words: bool = True,
+                     prefixes: Tuple[str, ...] = ()) -> Iterator[Tuple[int, int, object]]:
+        """إرجاع (البداية، النهاية، القيمة) لكل مطابقة في النص
+
+        عند whole_words تُقبل المطابقة فقط إذا كانت كلمة كاملة، مع السماح
+        بحرف سابقة ملتصق من prefixes (مثل واو العطف).
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        text_length = len(text)
+        state = 0
+
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+
+            end = index + 1
+            if whole_words and end < text_length and is_word_char(text[end]):
+                continue
+
+            for length, payload in output[state]:
+                start = end - length
+                if whole_words and start > 0 and is_word_char(text[start - 1]):
+                    # سابقة ملتصقة في بداية الكلمة (مثل "و" + الكلمة)
+                    if not (text[start - 1] in prefixes and (start == 1 or not is_word_char(text[start - 2]))):
+                        continue
+                yield start, end, payload
+
+    def find_all(self, text: str, whole_words: bool = True,
+                 prefixes: Tuple[str, ...] = ()) -> List[Tuple[int, int, object]]:
+        """قائمة بكل المطابقات في النص"""
+        return list(self.iter_matches(text, whole_words, prefixes))
+
+    def __len__(self):
+        return self.pattern_count
@@ -1,13 +1,480 @@
 # arabic_model.py
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import StoppingCriteria, StoppingCriteriaList, TextStreamer
+from transformers import LogitsProcessor, LogitsProcessorList
+import hashlib
+import os
+import re
+import time
 import torch
 
+from generation_types import GenerationRequest, GenerationResult, fallback_response, stop_limits
+from group_memory import as_turn
+from metrics import REGISTRY, PROFILER, Span
+from prefix_cache import PrefixCache
+
+# مقاييس مراحل التوليد (تُنشأ مرة واحدة حتى لا يكلف القياس بحثًا في كل استدعاء)
+_STAGES = {
+    stage: REGISTRY.histogram("model_stage_seconds", "زمن كل مرحلة داخل توليد الرد", stage=stage)
+    for stage in ("prompt", "tokenize", "generate", "extract")
+}
+_PREFILL = REGISTRY.histogram("model_prefill_seconds", "زمن معالجة الـ prompt حتى أول رمز")
+_DECODE_RATE = REGISTRY.histogram(
+    "model_decode_tokens_per_second", "سرعة توليد الرموز بعد أول رمز (لكل تسلسل)",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+_BATCH_SIZE = REGISTRY.histogram(
+    "model_batch_size", "عدد الطلبات في كل استدعاء generate", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+_TOKENS = REGISTRY.counter("model_tokens_generated_total", "مجموع الرموز المولدة")
+_DRAFT_TOKENS = {
+    result: REGISTRY.counter("model_draft_tokens_total", "رموز نموذج المسودة حسب قبولها", result=result)
+    for result in ("accepted", "rejected")
+}
+_ACCEPTANCE = REGISTRY.histogram(
+    "model_draft_acceptance", "نسبة قبول رموز المسودة لكل توليد تخميني",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+_STOPS = {
+    reason: REGISTRY.counter("model_stop_reason_total", "سبب انتهاء كل رد", reason=reason)
+    for reason in ("eos", "turn_marker", "sentences", "max_tokens")
+}
+
+
+DEFAULT_MODEL = "Qwen/Qwen2.5-1.5B-Instruct"
+
+# نهاية جملة: علامة ترقيم يليها فراغ أو نهاية النص
+_SENTENCE_END = re.compile(r"[.!?؟…]+(?=\s|$)")
+
+
+def _resolve_device(device: str) -> str:
+    """auto تختار cuda عند توفره، وطلب cuda بدون GPU يعود إلى cpu"""
+    if device in ("auto", "cuda") and torch.cuda.is_available():
+        return "cuda"
+    if device == "cuda":
+        print("⚠️  لا يوجد GPU، سيتم استخدام CPU")
+    return "cpu"
+
+
+def _resolve_cpu_dtype(dtype: str):
+    """bfloat16 فقط إذا كان المعالج يدعمه فعليًا، وإلا float32"""
+    if dtype in ("auto", "bfloat16"):
+        try:
+            if torch.ops.mkldnn._is_mkldnn_bf16_supported():
+                return torch.bfloat16
+        except (AttributeError, RuntimeError):
+            pass
+        if dtype == "bfloat16":
+            print("⚠️  المعالج لا يدعم bfloat16، سيتم استخدام float32")
+    return torch.float32
+
+
+def _configure_threads(num_threads: int = None, num_interop_threads: int = None):
+    """ضبط خيوط العمليات داخل العملية الواحدة وبين العمليات"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            # يجب ضبطه قبل أول عملية متوازية في torch
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            print(f"⚠️  تعذر ضبط num_interop_threads: {e}")
+
+
+def _int8_cache_key(model_name: str, config) -> str:
+    """بصمة النموذج المُكمَّم: الاسم والإعدادات وإصدارا torch وtransformers، وملفات الأوزان لمجلد محلي
+    
+    النموذج المحلي قد يُعاد تدريبه بنفس الاسم والإعدادات، فحجم ملفات أوزانه ووقت تعديلها جزء من البصمة.
+    """
+    import transformers
+    
+    parts = [model_name, config.to_json_string(use_diff=False), torch.__version__, transformers.__version__]
+    if os.path.isdir(model_name):
+        for name in sorted(os.listdir(model_name)):
+            if name.endswith((".safetensors", ".bin")):
+                stat = os.stat(os.path.join(model_name, name))
+                parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.md5("\n".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _int8_checkpoint(model, key: str) -> dict:
+    """أوزان النموذج المُكمَّم كموترات عادية (قيم int8 + المقياس) حتى تُحمّل بـ weights_only"""
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+    
+    linear = {}
+    for name, module in model.named_modules():
+        if isinstance(module, DynamicLinear):
+            weight, bias = module._weight_bias()
+            if weight.qscheme() not in (torch.per_tensor_affine, torch.per_tensor_symmetric):
+                raise ValueError(f"qscheme غير مدعوم: {weight.qscheme()}")
+            linear[name] = (weight.int_repr(), weight.q_scale(), weight.q_zero_point(), bias)
+    
+    # باقي المعاملات وكل الـ buffers (بما فيها غير المحفوظة في state_dict مثل inv_freq)
+    tensors = dict(model.named_parameters())
+    tensors.update(model.named_buffers())
+    return {"key": key, "linear": linear, "tensors": tensors}
+
+
+def _swap_linear_for_int8(module):
+    """استبدال nn.Linear بطبقات int8 ديناميكية فارغة (نفس بنية quantize_dynamic بدون حساب)"""
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+    
+    for name, child in module.named_children():
+        if type(child) is torch.nn.Linear:
+            setattr(module, name, DynamicLinear(
+                child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+            ))
+        else:
+            _swap_linear_for_int8(child)
+
+
+def _load_int8_model(model_name: str, cache_path: str, config, key: str):
+    """بناء هيكل النموذج بدون أوزان ثم تحميل الأوزان المُكمَّمة المحفوظة (بعد التحقق من بصمتها)"""
+    from transformers import GenerationConfig
+    
+    saved = torch.load(cache_path, weights_only=True, mmap=True)
+    if saved.get("key") != key:
+        raise ValueError("الملف المُكمَّم لنموذج أو إعدادات أخرى")
+    
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config).float()
+    _swap_linear_for_int8(model)
+    model = model.to_empty(device="cpu")
+    
+    targets = dict(model.named_parameters())
+    targets.update(model.named_buffers())
+    if set(targets) != set(saved["tensors"]):
+        raise ValueError("الملف لا يطابق بنية النموذج")
+    
+    with torch.no_grad():
+        for name, tensor in saved["tensors"].items():
+            targets[name].copy_(tensor)
+    for name, (int_repr, scale, zero_point, bias) in saved["linear"].items():
+        weight = torch._make_per_tensor_quantized_tensor(int_repr, scale, zero_point)
+        model.get_submodule(name).set_weight_bias(weight, bias)
+    
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(model_name)
+    except OSError:
+        pass
+    return model
+
+
+def load_shared_weights(model_name: str, cpu: dict = None) -> dict:
+    """تحميل أوزان النموذج مرة واحدة في ذاكرة مشتركة (share_memory) لتستخدمها عدة عمليات بدون نسخ
+    
+    يعيد {الاسم: tensor} لكل المعاملات والـ buffers، والأوزان المربوطة (مثل lm_head)
+    تظهر بكل أسمائها فتشير إلى نفس الذاكرة بعد إعادة البناء.
+    """
+    dtype = _resolve_cpu_dtype((cpu or {}).get("dtype", "auto"))
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=dtype,
+        device_map="cpu",
+        low_cpu_mem_usage=True
+    )
+    model.share_memory()
+    tensors = dict(model.named_parameters(remove_duplicate=False))
+    tensors.update(model.named_buffers(remove_duplicate=False))
+    return {name: tensor.detach() for name, tensor in tensors.items()}
+
+
+def _model_from_shared_weights(model_name: str, weights: dict):
+    """بناء النموذج على meta ثم ربط معاملاته بالأوزان المشتركة بدلاً من تخصيص نسخة جديدة"""
+    from transformers import AutoConfig, GenerationConfig
+    
+    config = AutoConfig.from_pretrained(model_name)
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config)
+    
+    for name, tensor in weights.items():
+        module_name, _, attr = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[attr] = tensor
+    
+    missing = [name for name, tensor in model.state_dict(keep_vars=True).items() if tensor.is_meta]
+    if missing:
+        raise ValueError(f"أوزان ناقصة في الذاكرة المشتركة: {missing[:5]}")
+    
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(model_name)
+    except OSError:
+        pass
+    return model
+
+
+class _ReplyStreamer(TextStreamer):
+    """يمرر النص المفكوك أولاً بأول ولا يمرر بداية أي دور جديد يكتبه النموذج
+
+    الفك يُبقي الرموز الخاصة حتى تُطابق علامات الأدوار التي تبدأ برمز خاص
+    (مثل <|im_start|>user)، ثم تُحذف من النص قبل تمريره.
+    """
+    
+    def __init__(self, tokenizer, on_text, stop_markers: tuple):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=False)
+        self.on_text = on_text
+        self.stop_markers = stop_markers
+        self.special = re.compile("|".join(
+            map(re.escape, sorted(tokenizer.all_special_tokens, key=len, reverse=True))
+        ))
+        self.pending = ""
+        self.stopped = False
+        self.emitted = False
+        self.parts = []
+        self.tokens_generated = 0
+    
+    def put(self, value):
+        # أول استدعاء يحمل رموز الـ prompt
+        if not self.next_tokens_are_prompt:
+            self.tokens_generated += value.numel()
+        super().put(value)
+    
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if self.stopped:
+            return
+        self.pending += text
+        
+        marker_pos = min(
+            (pos for pos in map(self.pending.find, self.stop_markers) if pos >= 0), default=-1
+        )
+        if marker_pos >= 0:
+            # النموذج بدأ يكتب دورًا جديدًا: نكتفي بما قبله
+            self.stopped = True
+            self._emit(self.pending[:marker_pos])
+            self.pending = ""
+        elif stream_end:
+            self._emit(self.pending)
+            self.pending = ""
+        else:
+            # الاحتفاظ بذيل قد يكون بداية علامة، بدون قطع رمز خاص في منتصفه
+            cut = len(self.pending) - (max(map(len, self.stop_markers)) - 1)
+            for match in self.special.finditer(self.pending):
+                if match.start() < cut < match.end():
+                    cut = match.start()
+            if cut > 0:
+                self._emit(self.pending[:cut])
+                self.pending = self.pending[cut:]
+    
+    @property
+    def text(self) -> str:
+        """الرد كاملاً كما مُرر إلى on_text"""
+        return "".join(self.parts).strip()
+    
+    def emit_fallback(self, text: str):
+        """تمرير رد بديل عند فشل التوليد قبل أي نص"""
+        self._emit(text)
+    
+    def _emit(self, text: str):
+        text = self.special.sub("", text)
+        if text:
+            self.emitted = True
+            self.parts.append(text)
+            self.on_text(text)
+
+
+class _GenerationTimer(LogitsProcessor):
+    """يسجل وقت أول خطوة فك (نهاية الـ prefill) وعدد خطوات الفك دون تعديل الاحتمالات"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_step = None
+        self.steps = 0
+    
+    def __call__(self, input_ids, scores):
+        if self.first_step is None:
+            self.first_step = time.perf_counter()
+        self.steps += 1
+        return scores
+    
+    def observe(self, batch_size: int, tokens_generated: int):
+        """إضافة زمن الـ prefill وسرعة الفك إلى المقاييس"""
+        _BATCH_SIZE.observe(batch_size)
+        _TOKENS.inc(tokens_generated)
+        if self.first_step is None:
+            return
+        _PREFILL.observe(self.first_step - self.started)
+        decode_seconds = time.perf_counter() - self.first_step
+        if self.steps > 1 and decode_seconds > 0:
+            _DECODE_RATE.observe((self.steps - 1) / decode_seconds)
+
+
+class _IncrementalText:
+    """نص رد واحد يُفك ترميزه تدريجيًا: كل خطوة تفك نافذة صغيرة من آخر الرموز فقط
+    
+    النافذة تبدأ من آخر رموز فُك ترميزها بنجاح، والنص الذي ينتهي بـ \ufffd (حرف
+    لم تكتمل بايتاته بعد) يُؤجل حتى يكتمل. عدد الجمل يُحسب مرة لكل نهاية جملة
+    مؤكدة، فلا يُعاد فحص إلا ذيل علامات الترقيم الأخير.
+    """
+    
+    _PUNCTUATION = ".!?؟…"
+    
+    def __init__(self):
+        self.ids = []
+        self.text = ""
+        self._prefix_offset = 0
+        self._read_offset = 0
+        # نهايات الجمل المؤكدة (تليها مسافة) قبل الموضع _scanned من النص
+        self._sentences = 0
+        self._scanned = 0
+    
+    def extend(self, tokenizer, new_ids: list) -> str:
+        """إضافة رموز جديدة وإرجاع النص الذي أضافته (قد يكون فارغًا)"""
+        self.ids.extend(new_ids)
+        window = self.ids[self._prefix_offset:]
+        prefix = tokenizer.decode(window[:self._read_offset - self._prefix_offset], skip_special_tokens=False)
+        text = tokenizer.decode(window, skip_special_tokens=False)
+        if len(text) <= len(prefix) or text.endswith("\ufffd"):
+            return ""
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.ids)
+        delta = text[len(prefix):]
+        self.text += delta
+        return delta
+    
+    def sentences(self) -> int:
+        """عدد الجمل كما يحسبه _SENTENCE_END على النص كله"""
+        pending = 0
+        for match in _SENTENCE_END.finditer(self.text, self._scanned):
+            if match.end() < len(self.text):
+                self._sentences += 1
+            else:
+                # نهاية جملة في آخر النص قد تمتد بالرمز التالي ("." ثم "..")
+                pending = 1
+        self._scanned = len(self.text.rstrip(self._PUNCTUATION))
+        return self._sentences + pending
+
+
+class _ReplyStoppingCriteria(StoppingCriteria):
+    """إيقاف كل تسلسل في الدفعة وحده عند اكتمال رده
+    
+    الرد يكتمل برمز النهاية (eos)، أو ببداية دور جديد يكتبه النموذج، أو ببلوغ حد الجمل
+    أو الرموز الخاص بلهجة الطلب. التسلسلات المتوقفة تُملأ بالـ padding حتى تنتهي البقية.
+    نص كل رد يُفك ترميزه تدريجيًا (_IncrementalText) فتكلفة كل خطوة لا تكبر مع طول الرد.
+    """
+    
+    def __init__(self, tokenizer, prompt_length: int, limits: list, stop_markers: tuple, eos_ids: set):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.limits = limits
+        self.stop_markers = stop_markers
+        # علامة قد تبدأ في نص خطوة سابقة وتكتمل في الخطوة الحالية
+        self._marker_overlap = max(map(len, stop_markers), default=1) - 1
+        self.eos_ids = eos_ids
+        self.texts = [_IncrementalText() for _ in limits]
+        self.reasons = [None] * len(limits)
+        # عدد رموز كل رد عند توقفه (ما بعده padding وليس من الرد)
+        self.lengths = [None] * len(limits)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        new_tokens = input_ids.shape[-1] - self.prompt_length
+        for row, (max_tokens, max_sentences) in enumerate(self.limits):
+            if self.reasons[row] is None:
+                self.reasons[row] = self._check(row, input_ids[row], new_tokens, max_tokens, max_sentences)
+                if self.reasons[row] is not None:
+                    self.lengths[row] = new_tokens
+        return torch.tensor(
+            [reason is not None for reason in self.reasons], dtype=torch.bool, device=input_ids.device
+        )
+    
+    def _check(self, row: int, sequence, new_tokens: int, max_tokens: int, max_sentences: int):
+        """سبب توقف التسلسل أو None إن لم يكتمل بعد"""
+        reply = self.texts[row]
+        # التوليد التخميني قد يضيف أكثر من رمز في الخطوة الواحدة
+        new_ids = sequence[self.prompt_length + len(reply.ids):].tolist()
+        if any(token in self.eos_ids for token in new_ids):
+            return "eos"
+        delta = reply.extend(self.tokenizer, new_ids)
+        if delta:
+            tail = reply.text[-(len(delta) + self._marker_overlap):]
+            if any(marker in tail for marker in self.stop_markers):
+                return "turn_marker"
+            if max_sentences and reply.sentences() >= max_sentences:
+                return "sentences"
+        if new_tokens >= max_tokens:
+            return "max_tokens"
+        return None
+    
+    def observe(self):
+        """إضافة أسباب التوقف إلى المقاييس"""
+        for reason in self.reasons:
+            _STOPS[reason or "max_tokens"].inc()
+
+
+class _ForwardCounter:
+    """يعد تمريرات forward لنموذج أثناء توليد واحد"""
+    
+    def __init__(self, model):
+        self.calls = 0
+        self._handle = model.register_forward_hook(self._count)
+    
+    def _count(self, module, args, output):
+        self.calls += 1
+    
+    def close(self):
+        self._handle.remove()
+
+
+class _SpeculationStats:
+    """نسبة قبول رموز المسودة (متوسط متحرك) وقرار الرجوع إلى التوليد العادي عند ضعفها
+    
+    مع قبول ضعيف يصبح التوليد التخميني أبطأ من العادي (تمريرات مسودة بلا فائدة)،
+    فيتوقف ويُجرَّب من جديد مرة كل probe_every طلب.
+    """
+    
+    def __init__(self, min_acceptance: float = 0.3, probe_every: int = 50, smoothing: float = 0.2):
+        self.min_acceptance = min_acceptance
+        self.probe_every = max(probe_every, 1)
+        self.smoothing = smoothing
+        self.acceptance = None
+        self._skipped = 0
+    
+    def enabled(self) -> bool:
+        """هل يُستخدم نموذج المسودة في التوليد القادم"""
+        if self.acceptance is None or self.acceptance >= self.min_acceptance:
+            return True
+        self._skipped += 1
+        if self._skipped >= self.probe_every:
+            # تجربة جديدة يحكم عليها قبولها وحده
+            self._skipped = 0
+            self.acceptance = None
+            return True
+        return False
+    
+    def observe(self, drafted: int, accepted: int):
+        """تحديث نسبة القبول بعد توليد تخميني"""
+        if drafted <= 0:
+            return
+        accepted = min(max(accepted, 0), drafted)
+        rate = accepted / drafted
+        _DRAFT_TOKENS["accepted"].inc(accepted)
+        _DRAFT_TOKENS["rejected"].inc(drafted - accepted)
+        _ACCEPTANCE.observe(rate)
+        if self.acceptance is None:
+            self.acceptance = rate
+        else:
+            self.acceptance += self.smoothing * (rate - self.acceptance)
+
+
 class ArabicChatModel:
-    def __init__(self, model_name="Qwen/Qwen2.5-1.5B-Instruct"):
+    def __init__(self, model_name: str = None, use_prefix_cache=True, config: dict = None,
+                 shared_weights: dict = None):
         """
-        استخدام نموذج أصغر (1.5B) لأداء أفضل وتوافق أوسع
+        تحميل النموذج حسب قسم model في config.yaml (الافتراضي نموذج 1.5B لأداء أفضل وتوافق أوسع)
+        
+        shared_weights: أوزان من load_shared_weights (في عمال model_server) تُستخدم بدلاً من التحميل
         """
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.config = config or {}
+        model_name = model_name or self.config.get("base_model", DEFAULT_MODEL)
+        self.max_new_tokens = self.config.get("max_tokens", 150)
+        self.temperature = self.config.get("temperature", 0.7)
+        # ميزانية رموز المحادثة السابقة ورسالة المستخدم (بعد تعليمات اللهجة)
+        self.history_tokens = self.config.get("history_tokens", 512)
+        use_quantization = self.config.get("use_quantization", False)
+        
+        self.device = "cpu" if shared_weights is not None else _resolve_device(self.config.get("device", "auto"))
         print(f"✅ جارٍ تحميل النموذج على جهاز: {self.device}")
         
         try:
@@ -17,15 +484,11 @@ class ArabicChatModel:
                 trust_remote_code=True
             )
             
-            # إذا لم يكن هناك GPU أو الذاكرة محدودة، استخدم التحميل بالـ CPU
-            if self.device == "cpu" or not torch.cuda.is_available():
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    model_name,
-                    torch_dtype=torch.float32,
-                    device_map="cpu",
-                    low_cpu_mem_usage=True
+            if self.device == "cpu":
+                self.model = self._load_cpu_model(
+                    model_name, self.config.get("cpu") or {}, shared_weights
                 )
-            else:
+            elif use_quantization:
                 # استخدم quantization لتقليل حجم الذاكرة
                 from transformers import BitsAndBytesConfig
                 
@@ -42,21 +505,42 @@ class ArabicChatModel:
                     device_map="auto",
                     trust_remote_code=True
                 )
+            else:
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_name,
+                    torch_dtype=torch.float16,
+                    device_map="auto",
+                    trust_remote_code=True
+                )
             
-            # إنشاء pipeline للتفاعل
-            self.chat_pipeline = pipeline(
-                "text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                device=0 if self.device == "cuda" else -1
-            )
+            # التوليد بالدفعات يحتاج padding من اليسار ورمز padding معرّف
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            self.tokenizer.padding_side = "left"
             
             print("✅ تم تحميل النموذج بنجاح!")
             
         except Exception as e:
             print(f"❌ خطأ في تحميل النموذج: {e}")
+            if shared_weights is not None:
+                # عامل بنموذج مختلف عن بقية العمال أسوأ من عامل متوقف
+                raise
             # استخدام نموذج بدائي كبديل
             self.load_fallback_model()
+        
+        self._init_chat_format()
+        
+        # نموذج مسودة صغير للتوليد التخميني (اختياري)
+        self.draft_model = None
+        self.speculation = None
+        speculative = self.config.get("speculative") or {}
+        if speculative.get("draft_model"):
+            self._load_draft_model(speculative)
+        
+        # حالة تعليمات اللهجة المحسوبة مسبقًا حتى لا يُعاد ترميزها مع كل رسالة
+        self.prefix_cache = (
+            PrefixCache(self.model, self.tokenizer, self.model.device) if use_prefix_cache else None
+        )
     
     def load_fallback_model(self):
         """تحميل نموذج بسيط كبديل في حالة الفشل"""
@@ -71,56 +555,394 @@ class ArabicChatModel:
         
         # إعداد padding token
         self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
     
-    def generate_response(self, text: str, dialect: str, history: list = None) -> str:
-        """إنشاء رد مع مراعاة اللهجة"""
+    def _load_cpu_model(self, model_name: str, cpu: dict, shared_weights: dict = None):
+        """تحميل النموذج لـ CPU: عدد الخيوط، ثم int8 ديناميكي أو bfloat16 أو float32، ثم torch.compile اختياريًا"""
+        _configure_threads(cpu.get("num_threads"), cpu.get("num_interop_threads"))
+        
+        if shared_weights is not None:
+            model = _model_from_shared_weights(model_name, shared_weights)
+        elif cpu.get("dtype") == "int8":
+            model = self._load_quantized_cpu_model(model_name, cpu.get("quantized_cache_dir", "models/quantized"))
+        else:
+            dtype = _resolve_cpu_dtype(cpu.get("dtype", "auto"))
+            print(f"✅ أوزان النموذج على CPU بدقة {dtype}")
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=dtype,
+                device_map="cpu",
+                low_cpu_mem_usage=True
+            )
+        model.eval()
+        
+        if cpu.get("compile", False):
+            try:
+                # خطوة الفك تتكرر مع كل رمز، والأشكال تتغير مع طول السياق
+                model.forward = torch.compile(model.forward, dynamic=True)
+                print("✅ تم تفعيل torch.compile")
+            except Exception as e:
+                print(f"⚠️  تعذر تفعيل torch.compile: {e}")
+        return model
+    
+    def _load_quantized_cpu_model(self, model_name: str, cache_dir: str):
+        """int8 ديناميكي لطبقات Linear، مع حفظ النموذج المُكمَّم على القرص لتفادي تكميمه عند كل تشغيل"""
+        from transformers import AutoConfig
+        
+        config = AutoConfig.from_pretrained(model_name)
+        key = _int8_cache_key(model_name, config)
+        cache_path = os.path.join(cache_dir, "{}-int8-{}.pt".format(re.sub(r"[^\w.-]", "_", model_name.strip("/")), key))
+        if os.path.exists(cache_path):
+            try:
+                model = _load_int8_model(model_name, cache_path, config, key)
+                print(f"✅ تحميل النموذج المُكمَّم من {cache_path}")
+                return model
+            except Exception as e:
+                print(f"⚠️  تعذر تحميل النموذج المُكمَّم، سيُعاد تكميمه: {e}")
+        
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.float32,
+            device_map="cpu",
+            low_cpu_mem_usage=True
+        )
+        print("⚙️  تكميم طبقات Linear إلى int8...")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        
         try:
-            # تحضير السياق
-            history_text = "\n".join(history[-3:]) if history else ""
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            torch.save(_int8_checkpoint(model, key), tmp_path)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"⚠️  تعذر حفظ النموذج المُكمَّم: {e}")
+        return model
+    
+    def _load_draft_model(self, speculative: dict):
+        """تحميل نموذج المسودة بنفس dtype وجهاز النموذج الأساسي (يجب أن يستخدم نفس المرمّز)"""
+        name = speculative["draft_model"]
+        try:
+            draft_tokenizer = AutoTokenizer.from_pretrained(name)
+            if draft_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+                raise ValueError("مرمّز نموذج المسودة يختلف عن مرمّز النموذج الأساسي")
             
-            # إعداد prompt مع اللهجة
-            prompt = self.create_prompt(text, dialect, history_text)
+            draft = AutoModelForCausalLM.from_pretrained(
+                name,
+                torch_dtype=self.model.dtype,
+                low_cpu_mem_usage=True
+            ).to(self.model.device)
+            draft.eval()
+            # عدد الرموز المقترحة في كل جولة (transformers يعدّله حسب القبول)
+            draft.generation_config.num_assistant_tokens = speculative.get("num_draft_tokens", 5)
             
-            # توليد الرد
-            if hasattr(self, 'chat_pipeline'):
-                # استخدام pipeline للنماذج الكبيرة
-                response = self.chat_pipeline(
-                    prompt,
-                    max_new_tokens=150,
-                    temperature=0.7,
-                    do_sample=True,
-                    top_p=0.9,
-                    repetition_penalty=1.1,
-                    pad_token_id=self.tokenizer.eos_token_id
-                )[0]['generated_text']
-            else:
-                # للنماذب البسيطة
-                inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
-                
-                if self.device == "cuda":
-                    inputs = {k: v.cuda() for k, v in inputs.items()}
-                
-                with torch.no_grad():
-                    outputs = self.model.generate(
-                        **inputs,
-                        max_new_tokens=150,
-                        temperature=0.7,
-                        do_sample=True,
-                        pad_token_id=self.tokenizer.eos_token_id
-                    )
-                
-                response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            self.draft_model = draft
+            self.speculation = _SpeculationStats(
+                min_acceptance=speculative.get("min_acceptance", 0.3),
+                probe_every=speculative.get("probe_every", 50)
+            )
+            print(f"✅ التوليد التخميني مفعّل بنموذج المسودة {name}")
+        except Exception as e:
+            print(f"⚠️  تعذر تحميل نموذج المسودة، التوليد بدون تخمين: {e}")
+    
+    def _generate_single(self, stopping: _ReplyStoppingCriteria, **kwargs):
+        """generate لطلب منفرد: تخميني بنموذج المسودة عندما يكون مفعّلاً ونسبة القبول جيدة
+        
+        مع do_sample يطبق transformers عينة التخمين (rejection sampling) فيبقى توزيع
+        الرد مطابقًا للتوليد العادي. التوليد التخميني يدعم دفعة من طلب واحد فقط.
+        """
+        if self.draft_model is None or not self.speculation.enabled():
+            return self.model.generate(**kwargs)
+        
+        main, draft = _ForwardCounter(self.model), _ForwardCounter(self.draft_model)
+        try:
+            outputs = self.model.generate(assistant_model=self.draft_model, **kwargs)
+        finally:
+            main.close()
+            draft.close()
+        
+        # كل تمريرة للنموذج الأساسي تضيف رمزًا واحدًا منه، وما زاد عليها رموز مسودة مقبولة
+        generated = stopping.lengths[0] or outputs.shape[-1] - stopping.prompt_length
+        self.speculation.observe(drafted=draft.calls, accepted=generated - main.calls)
+        return outputs
+    
+    def _sampling_kwargs(self, max_new_tokens: int = None) -> dict:
+        """إعدادات التوليد المشتركة من config.yaml"""
+        return {
+            "max_new_tokens": max_new_tokens or self.max_new_tokens,
+            "temperature": self.temperature,
+            "do_sample": True,
+            "top_p": 0.9,
+            "repetition_penalty": 1.1,
+            "pad_token_id": self.tokenizer.eos_token_id
+        }
+    
+    def generate_response(self, text: str, dialect: str, history: list = None) -> str:
+        """إنشاء رد مع مراعاة اللهجة"""
+        return self.generate_batch([GenerationRequest(text, dialect, history or [])])[0].text
+    
+    def generate_batch(self, requests: list) -> list:
+        """إنشاء ردود (GenerationResult) لعدة طلبات في استدعاء generate واحد"""
+        try:
+            with PROFILER.profile("generate_batch"):
+                return self._generate_batch(requests)
+        except Exception as e:
+            print(f"❌ خطأ في توليد الرد: {e}")
+            return [GenerationResult(self.get_fallback_response(r.dialect)) for r in requests]
+    
+    def _generate_batch(self, requests: list) -> list:
+        # طلب منفرد: مسار _generate_single (التوليد التخميني يدعم طلبًا واحدًا فقط)
+        if len(requests) == 1 and self.prefix_cache is not None:
+            return [self._generate_with_prefix(requests[0])]
+        
+        # تجميع رموز كل طلب من الأدوار المحفوظة
+        with Span(_STAGES["prompt"]):
+            bodies, all_turn_ids = [], []
+            for request in requests:
+                body_ids, turn_ids = self.build_input_ids(request)
+                bodies.append(body_ids)
+                all_turn_ids.append(turn_ids)
+        
+        with Span(_STAGES["tokenize"]):
+            input_ids, attention_mask, past_key_values = self._prefill_inputs(
+                [request.dialect for request in requests], bodies
+            )
+        width = input_ids.shape[-1]
+        
+        stopping = self._stopping_criteria(requests, width)
+        timer = _GenerationTimer()
+        with Span(_STAGES["generate"]), torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                stopping_criteria=StoppingCriteriaList([stopping]),
+                logits_processor=LogitsProcessorList([timer]),
+                **self._sampling_kwargs(max(limit[0] for limit in stopping.limits))
+            )
+        
+        # استخراج الرد فقط
+        with Span(_STAGES["extract"]):
+            results = [
+                self._make_result(new_ids[:length], turn_ids)
+                for new_ids, length, turn_ids in zip(outputs[:, width:].tolist(), stopping.lengths, all_turn_ids)
+            ]
+        
+        timer.observe(len(requests), sum(r.tokens_generated for r in results))
+        stopping.observe()
+        return results
+    
+    def stream_response(self, request: GenerationRequest, on_text) -> GenerationResult:
+        """توليد رد لطلب واحد مع تمرير النص إلى on_text أثناء فك الرموز"""
+        streamer = _ReplyStreamer(self.tokenizer, on_text, self._stop_markers)
+        turn_ids = None
+        try:
+            body_ids, turn_ids = self.build_input_ids(request)
+            input_ids, attention_mask, past_key_values = self._prefill_inputs([request.dialect], [body_ids])
+            stopping = self._stopping_criteria([request], input_ids.shape[-1])
             
-            # استخراج الرد فقط
-            response = self.extract_response(response, prompt)
-            return response
+            timer = _GenerationTimer()
+            with Span(_STAGES["generate"]), torch.no_grad():
+                self._generate_single(
+                    stopping,
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    past_key_values=past_key_values,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([stopping]),
+                    logits_processor=LogitsProcessorList([timer]),
+                    **self._sampling_kwargs(stopping.limits[0][0])
+                )
+            timer.observe(1, streamer.tokens_generated)
+            stopping.observe()
             
         except Exception as e:
             print(f"❌ خطأ في توليد الرد: {e}")
-            return self.get_fallback_response(dialect)
+            if not streamer.emitted:
+                streamer.emit_fallback(self.get_fallback_response(request.dialect))
+        
+        return GenerationResult(
+            streamer.text, streamer.tokens_generated, turn_ids, self.tokenizer_tag, self._reply_ids(streamer.text)
+        )
+    
+    def _generate_with_prefix(self, request: GenerationRequest) -> GenerationResult:
+        """توليد رد لطلب واحد بدءًا من past_key_values المحفوظة لتعليمات اللهجة"""
+        with Span(_STAGES["prompt"]):
+            body_ids, turn_ids = self.build_input_ids(request)
+            input_ids, attention_mask, past_key_values = self._prefill_inputs([request.dialect], [body_ids])
+        
+        prompt_length = input_ids.shape[-1]
+        stopping = self._stopping_criteria([request], prompt_length)
+        timer = _GenerationTimer()
+        with Span(_STAGES["generate"]), torch.no_grad():
+            outputs = self._generate_single(
+                stopping,
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                stopping_criteria=StoppingCriteriaList([stopping]),
+                logits_processor=LogitsProcessorList([timer]),
+                **self._sampling_kwargs(stopping.limits[0][0])
+            )
+        
+        with Span(_STAGES["extract"]):
+            new_ids = outputs[0, prompt_length:].tolist()
+            result = self._make_result(new_ids[:stopping.lengths[0]], turn_ids)
+        timer.observe(1, result.tokens_generated)
+        stopping.observe()
+        return result
+    
+    def _prefill_inputs(self, dialects: list, bodies: list):
+        """رموز الدفعة وقناعها، مع حالة التعليمات المحفوظة إن وُجدت ذاكرة الـ prefix
+        
+        التعليمات تُحشى من اليسار حتى أطولها ثم المحادثة حتى أطولها، فتبدأ المحادثة في كل
+        الصفوف من نفس الموضع بعد حالة التعليمات الموسعة للدفعة (لكل صف تعليمات لهجته).
+        المواضع تُحسب من attention_mask فلا يغير الحشو في الوسط شيئًا في الرد.
+        """
+        if self.prefix_cache is None:
+            headers, past_key_values = [self._header_ids(dialect) for dialect in dialects], None
+        else:
+            headers, past_key_values = self.prefix_cache.get_batch(
+                [(dialect, self.render_header(dialect)) for dialect in dialects]
+            )
+        
+        pad = self.tokenizer.pad_token_id
+        header_width, body_width = max(map(len, headers)), max(map(len, bodies))
+        rows, mask = [], []
+        for header, body in zip(headers, bodies):
+            header_padding, body_padding = header_width - len(header), body_width - len(body)
+            rows.append([pad] * header_padding + header + [pad] * body_padding + body)
+            mask.append([0] * header_padding + [1] * len(header) + [0] * body_padding + [1] * len(body))
+        
+        device = self.model.device
+        return torch.tensor(rows, device=device), torch.tensor(mask, device=device), past_key_values
+    
+    def _stopping_criteria(self, requests: list, prompt_length: int) -> _ReplyStoppingCriteria:
+        """معيار إيقاف لكل تسلسل بحدود طلبه"""
+        return _ReplyStoppingCriteria(
+            self.tokenizer, prompt_length, [self.request_limits(r) for r in requests],
+            self._stop_markers, self._eos_ids
+        )
+    
+    def request_limits(self, request: GenerationRequest):
+        """حدود اللهجة، مع حد الرموز الأقل الذي يضعه التحكم في القبول للطلب"""
+        max_tokens, max_sentences = stop_limits(self.config, request.dialect)
+        if request.max_new_tokens:
+            max_tokens = min(max_tokens, request.max_new_tokens)
+        return max_tokens, max_sentences
+    
+    def _make_result(self, new_ids: list, turn_ids: list) -> GenerationResult:
+        """فك رموز الرد وقص بداية أي دور جديد يكتبه النموذج"""
+        text = self.tokenizer.decode(new_ids, skip_special_tokens=False)
+        for marker in self._stop_markers:
+            text = text.split(marker, 1)[0]
+        for token in self.tokenizer.all_special_tokens:
+            text = text.replace(token, "")
+        text = text.strip()
+        return GenerationResult(text, len(new_ids), turn_ids, self.tokenizer_tag, self._reply_ids(text))
+    
+    def _reply_ids(self, text: str) -> list:
+        """رموز دور الرد كما سيظهر في history (بنفس ترميز encode_turn)"""
+        return self._encode(self.render_turn("assistant", text))
     
-    def create_prompt(self, text: str, dialect: str, history: str) -> str:
-        """إنشاء prompt مناسب للهجة"""
+    def _init_chat_format(self):
+        """تجهيز صيغة الأدوار: قالب المحادثة الخاص بالنموذج إن وُجد، وإلا صيغة "المستخدم:/البوت:" """
+        self.chat_template = getattr(self.tokenizer, "chat_template", None)
+        if self.chat_template:
+            # نص قالب فيه رسالة نظام فارغة فقط: ما بعده في أي محادثة هو جزء الأدوار
+            self._template_base = self._apply_template([{"role": "system", "content": ""}])
+            probe = [{"role": "system", "content": ""}, {"role": "user", "content": "."}]
+            self._generation_prompt = self._apply_template(probe, True)[len(self._apply_template(probe)):]
+        else:
+            self._generation_prompt = "البوت:"
+        
+        # بصمة المرمّز والقالب: الرموز المحفوظة مع الأدوار لا تصلح لمرمّز آخر
+        self.tokenizer_tag = hashlib.md5("{}:{}:{}".format(
+            self.tokenizer.name_or_path, len(self.tokenizer), self.chat_template
+        ).encode('utf-8')).hexdigest()[:12]
+        self._generation_prompt_ids = self._encode(self._generation_prompt)
+        self._header_cache = {}
+        self._header_text = {}
+        
+        # بداية أي دور جديد (كما يكتبها القالب) تعني أن الرد اكتمل
+        self._stop_markers = tuple(
+            self.render_turn(role, "\x00").split("\x00", 1)[0].strip() for role in ("user", "assistant")
+        )
+        
+        # قد يعرّف النموذج أكثر من رمز نهاية (مثل <|im_end|> و <|endoftext|>)
+        eos = getattr(self.model.generation_config, "eos_token_id", None)
+        self._eos_ids = set(eos if isinstance(eos, list) else [eos]) | {self.tokenizer.eos_token_id}
+        self._eos_ids.discard(None)
+    
+    def _apply_template(self, messages: list, add_generation_prompt: bool = False) -> str:
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=add_generation_prompt
+        )
+    
+    def _encode(self, text: str) -> list:
+        return self.tokenizer(text, add_special_tokens=False).input_ids
+    
+    def _header_ids(self, dialect: str) -> list:
+        """رموز تعليمات اللهجة (تُرمَّز مرة واحدة لكل لهجة)"""
+        ids = self._header_cache.get(dialect)
+        if ids is None:
+            ids = self._header_cache[dialect] = self.tokenizer(self.render_header(dialect)).input_ids
+        return ids
+    
+    def render_header(self, dialect: str) -> str:
+        """تعليمات اللهجة كرسالة نظام في قالب المحادثة"""
+        header = self._header_text.get(dialect)
+        if header is None:
+            header = self.create_prompt_header(dialect)
+            if self.chat_template:
+                header = self._apply_template([{"role": "system", "content": header.strip()}])
+            self._header_text[dialect] = header
+        return header
+    
+    def render_turn(self, role: str, text: str) -> str:
+        """نص دور واحد كما يظهر داخل المحادثة (يُرمَّز وحده ثم توصل الرموز)"""
+        if self.chat_template:
+            full = self._apply_template([{"role": "system", "content": ""}, {"role": role, "content": text}])
+            if full.startswith(self._template_base):
+                return full[len(self._template_base):]
+        return f"{'المستخدم' if role == 'user' else 'البوت'}: {text}\n"
+    
+    def encode_turn(self, turn: dict) -> list:
+        """رموز الدور: المحفوظة معه إن كانت لنفس المرمّز، وإلا ترميزه الآن"""
+        if turn.get("ids") is not None and turn.get("tok") == self.tokenizer_tag:
+            return turn["ids"]
+        return self._encode(self.render_turn(turn["role"], turn["text"]))
+    
+    def build_input_ids(self, request: GenerationRequest):
+        """رموز ما بعد التعليمات: أحدث الأدوار ضمن history_tokens ثم رسالة المستخدم وبداية رد البوت
+        
+        يُرجع (الرموز، رموز كل دور في history ثم رسالة المستخدم) حتى يحفظها البوت مع الأدوار.
+        الأدوار الأقدم التي لا تتسع لها الميزانية تُحذف كاملة.
+        """
+        user_ids = self._encode(self.render_turn("user", request.text))
+        if len(user_ids) > self.history_tokens:
+            # رسالة أطول من الميزانية وحدها: قص نصها والإبقاء على علامات القالب سليمة
+            overflow = len(user_ids) - self.history_tokens
+            text_ids = self._encode(request.text)
+            text = self.tokenizer.decode(text_ids[:max(len(text_ids) - overflow, 1)])
+            user_ids = self._encode(self.render_turn("user", text))
+        
+        history = [as_turn(item) for item in request.history]
+        turn_ids = [None] * len(history)
+        budget = self.history_tokens - len(user_ids)
+        kept = []
+        for index in range(len(history) - 1, -1, -1):
+            ids = turn_ids[index] = self.encode_turn(history[index])
+            if len(ids) > budget:
+                break
+            budget -= len(ids)
+            kept.append(ids)
+        
+        body = [token for ids in reversed(kept) for token in ids]
+        return body + user_ids + self._generation_prompt_ids, turn_ids + [user_ids]
+    
+    @staticmethod
+    def create_prompt_header(dialect: str) -> str:
+        """الجزء الثابت من الـ prompt لكل لهجة (يُحسب مرة واحدة في PrefixCache)"""
         dialect_instructions = {
             "iraqi": "تحدث باللهجة العراقية العامية. استخدم كلمات مثل: شلونك، اكو، شني، خل، هسه.",
             "khaleeji": "تحدث باللهجة الخليجية. استخدم كلمات مثل: شحوالك، اشوفك، ماجر، عسب.",
@@ -130,36 +952,11 @@ class ArabicChatModel:
         
         instruction = dialect_instructions.get(dialect, dialect_instructions["standard_arabic"])
         
-        prompt = f"""أنت بوت دردشة عربي يتحدث باللهجة {dialect}.
+        return f"""أنت بوت دردشة عربي يتحدث باللهجة {dialect}.
 {instruction}
 
-المحادثة السابقة:
-{history}
-
-المستخدم: {text}
-
-البوت:"""
-        
-        return prompt
-    
-    def extract_response(self, full_text: str, prompt: str) -> str:
-        """استخراج الرد من النص الكامل"""
-        if "البوت:" in full_text:
-            parts = full_text.split("البوت:")
-            return parts[-1].strip()
-        
-        # إذا لم يتم العثور على "البوت:"، احذف الـ prompt
-        if prompt in full_text:
-            return full_text.replace(prompt, "").strip()
-        
-        return full_text.strip()
+"""
     
     def get_fallback_response(self, dialect: str) -> str:
         """رد افتراضي في حالة الخطأ"""
-        responses = {
-            "iraqi": "هلا والله، شلونك؟ شلون اساعدك؟",
-            "khaleeji": "هلا والله، شحوالك؟ شو تحتاج؟",
-            "egyptian": "اهلا، ازيك؟ ممكن اساعدك في ايه؟",
-            "standard_arabic": "مرحباً، كيف يمكنني مساعدتك؟"
-        }
-        return responses.get(dialect, "مرحباً، كيف يمكنني مساعدتك؟")
+        return fallback_response(dialect)
@@ -0,0 +1,10 @@
+# benchmarks/__init__.py
+"""قياس أداء البوت تحت حمل صناعي من عدة مجموعات
+
+التشغيل:
+    python -m benchmarks --backend stub --groups 50 --messages 2000 --rate 200
+"""
+from benchmarks.stub_model import StubChatModel, build_tiny_model
+from benchmarks.workload import Workload, run_benchmark, compare_reports
+
+__all__ = ["StubChatModel", "build_tiny_model", "Workload", "run_benchmark", "compare_reports"]
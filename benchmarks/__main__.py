@@ -0,0 +1,123 @@
+# benchmarks/__main__.py
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from config_loader import load_config, get_section
+from benchmarks.stub_model import StubChatModel, build_tiny_model
+from benchmarks.workload import DEFAULT_MIX, Workload, run_benchmark, compare_reports
+
+
+def parse_mix(value: str) -> dict:
+    """"iraqi=0.5,egyptian=0.5" -> {"iraqi": 0.5, "egyptian": 0.5}"""
+    mix = {}
+    for item in value.split(","):
+        dialect, _, weight = item.partition("=")
+        mix[dialect.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="قياس أداء البوت تحت حمل صناعي")
+    parser.add_argument("--backend", choices=["stub", "tiny", "real"], default="stub",
+                        help="stub: نموذج وهمي، tiny: نموذج صغير عشوائي محلي، real: النموذج الحقيقي")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0.0, help="رسائل في الثانية (0 = دفعة واحدة)")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="مثال: iraqi=0.5,egyptian=0.5")
+    parser.add_argument("--small-talk", type=float, default=0.3, help="نسبة الرسائل القصيرة المتكررة")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stream", action="store_true", help="استخدام stream_message بدل process_message")
+    parser.add_argument("--draft", default=None,
+                        help="نموذج مسودة للتوليد التخميني (اسم أو مسار، أو tiny لمسودة صغيرة بمرمّز --backend tiny)")
+    parser.add_argument("--workers", type=int, default=1, help="عمال النموذج لـ tiny/real (أكثر من 1 = ModelWorkerPool)")
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-per-token-ms", type=float, default=0.0)
+    parser.add_argument("--tiny-path", default=os.path.join(tempfile.gettempdir(), "bot_ai_tiny_model"))
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--workdir", default=None, help="مجلد بيانات التعلم والقياسات (افتراضيًا مجلد مؤقت جديد)")
+    parser.add_argument("--trace-memory", action="store_true", help="قياس ذروة التخصيص بـ tracemalloc (أبطأ)")
+    parser.add_argument("--output", default=None, help="حفظ التقرير في ملف JSON")
+    parser.add_argument("--baseline", default=None, help="تقرير سابق للمقارنة")
+    return parser.parse_args(argv)
+
+
+def create_model(args, model_config: dict):
+    """النموذج حسب الخيار المطلوب (بإعدادات قسم model في config.yaml)"""
+    if args.backend == "stub":
+        return StubChatModel(latency_ms=args.stub_latency_ms, per_token_ms=args.stub_per_token_ms)
+
+    model_name = build_tiny_model(args.tiny_path, seed=args.seed) if args.backend == "tiny" else None
+    if args.draft:
+        draft = args.draft
+        if draft == "tiny":
+            draft = build_tiny_model(args.tiny_path + "-draft", layers=1, seed=args.seed + 1, tokenizer_path=model_name)
+        model_config = dict(model_config, speculative=dict(model_config.get("speculative") or {}, draft_model=draft))
+    if args.workers > 1:
+        from model_server import ModelWorkerPool
+        return ModelWorkerPool(model_name, config=model_config, num_workers=args.workers)
+
+    from arabic_model import ArabicChatModel
+    return ArabicChatModel(model_name, config=model_config)
+
+
+async def run(args) -> dict:
+    config = load_config(args.config)
+    workload = Workload(
+        groups=args.groups,
+        messages=args.messages,
+        rate=args.rate,
+        dialect_mix=args.mix,
+        small_talk_ratio=args.small_talk,
+        seed=args.seed
+    )
+    # رسائل التحميل تذهب إلى stderr حتى يبقى stdout تقرير JSON فقط
+    with contextlib.redirect_stdout(sys.stderr):
+        chat_model = create_model(args, get_section(config, "model"))
+
+        # بيانات التعلم وقاعدة القياسات في مجلد منفصل حتى لا تتأثر النتائج بتشغيلات سابقة
+        if args.workdir:
+            os.makedirs(args.workdir, exist_ok=True)
+        os.chdir(args.workdir or tempfile.mkdtemp(prefix="bot_ai_bench_"))
+        from main import MultiDialectBot
+        logging.getLogger().setLevel(logging.WARNING)
+
+        bot = MultiDialectBot(config, chat_model=chat_model)
+    try:
+        report = await run_benchmark(bot, workload, stream=args.stream, trace_memory=args.trace_memory)
+    finally:
+        await bot.shutdown()
+        if hasattr(chat_model, "close"):
+            chat_model.close()
+    report["backend"] = args.backend
+    report["workers"] = args.workers
+    report["draft"] = args.draft
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # المسارات نسبية لمجلد التشغيل الأصلي قبل الانتقال إلى مجلد العمل
+    args.config = os.path.abspath(args.config)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = asyncio.run(run(args))
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text, file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
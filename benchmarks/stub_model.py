@@ -0,0 +1,119 @@
+# benchmarks/stub_model.py
+import hashlib
+import os
+import random
+import time
+
+from generation_types import GenerationResult, fallback_response
+
+
+class StubChatModel:
+    """نموذج وهمي حتمي بنفس واجهة ArabicChatModel وزمن توليد قابل للضبط
+
+    زمن الدفعة = latency_ms + per_token_ms × عدد الرموز (الدفعة تُحسب مرة واحدة
+    كما في التوليد الحقيقي على GPU)، والنوم يحجب خيط التوليد مثل generate.
+    """
+
+    def __init__(self, latency_ms: float = 50.0, per_token_ms: float = 0.0, reply_tokens: int = 20):
+        self.latency = latency_ms / 1000
+        self.per_token = per_token_ms / 1000
+        self.reply_tokens = reply_tokens
+        self.prefix_cache = None
+        self.calls = 0
+
+    def _reply(self, text: str, dialect: str, tokens: int = None) -> str:
+        """رد ثابت لكل رسالة (نفس المدخل يعطي نفس الرد)"""
+        rng = random.Random(hashlib.md5(f"{dialect}:{text}".encode('utf-8')).digest())
+        words = [self.get_fallback_response(dialect).split()[0]]
+        words += [f"كلمة{rng.randrange(1000)}" for _ in range((tokens or self.reply_tokens) - 1)]
+        return " ".join(words)
+
+    def _tokens(self, request) -> int:
+        """طول الرد بالرموز مع حد الطلب المقصّر"""
+        return min(self.reply_tokens, request.max_new_tokens or self.reply_tokens)
+
+    def generate_response(self, text: str, dialect: str, history: list = None) -> str:
+        return self._reply(text, dialect)
+
+    def generate_batch(self, requests: list) -> list:
+        self.calls += 1
+        tokens = [self._tokens(r) for r in requests]
+        time.sleep(self.latency + self.per_token * max(tokens))
+        return [GenerationResult(self._reply(r.text, r.dialect, n), n) for r, n in zip(requests, tokens)]
+
+    def stream_response(self, request, on_text) -> GenerationResult:
+        time.sleep(self.latency)
+        tokens = self._tokens(request)
+        reply = self._reply(request.text, request.dialect, tokens)
+        for word in reply.split():
+            time.sleep(self.per_token)
+            on_text(word + " ")
+        return GenerationResult(reply, tokens)
+
+    def get_fallback_response(self, dialect: str) -> str:
+        return fallback_response(dialect)
+
+
+def build_tiny_model(path: str, layers: int = 2, hidden_size: int = 64, vocab_size: int = 1000,
+                     seed: int = 0, tokenizer_path: str = None) -> str:
+    """إنشاء نموذج Qwen2 صغير بأوزان عشوائية ومرمّز مُدرب محليًا (بدون إنترنت)
+
+    النموذج لا ينتج كلامًا مفهومًا، لكنه يمر بنفس مسار التوليد الحقيقي
+    (الترميز والـ prefill والفك وقص الرد) بتكلفة صغيرة على CPU.
+    tokenizer_path: نسخ مرمّز نموذج آخر بدل تدريب مرمّز جديد (لنموذج مسودة بنفس المرمّز).
+    """
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    if tokenizer_path is not None:
+        fast = PreTrainedTokenizerFast.from_pretrained(tokenizer_path)
+        fast.save_pretrained(path)
+        return _save_tiny_model(path, fast, layers, hidden_size, seed)
+
+    from arabic_model import ArabicChatModel
+    from benchmarks.workload import Workload
+
+    # نصوص التدريب: تعليمات اللهجات ورسائل من نفس مولد الحمل
+    corpus = [
+        ArabicChatModel.create_prompt_header(dialect)
+        for dialect in ("iraqi", "khaleeji", "egyptian", "standard_arabic")
+    ]
+    corpus += [arrival[1] for arrival in Workload(groups=20, messages=2000, seed=seed).generate()]
+    corpus += ["المحادثة السابقة:", "المستخدم:", "البوت:"]
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<|endoftext|>", "<|im_end|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    ))
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    fast.save_pretrained(path)
+    return _save_tiny_model(path, fast, layers, hidden_size, seed)
+
+
+def _save_tiny_model(path: str, fast, layers: int, hidden_size: int, seed: int) -> str:
+    """حفظ نموذج Qwen2 عشوائي بحجم مفردات المرمّز"""
+    import torch
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=len(fast),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=2048,
+        eos_token_id=fast.eos_token_id,
+        pad_token_id=fast.pad_token_id,
+        tie_word_embeddings=True
+    )
+    Qwen2ForCausalLM(config).save_pretrained(path)
+    return path
@@ -0,0 +1,208 @@
+# benchmarks/workload.py
+import asyncio
+import math
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, field, asdict
+
+from dialects_database import DialectDatabase
+from metrics import REGISTRY
+
+# كلمات فصيحة للهجة التي ليست في قاعدة بيانات اللهجات
+_STANDARD_WORDS = ["كيف", "حالك", "ماذا", "تفعل", "اليوم", "أريد", "أن", "أعرف", "هل", "يوجد",
+                   "لماذا", "الآن", "جيد", "شكرا", "صديقي", "العمل", "الطقس", "غدا"]
+_STANDARD_GREETINGS = ["مرحبا", "السلام عليكم", "أهلا"]
+
+# رسائل عابرة تتكرر كثيرًا في المجموعات (تختبر ذاكرة الردود)
+_SMALL_TALK = {
+    "iraqi": ["شلونك", "هلا شلونكم", "شكو ماكو", "ياهلا"],
+    "khaleeji": ["شحوالك", "هلا والله", "شخبارك", "شلونكم"],
+    "egyptian": ["ازيك", "اهلا عامل ايه", "ازيك يا صاحبي", "تمام"],
+    "standard_arabic": ["مرحبا", "كيف حالك", "السلام عليكم", "صباح الخير"]
+}
+
+DEFAULT_MIX = {"iraqi": 0.3, "khaleeji": 0.25, "egyptian": 0.25, "standard_arabic": 0.2}
+
+
+@dataclass
+class Workload:
+    """حمل صناعي: عدد المجموعات ومعدل الرسائل وتوزيع اللهجات"""
+    groups: int = 20
+    messages: int = 500
+    rate: float = 0.0  # رسائل في الثانية (0 = كل الرسائل دفعة واحدة)
+    dialect_mix: dict = field(default_factory=lambda: dict(DEFAULT_MIX))
+    small_talk_ratio: float = 0.3  # نسبة الرسائل القصيرة المتكررة
+    users_per_group: int = 5
+    seed: int = 0
+
+    def generate(self) -> list:
+        """قائمة (وقت الوصول، النص، المجموعة، المستخدم) حتمية حسب البذرة"""
+        rng = random.Random(self.seed)
+        dialects = list(self.dialect_mix)
+        weights = [self.dialect_mix[d] for d in dialects]
+        group_dialects = [rng.choices(dialects, weights)[0] for _ in range(self.groups)]
+        vocab = _vocabulary()
+
+        arrivals = []
+        at = 0.0
+        for _ in range(self.messages):
+            group = rng.randrange(self.groups)
+            dialect = group_dialects[group]
+            if rng.random() < self.small_talk_ratio:
+                text = rng.choice(_SMALL_TALK[dialect])
+            else:
+                greetings, words = vocab[dialect]
+                parts = [rng.choice(greetings)] if rng.random() < 0.4 else []
+                parts += rng.choices(words, k=rng.randint(3, 12))
+                text = " ".join(parts)
+            if self.rate > 0:
+                # وصول بتوزيع بواسون
+                at += rng.expovariate(self.rate)
+            arrivals.append((at, text, f"group_{group}", f"user_{group}_{rng.randrange(self.users_per_group)}"))
+        return arrivals
+
+
+def _vocabulary() -> dict:
+    """التحيات والكلمات لكل لهجة من قاعدة بيانات اللهجات"""
+    vocab = {}
+    for dialect, data in DialectDatabase().dialects.items():
+        words = list(data["common_words"]) + list(data["common_words"].values())
+        vocab[dialect] = (data["greetings"], words)
+    vocab["standard_arabic"] = (_STANDARD_GREETINGS, _STANDARD_WORDS)
+    return vocab
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    """الشريحة المئوية بطريقة أقرب رتبة"""
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(q * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """حجم تقريبي للكائن مع ما يحتويه (بالبايت)"""
+    seen = set() if seen is None else seen
+    pending = [obj]
+    total = 0
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, type):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            pending.extend(current)
+        if hasattr(current, "__dict__"):
+            pending.append(current.__dict__)
+        for slot in getattr(type(current), "__slots__", ()):
+            if hasattr(current, slot):
+                pending.append(getattr(current, slot))
+    return total
+
+
+def _memory_usage(bot) -> dict:
+    """حجم ذاكرة المجموعات والمتعلمين"""
+    learners = {}
+    for dialect, learner in bot.learners.items():
+        learners[dialect] = {
+            "bytes": deep_sizeof(learner),
+            "patterns": len(learner.learned_patterns["patterns"]),
+            "responses": len(learner.learned_patterns["responses"])
+        }
+    return {
+        "groups": len(bot.group_memories),
+        "group_memories_bytes": deep_sizeof(bot.group_memories),
+        "learners": learners
+    }
+
+
+async def run_benchmark(bot, workload: Workload, stream: bool = False, trace_memory: bool = False) -> dict:
+    """تشغيل الحمل على البوت وإرجاع تقرير قابل للحفظ كـ JSON
+
+    trace_memory يفعّل tracemalloc لقياس ذروة التخصيص، لكنه يبطئ التنفيذ
+    لذلك لا تُقارن أرقام السرعة بين تشغيل به وتشغيل بدونه.
+    """
+    arrivals = workload.generate()
+    latencies = []
+
+    async def send(at: float, text: str, group_id: str, user_id: str):
+        delay = at - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent = time.perf_counter()
+        if stream:
+            async for _ in bot.stream_message(text, group_id, user_id):
+                pass
+        else:
+            await bot.process_message(text, group_id, user_id)
+        latencies.append(time.perf_counter() - sent)
+
+    REGISTRY.reset()
+    memory_before = _memory_usage(bot)
+    if trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(*arrival) for arrival in arrivals))
+    duration = time.perf_counter() - started
+
+    traced_current, traced_peak = None, None
+    if trace_memory:
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    memory_after = _memory_usage(bot)
+
+    latencies.sort()
+    metrics = REGISTRY.snapshot()
+    return {
+        "workload": asdict(workload),
+        "messages": len(latencies),
+        "stream": stream,
+        "duration_seconds": duration,
+        "throughput_per_second": len(latencies) / duration if duration else 0.0,
+        "latency_seconds": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0
+        },
+        "outcomes": metrics.get("bot_messages_total", {}),
+        "admission": metrics.get("bot_admission_total", {}),
+        "stages": metrics.get("bot_stage_seconds", {}),
+        "model_stages": metrics.get("model_stage_seconds", {}),
+        "scheduler": bot.scheduler.get_stats(),
+        "response_caches": {d: c.get_stats() for d, c in bot.response_caches.items()},
+        "memory": {
+            "before": memory_before,
+            "after": memory_after,
+            "allocated_bytes": traced_current,
+            "peak_allocated_bytes": traced_peak
+        }
+    }
+
+
+def compare_reports(baseline: dict, current: dict) -> dict:
+    """نسبة التغير في الأرقام الأساسية مقارنة بتقرير سابق"""
+    def change(old, new):
+        return (new - old) / old if old and new is not None else None
+
+    keys = {
+        "throughput_per_second": lambda r: r["throughput_per_second"],
+        "latency_p50": lambda r: r["latency_seconds"]["p50"],
+        "latency_p95": lambda r: r["latency_seconds"]["p95"],
+        "latency_p99": lambda r: r["latency_seconds"]["p99"],
+        "peak_allocated_bytes": lambda r: r["memory"]["peak_allocated_bytes"]
+    }
+    return {
+        name: {"baseline": get(baseline), "current": get(current), "change": change(get(baseline), get(current))}
+        for name, get in keys.items()
+    }
@@ -0,0 +1,18 @@
+# config_loader.py
+import os
+import yaml
+
+DEFAULT_CONFIG_PATH = "config.yaml"
+
+
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
+    """تحميل إعدادات البوت من ملف YAML"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_section(config: dict, name: str) -> dict:
+    """إرجاع قسم من الإعدادات أو قاموس فارغ إذا لم يكن موجودًا"""
+    return (config or {}).get(name) or {}
@@ -0,0 +1,201 @@
+# dialect_classifier.py
+"""مصنف لهجات إحصائي على n-grams الحروف
+
+الميزات n-grams حروف (2 إلى 4) من النص الموحّد، تُجزّأ بـ crc32 إلى
+متجه ثابت الطول فلا يحتاج المصنف قاموسًا. النموذج انحدار لوجستي متعدد
+الفئات بـ NumPy يُحدَّث تدريجيًا (partial_fit) من رسائل كل لهجة التي
+جمعها AdaptiveLearner، والأوزان تُحفظ float16 في ملف npz مضغوط.
+"""
+import itertools
+import logging
+import os
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from response_cache import normalize_arabic
+
+logger = logging.getLogger(__name__)
+
+
+class HashedCharNgrams:
+    """تحويل النصوص إلى صفوف متفرقة (indptr, indices, data) بطول n_features"""
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range: Tuple[int, int] = (2, 4)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def transform(self, texts: List[str]):
+        """مصفوفة متفرقة بصيغة CSR، وكل صف مُطبّع بطول 1"""
+        indptr = [0]
+        indices = []
+        data = []
+        low, high = self.ngram_range
+        for text in texts:
+            chars = f" {normalize_arabic(text)} "
+            counts = {}
+            for n in range(low, high + 1):
+                for i in range(len(chars) - n + 1):
+                    index = zlib.crc32(chars[i:i + n].encode("utf-8")) % self.n_features
+                    counts[index] = counts.get(index, 0) + 1
+            if counts:
+                values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+                indices.extend(counts)
+                data.append(values / np.sqrt(np.dot(values, values)))
+            indptr.append(len(indices))
+        data = np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+        return np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64), data
+
+
+class DialectClassifier:
+    """انحدار لوجستي متعدد الفئات على ميزات مجزّأة مع تحديث تدريجي
+
+    partial_fit تمرّ مرة واحدة (SGD بدفعات صغيرة) على الأمثلة الجديدة فقط،
+    فيتحسن المصنف كلما جمع المتعلمون رسائل أكثر بدون إعادة التدريب من البداية.
+    """
+
+    def __init__(self, classes: List[str] = (), n_features: int = 2 ** 18,
+                 learning_rate: float = 0.5, l2: float = 1e-6, batch_size: int = 64):
+        self.features = HashedCharNgrams(n_features)
+        self.classes = []
+        self.weights = np.zeros((n_features, 0), dtype=np.float32)
+        self.bias = np.zeros(0, dtype=np.float32)
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.batch_size = max(batch_size, 1)
+        # responses_total لمتعلم كل لهجة عند آخر تدريب منه
+        self.trained = {}
+        self.samples_seen = 0
+        self._add_classes(classes)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.samples_seen > 0
+
+    def _add_classes(self, classes):
+        """إضافة فئات جديدة بأوزان صفرية"""
+        new = [c for c in dict.fromkeys(classes) if c not in self.classes]
+        if not new:
+            return
+        self.classes.extend(new)
+        self.weights = np.hstack([self.weights, np.zeros((self.weights.shape[0], len(new)), dtype=np.float32)])
+        self.bias = np.concatenate([self.bias, np.zeros(len(new), dtype=np.float32)])
+        self._class_index = {c: i for i, c in enumerate(self.classes)}
+
+    def _scores(self, indptr, indices, data) -> np.ndarray:
+        """X·W + b لمصفوفة متفرقة: جمع صفوف الأوزان لكل نص"""
+        rows = len(indptr) - 1
+        contributions = self.weights[indices] * data[:, None]
+        scores = np.zeros((rows, len(self.classes)), dtype=np.float32)
+        nonempty = indptr[:-1] < indptr[1:]
+        if contributions.shape[0]:
+            scores[nonempty] = np.add.reduceat(contributions, indptr[:-1][nonempty], axis=0)
+        return scores + self.bias
+
+    @staticmethod
+    def _softmax(scores: np.ndarray) -> np.ndarray:
+        scores = scores - scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        """احتمال كل لهجة (بترتيب self.classes) لكل نص"""
+        if not self.classes:
+            return np.zeros((len(texts), 0), dtype=np.float32)
+        return self._softmax(self._scores(*self.features.transform(texts)))
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """(اللهجة، الثقة) لكل نص"""
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        return [(self.classes[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def partial_fit(self, texts: List[str], labels: List[str]):
+        """تمرير واحد بدفعات صغيرة على أمثلة جديدة"""
+        if not texts:
+            return
+        self._add_classes(labels)
+        order = np.random.default_rng(self.samples_seen).permutation(len(texts))
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            indptr, indices, data = self.features.transform([texts[i] for i in batch])
+            targets = np.array([self._class_index[labels[i]] for i in batch])
+
+            # تدرج الانحدار اللوجستي: الاحتمال - الهدف لكل نص
+            gradient = self._softmax(self._scores(indptr, indices, data))
+            gradient[np.arange(len(batch)), targets] -= 1
+            gradient /= len(batch)
+
+            rows = np.repeat(np.arange(len(batch)), np.diff(indptr))
+            step = self.learning_rate
+            if self.l2:
+                # تنظيم L2 على الأوزان التي تلمسها الدفعة فقط (تحديث متفرق)
+                touched = np.unique(indices)
+                self.weights[touched] *= 1 - step * self.l2
+            np.add.at(self.weights, indices, -step * data[:, None] * gradient[rows])
+            self.bias -= step * gradient.sum(axis=0)
+        self.samples_seen += len(texts)
+
+    def fit_from_lexicon(self, dialects: Dict[str, dict]):
+        """بداية من كلمات وتحيات معجم اللهجات حتى يعمل المصنف قبل أن يجمع المتعلمون بيانات"""
+        texts, labels = [], []
+        for dialect, data in dialects.items():
+            for word in list(data.get("common_words", {})) + list(data.get("greetings", [])):
+                texts.append(word)
+                labels.append(dialect)
+        self._add_classes(dialects)
+        # عدة تمريرات لأن الأمثلة قليلة
+        for _ in range(5):
+            self.partial_fit(texts, labels)
+
+    def fit_from_learners(self, learners: Dict[str, object]) -> int:
+        """تحديث من الرسائل التي جمعها كل متعلم منذ آخر تحديث؛ ترجع عدد الأمثلة الجديدة"""
+        texts, labels = [], []
+        for dialect, learner in learners.items():
+            responses = learner.learned_patterns["responses"]
+            total = learner.learned_patterns.get("responses_total", len(responses))
+            start = self.trained.get(dialect, 0)
+            if start > total:
+                # المتعلم أضاف ردودًا أقل مما تدربنا عليه (حُذفت بياناته): البدء من جديد لهذه اللهجة
+                start = 0
+            # الردود الجديدة في آخر النافذة، وما خرج منها قبل التدريب لا يمكن استرجاعه
+            new = min(total - start, len(responses))
+            for item in itertools.islice(responses, len(responses) - new, None):
+                if item.get("input"):
+                    texts.append(item["input"])
+                    labels.append(dialect)
+            self.trained[dialect] = total
+        self.partial_fit(texts, labels)
+        return len(texts)
+
+    def save(self, path: str):
+        """حفظ الأوزان float16 في npz مضغوط"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            weights=self.weights.astype(np.float16),
+            bias=self.bias.astype(np.float16),
+            classes=np.array(self.classes),
+            trained_dialects=np.array(list(self.trained)),
+            trained_counts=np.array(list(self.trained.values()), dtype=np.int64),
+            samples_seen=np.array(self.samples_seen, dtype=np.int64)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "DialectClassifier":
+        """تحميل مصنف محفوظ (الأوزان تُحمّل float32 للحساب)"""
+        with np.load(path) as saved:
+            weights = saved["weights"].astype(np.float32)
+            classifier = cls(n_features=weights.shape[0], **kwargs)
+            classifier._add_classes(saved["classes"].tolist())
+            classifier.weights = weights
+            classifier.bias = saved["bias"].astype(np.float32)
+            classifier.trained = dict(zip(saved["trained_dialects"].tolist(), saved["trained_counts"].tolist()))
+            classifier.samples_seen = int(saved["samples_seen"])
+        return classifier
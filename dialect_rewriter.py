@@ -0,0 +1,90 @@
+# dialect_rewriter.py
+import re
+from typing import Dict, Tuple
+
+# كلمة (حروف وأرقام وتشكيل) أو فاصل (مسافات وعلامات ترقيم)
+_WORD_CHARS = r"\w\u064B-\u065F\u0670"
+_TOKEN_RE = re.compile(rf"[{_WORD_CHARS}]+|[^{_WORD_CHARS}]+")
+_WORD_RE = re.compile(rf"[{_WORD_CHARS}]")
+_END = None
+
+
+class DialectRewriter:
+    """إعادة كتابة النص الفصيح بكلمات اللهجة عبر فهرس عكسي مبني مرة واحدة"""
+
+    def __init__(self, common_words: Dict[str, str]):
+        # شجرة العبارات الفصيحة (كلمة بكلمة) -> الكلمة المحلية المقابلة
+        self._trie = {}
+        self.max_phrase_words = 1
+
+        for local_word, std_word in common_words.items():
+            words = std_word.split()
+            if not words:
+                continue
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            # عند تكرار المعنى نحتفظ بأول كلمة محلية كما في المعجم
+            node.setdefault(_END, local_word)
+            self.max_phrase_words = max(self.max_phrase_words, len(words))
+
+    def rewrite(self, text: str) -> str:
+        """استبدال العبارات الفصيحة بمقابلها اللهجي مع الحفاظ على الترقيم والمسافات"""
+        return self._rewrite(_TOKEN_RE.findall(text), final=True)[0]
+
+    def rewrite_partial(self, text: str) -> Tuple[str, str]:
+        """إعادة كتابة نص متدفق: يُرجع الجزء المحسوم والذيل الذي قد يكتمل بنص لاحق"""
+        return self._rewrite(_TOKEN_RE.findall(text), final=False)
+
+    def _rewrite(self, tokens: list, final: bool) -> Tuple[str, str]:
+        """أطول مطابقة من اليسار إلى اليمين؛ كل موضع يفحص عبارة واحدة على الأكثر"""
+        output = []
+        count = len(tokens)
+        i = 0
+
+        while i < count:
+            token = tokens[i]
+            if not _is_word(token):
+                output.append(token)
+                i += 1
+                continue
+
+            node = self._trie
+            j = i
+            best = None
+            undecided = False
+            while True:
+                if not final and j == count - 1:
+                    # الكلمة الأخيرة قد تكون ناقصة
+                    undecided = True
+                    break
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if _END in node:
+                    best = (j, node[_END])
+                if len(node) == (1 if _END in node else 0):
+                    break
+                # العبارة تستمر فقط عبر فاصل من المسافات
+                if j + 2 < count and tokens[j + 1].isspace():
+                    j += 2
+                    continue
+                if not final and (j + 1 == count or (j + 2 == count and tokens[j + 1].isspace())):
+                    undecided = True
+                break
+
+            if undecided:
+                break
+            if best is not None:
+                output.append(best[1])
+                i = best[0] + 1
+            else:
+                output.append(token)
+                i += 1
+
+        return "".join(output), "".join(tokens[i:])
+
+
+def _is_word(token: str) -> bool:
+    """الرموز إما كلمات كاملة أو فواصل كاملة، فيكفي فحص الحرف الأول"""
+    return _WORD_RE.match(token) is not None
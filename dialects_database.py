@@ -1,9 +1,31 @@
 # dialects_database.py
 import json
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from aho_corasick import AhoCorasick
+from dialect_rewriter import DialectRewriter
 
 class DialectDatabase:
-    def __init__(self):
+    # سوابق ملتصقة مسموح بها قبل كلمات اللهجة (مثل "وشلونك")
+    ATTACHED_PREFIXES = ("و", "ف")
+    
+    def __init__(self, fallback_dialect: str = "standard_arabic", classifier=None,
+                 lexicon_weight: float = 0.5, min_confidence: float = 0.5):
+        self.fallback_dialect = fallback_dialect
+        
+        # مصنف n-grams الحروف (DialectClassifier) يكمل المعجم؛ None = المعجم وحده
+        self.classifier = classifier
+        # وزن نقاط المعجم مقابل احتمالات المصنف عند الجمع بينهما
+        self.lexicon_weight = lexicon_weight
+        # بدون كلمات من المعجم: حكم المصنف وحده يُقبل فوق هذه الثقة
+        self.min_confidence = min_confidence
+        
+        # رقم إصدار البيانات: يُزاد عند أي تعديل لإعادة بناء المكشاف
+        self.version = 0
+        self._detector = None
+        self._detector_version = -1
+        self._rewriters = {}
+        
         self.dialects = {
             "iraqi": {
                 "greetings": ["هلا", "شلونك", "ياهلا"],
@@ -37,14 +59,103 @@ class DialectDatabase:
             }
         }
     
+    def add_words(self, dialect: str, words: Dict[str, str]):
+        """إضافة كلمات (لهجية: فصحى) إلى معجم اللهجة"""
+        data = self.dialects.setdefault(dialect, {"greetings": [], "common_words": {}})
+        data.setdefault("common_words", {}).update(words)
+        self.invalidate()
+    
+    def invalidate(self):
+        """إعلام القاعدة بأن بيانات اللهجات تغيرت"""
+        self.version += 1
+    
+    def _get_detector(self) -> AhoCorasick:
+        """بناء أتمتة واحدة لكل علامات اللهجات (تُبنى مرة واحدة لكل إصدار من البيانات)"""
+        if self._detector is None or self._detector_version != self.version:
+            markers = {}
+            for dialect, data in self.dialects.items():
+                for word in list(data.get("common_words", {})) + list(data.get("greetings", [])):
+                    markers.setdefault(word, set()).add(dialect)
+            
+            detector = AhoCorasick()
+            for word, dialects in markers.items():
+                # العبارات متعددة الكلمات أدق من الكلمة المفردة
+                detector.add(word, (tuple(sorted(dialects)), len(word.split())))
+            detector.build()
+            
+            self._detector = detector
+            self._detector_version = self.version
+        return self._detector
+    
+    def get_rewriter(self, dialect: str) -> DialectRewriter:
+        """مُعيد الكتابة الخاص باللهجة (يُبنى مرة واحدة لكل إصدار من البيانات)"""
+        cached = self._rewriters.get(dialect)
+        if cached is None or cached[0] != self.version:
+            common_words = self.dialects.get(dialect, {}).get("common_words", {})
+            cached = (self.version, DialectRewriter(common_words))
+            self._rewriters[dialect] = cached
+        return cached[1]
+    
+    def score_dialects(self, text: str) -> Dict[str, float]:
+        """حساب نقاط كل لهجة في مرور واحد على النص"""
+        scores = {}
+        for _, _, (dialects, weight) in self._get_detector().iter_matches(
+            text, whole_words=True, prefixes=self.ATTACHED_PREFIXES
+        ):
+            for dialect in dialects:
+                scores[dialect] = scores.get(dialect, 0) + weight
+        return scores
+    
+    def detect_dialect_with_confidence(self, text: str) -> Tuple[str, float]:
+        """كشف اللهجة مع درجة ثقة بين 0 و 1"""
+        if self._use_classifier():
+            return self._combine(self.score_dialects(text), self.classifier.predict_proba([text])[0])
+        return self._detect_from_lexicon(self.score_dialects(text))
+    
+    def _use_classifier(self) -> bool:
+        return self.classifier is not None and self.classifier.is_trained
+    
+    def _detect_from_lexicon(self, scores: Dict[str, float]) -> Tuple[str, float]:
+        """الحكم بكلمات المعجم وحدها"""
+        if not scores:
+            return self.fallback_dialect, 0.0
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_dialect, best_score = ranked[0]
+        
+        # التعادل بين لهجتين لا يكفي للحكم
+        if len(ranked) > 1 and ranked[1][1] == best_score:
+            return self.fallback_dialect, 0.0
+        
+        return best_dialect, best_score / sum(scores.values())
+    
     def detect_dialect(self, text: str) -> str:
         """كشف اللهجة من النص"""
-        scores = {}
-        for dialect, data in self.dialects.items():
-            score = 0
-            for word in data["common_words"]:
-                if word in text:
-                    score += 1
-            scores[dialect] = score
+        return self.detect_dialect_with_confidence(text)[0]
+    
+    def _combine(self, scores: Dict[str, float], probabilities) -> Tuple[str, float]:
+        """جمع نقاط المعجم (بعد تطبيعها) مع احتمالات المصنف بوزن lexicon_weight"""
+        classes = self.classifier.classes
+        if not scores:
+            best = int(probabilities.argmax())
+            confidence = float(probabilities[best])
+            if confidence < self.min_confidence:
+                return self.fallback_dialect, 0.0
+            return classes[best], confidence
         
-        return max(scores, key=scores.get)
\ No newline at end of file
+        total = sum(scores.values())
+        combined = {
+            dialect: (1 - self.lexicon_weight) * float(p) for dialect, p in zip(classes, probabilities)
+        }
+        for dialect, score in scores.items():
+            combined[dialect] = combined.get(dialect, 0.0) + self.lexicon_weight * score / total
+        best_dialect = max(combined, key=combined.get)
+        return best_dialect, combined[best_dialect]
+    
+    def detect_many(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """كشف لهجة عدد كبير من النصوص دفعة واحدة (المصنف يحسب كل النصوص في عملية واحدة)"""
+        self._get_detector()
+        if not self._use_classifier():
+            return [self._detect_from_lexicon(self.score_dialects(text)) for text in texts]
+        probabilities = self.classifier.predict_proba(texts)
+        return [self._combine(self.score_dialects(text), row) for text, row in zip(texts, probabilities)]
@@ -0,0 +1,258 @@
+# dispatcher.py
+"""توزيع الرسائل الواردة من المنصات على البوت
+
+كل مجموعة لها طابور متسلسل حتى يبقى ترتيب محادثتها محفوظًا، والمجموعات
+المختلفة تُعالج في نفس الوقت حتى max_concurrency فتمتلئ دفعات المُجدول.
+الرسائل التي تصل إلى مجموعة أسرع مما يُرد عليها تُدمج في رسالة واحدة
+يُولَّد لها رد واحد بدل رد متأخر لكل رسالة.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_MESSAGES = {
+    outcome: REGISTRY.counter("dispatcher_messages_total", "رسائل المنصات حسب مصيرها", outcome=outcome)
+    for outcome in ("received", "answered", "coalesced", "dropped", "send_error")
+}
+_QUEUE_SECONDS = REGISTRY.histogram("dispatcher_queue_seconds", "انتظار الرسالة في طابور مجموعتها قبل معالجتها")
+
+
+@dataclass
+class IncomingMessage:
+    """رسالة واردة من منصة"""
+    group_id: str
+    text: str
+    user_id: str = None
+    # معرف الرسالة في المنصة (للرد عليها)
+    message_id: str = None
+    # المنصة التي وصلت منها الرسالة، ويُرسل الرد عبرها
+    adapter: "PlatformAdapter" = None
+    received_at: float = field(default_factory=time.monotonic)
+
+
+class PlatformAdapter:
+    """واجهة منصة محادثة (Telegram أو Discord أو غيرهما)
+
+    start تستدعي on_message لكل رسالة واردة، وsend ترسل رد البوت إلى المجموعة.
+    """
+
+    name = "platform"
+
+    async def start(self, on_message):
+        raise NotImplementedError
+
+    async def send(self, group_id: str, text: str, reply_to: str = None):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class InMemoryAdapter(PlatformAdapter):
+    """منصة وهمية في الذاكرة للتجارب وقياسات الأداء: receive تُدخل رسالة، والردود تُجمع في sent"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._on_message = None
+        self._next_id = 0
+        self.sent = []
+        self._replied = None
+
+    async def start(self, on_message):
+        self._on_message = on_message
+        self._replied = asyncio.Event()
+
+    async def receive(self, group_id: str, text: str, user_id: str = None) -> str:
+        """محاكاة رسالة واردة؛ ترجع معرفها"""
+        if self._on_message is None:
+            raise RuntimeError("المنصة لم تبدأ بعد")
+        self._next_id += 1
+        message_id = str(self._next_id)
+        await self._on_message(IncomingMessage(group_id, text, user_id, message_id, self))
+        return message_id
+
+    async def send(self, group_id: str, text: str, reply_to: str = None):
+        self.sent.append((group_id, text, reply_to))
+        self._replied.set()
+
+    async def wait_for_replies(self, count: int, timeout: float = None):
+        """انتظار حتى يصل عدد الردود المرسلة إلى count"""
+        async def wait():
+            while len(self.sent) < count:
+                self._replied.clear()
+                await self._replied.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+
+class ConsoleAdapter(PlatformAdapter):
+    """محادثة من الطرفية: كل سطر رسالة في مجموعة واحدة"""
+
+    name = "console"
+
+    def __init__(self, group_id: str = "console", user_id: str = "console_user"):
+        self.group_id = group_id
+        self.user_id = user_id
+        self._stopped = threading.Event()
+
+    async def start(self, on_message):
+        loop = asyncio.get_running_loop()
+
+        def read():
+            # القراءة من stdin تحجب، لذلك في خيط daemon لا يؤخر إيقاف البرنامج
+            for number, line in enumerate(sys.stdin, 1):
+                if self._stopped.is_set():
+                    break
+                if line.strip():
+                    message = IncomingMessage(self.group_id, line.strip(), self.user_id, str(number), self)
+                    asyncio.run_coroutine_threadsafe(on_message(message), loop)
+
+        threading.Thread(target=read, name="console-input", daemon=True).start()
+
+    async def send(self, group_id: str, text: str, reply_to: str = None):
+        print(f"🤖 البوت: {text}")
+
+    async def stop(self):
+        self._stopped.set()
+
+
+# المنصات المعروفة بالاسم المستخدم في bot.platforms
+ADAPTERS = {
+    InMemoryAdapter.name: InMemoryAdapter,
+    ConsoleAdapter.name: ConsoleAdapter
+}
+
+
+class MessageDispatcher:
+    """طابور متسلسل لكل مجموعة ومعالجة متزامنة للمجموعات المختلفة
+
+    max_concurrency: عدد المجموعات التي تُعالج في نفس الوقت (افتراضيًا بقدر ما
+    يخدمه المُجدول معًا: حجم الدفعة × الدفعات المتزامنة).
+    coalesce_window_ms: انتظار قصير بعد أول رسالة لتلحقها بقية الرسائل المتتابعة.
+    max_coalesce: أقصى عدد رسائل تُدمج؛ الأقدم منها يُترك عند التجاوز.
+    """
+
+    def __init__(self, bot, adapters=(), max_concurrency: int = None,
+                 coalesce_window_ms: float = 0, max_coalesce: int = 5):
+        self.bot = bot
+        self.adapters = list(adapters)
+        if max_concurrency is None:
+            scheduler = bot.scheduler
+            max_concurrency = scheduler.max_batch_size * scheduler.max_concurrency
+        self.max_concurrency = max(max_concurrency, 1)
+        self.coalesce_window = max(coalesce_window_ms, 0) / 1000
+        self.max_coalesce = max(max_coalesce, 1)
+
+        self._queues = {}
+        self._workers = {}
+        self._slots = None
+
+        # إحصائيات
+        self.received = 0
+        self.generations = 0
+
+    async def start(self):
+        """بدء استقبال الرسائل من كل المنصات"""
+        # مقاييس الموزع العامل فقط، لا كل موزع أُنشئ في العملية
+        REGISTRY.register_collector("dispatcher", self._collect_metrics)
+        for adapter in self.adapters:
+            await adapter.start(self.dispatch)
+            logger.info("✅ بدأ استقبال الرسائل من %s", adapter.name)
+
+    async def dispatch(self, message: IncomingMessage):
+        """إضافة رسالة إلى طابور مجموعتها (لا تنتظر معالجتها)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.received += 1
+        _MESSAGES["received"].inc()
+
+        queue = self._queues.get(message.group_id)
+        if queue is None:
+            queue = self._queues[message.group_id] = deque()
+        queue.append(message)
+
+        # عامل واحد لكل مجموعة نشطة، وينتهي عندما يفرغ طابورها
+        if message.group_id not in self._workers:
+            self._workers[message.group_id] = asyncio.get_running_loop().create_task(
+                self._serve_group(message.group_id)
+            )
+
+    async def _serve_group(self, group_id: str):
+        """معالجة رسائل المجموعة بالترتيب، رسالة مدمجة واحدة في كل مرة"""
+        queue = self._queues[group_id]
+        try:
+            while queue:
+                if self.coalesce_window:
+                    await asyncio.sleep(self.coalesce_window)
+                async with self._slots:
+                    # كل ما وصل حتى الآن من نفس المنصة يُدمج، ويُنسب الرد لمرسل آخر رسالة
+                    adapter = queue[0].adapter
+                    messages = []
+                    while queue and queue[0].adapter is adapter:
+                        messages.append(queue.popleft())
+                    await self._answer(group_id, messages)
+        finally:
+            # الطابور يبقى إن أُلغي العامل قبل أن يفرغ، وأول رسالة جديدة تبدأ عاملًا آخر
+            del self._workers[group_id]
+            if not queue:
+                del self._queues[group_id]
+
+    async def _answer(self, group_id: str, messages: list):
+        """رد واحد على الرسائل المدمجة"""
+        now = time.monotonic()
+        for message in messages:
+            _QUEUE_SECONDS.observe(now - message.received_at)
+        if len(messages) > self.max_coalesce:
+            _MESSAGES["dropped"].inc(len(messages) - self.max_coalesce)
+            messages = messages[-self.max_coalesce:]
+        if len(messages) > 1:
+            _MESSAGES["coalesced"].inc(len(messages) - 1)
+
+        last = messages[-1]
+        text = "\n".join(message.text for message in messages)
+        self.generations += 1
+        reply = await self.bot.process_message(text, group_id, last.user_id)
+        try:
+            await last.adapter.send(group_id, reply, reply_to=last.message_id)
+            _MESSAGES["answered"].inc(len(messages))
+        except Exception as e:
+            _MESSAGES["send_error"].inc()
+            logger.error("❌ فشل إرسال الرد إلى %s عبر %s: %s", group_id, last.adapter.name, e)
+
+    async def drain(self):
+        """انتظار انتهاء كل الرسائل الموجودة في الطوابير"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def stop(self, timeout: float = 30):
+        """إيقاف المنصات ثم إنهاء ما في الطوابير"""
+        for adapter in self.adapters:
+            await adapter.stop()
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ انتهت مهلة إنهاء الطوابير، %d مجموعة لم تكتمل", len(self._workers))
+            for worker in list(self._workers.values()):
+                worker.cancel()
+        finally:
+            REGISTRY.unregister_collector("dispatcher", self._collect_metrics)
+
+    def _collect_metrics(self) -> list:
+        return [(f"dispatcher_{key}", "إحصائيات توزيع الرسائل", value, {}) for key, value in self.get_stats().items()]
+
+    def get_stats(self) -> dict:
+        """إحصائيات التوزيع"""
+        return {
+            "received": self.received,
+            "generations": self.generations,
+            "active_groups": len(self._workers),
+            "queued": sum(len(queue) for queue in self._queues.values())
+        }
@@ -0,0 +1,55 @@
+# generation_types.py
+"""أنواع طلبات التوليد ونتائجه والردود الافتراضية
+
+وحدة خفيفة بدون torch أو transformers حتى يستوردها البوت والمُجدول
+قبل تحميل النموذج.
+"""
+from dataclasses import dataclass, field
+
+FALLBACK_RESPONSES = {
+    "iraqi": "هلا والله، شلونك؟ شلون اساعدك؟",
+    "khaleeji": "هلا والله، شحوالك؟ شو تحتاج؟",
+    "egyptian": "اهلا، ازيك؟ ممكن اساعدك في ايه؟",
+    "standard_arabic": "مرحباً، كيف يمكنني مساعدتك؟"
+}
+
+
+@dataclass
+class GenerationRequest:
+    """طلب توليد واحد ضمن دفعة"""
+    text: str
+    dialect: str
+    # أدوار المحادثة السابقة (قواميس make_turn من group_memory)
+    history: list = field(default_factory=list)
+    # يحدد العامل الذي يخدم المجموعة عند التشغيل بعدة عمليات
+    group_id: str = None
+    # حد أقل من حد اللهجة لعدد الرموز المولدة (يضعه التحكم في القبول عند الضغط)
+    max_new_tokens: int = None
+    # time.monotonic() الذي يُترك بعده الطلب إن لم يبدأ توليده
+    deadline: float = None
+
+
+@dataclass
+class GenerationResult:
+    """نتيجة توليد: نص الرد وعدد الرموز المولدة"""
+    text: str
+    tokens_generated: int = 0
+    # رموز كل دور في history ثم رسالة المستخدم (None لما لم يُرمَّز) ليحفظها البوت
+    turn_ids: list = None
+    # بصمة المرمّز وقالب المحادثة: الرموز المحفوظة صالحة لنفس البصمة فقط
+    tokenizer_tag: str = None
+    # رموز دور الرد نفسه في المحادثة (لتُحفظ معه ويُحسب في ميزانية الرموز)
+    reply_ids: list = None
+
+
+def stop_limits(model_config: dict, dialect: str):
+    """(أقصى عدد رموز، أقصى عدد جمل) للهجة: قسم model.stopping مع ما يخص اللهجة فيه"""
+    stopping = model_config.get("stopping") or {}
+    limits = {"max_tokens": model_config.get("max_tokens", 150), "max_sentences": stopping.get("max_sentences")}
+    limits.update((stopping.get("dialects") or {}).get(dialect) or {})
+    return limits["max_tokens"], limits["max_sentences"]
+
+
+def fallback_response(dialect: str) -> str:
+    """رد افتراضي للهجة (عند الخطأ أو قبل جاهزية النموذج)"""
+    return FALLBACK_RESPONSES.get(dialect, FALLBACK_RESPONSES["standard_arabic"])
@@ -0,0 +1,298 @@
+# group_memory.py
+import json
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+
+_ROLE_PREFIXES = (("user", "المستخدم: "), ("assistant", "البوت: "))
+
+
+def make_turn(role: str, text: str, ids: list = None, tokenizer_tag: str = None) -> dict:
+    """دور في المحادثة: role (user/assistant) والنص، ورموزه إن رُمِّز مرة (مع بصمة المرمّز)"""
+    turn = {"role": role, "text": text}
+    if ids is not None:
+        turn["ids"] = ids
+        turn["tok"] = tokenizer_tag
+    return turn
+
+
+def as_turn(item) -> dict:
+    """تحويل رسالة محفوظة بالصيغة القديمة ("المستخدم: ..." / "البوت: ...") إلى دور"""
+    if isinstance(item, dict):
+        return item
+    for role, prefix in _ROLE_PREFIXES:
+        if item.startswith(prefix):
+            return make_turn(role, item[len(prefix):])
+    return make_turn("user", item)
+
+
+class GroupMemory:
+    """ذاكرة مجموعة واحدة: اللهجة وآخر الأدوار والمستخدمون ووقت آخر نشاط"""
+
+    __slots__ = ("group_id", "dialect", "history", "users", "last_active", "new_turns")
+
+    def __init__(self, group_id: str, dialect: str, max_history: int,
+                 history=(), users=(), last_active: float = None):
+        self.group_id = group_id
+        self.dialect = dialect
+        # الطول الثابت حد أعلى لعدد الأدوار، والقص الفعلي بعدد الرموز (trim_to_tokens)
+        self.history = deque((as_turn(item) for item in history), maxlen=max_history * 2)
+        self.users = set(users)
+        self.last_active = last_active if last_active is not None else time.time()
+        # الأدوار المضافة منذ آخر حفظ: التخزين المشترك يضيفها فقط ولا يعيد كتابة history كاملة
+        self.new_turns = []
+
+    def add_turn(self, role: str, text: str, ids: list = None,
+                 tokenizer_tag: str = None):
+        turn = make_turn(role, text, ids, tokenizer_tag)
+        self.history.append(turn)
+        self.new_turns.append(turn)
+
+    def cache_token_ids(self, turns: list, turn_ids: list, tokenizer_tag: str):
+        """حفظ رموز أدوار الطلب التي رمّزها النموذج في الأدوار المطابقة (بالدور والنص)
+
+        المطابقة بالنص لا بالموضع لأن رسائل أخرى من نفس المجموعة قد تُضاف أثناء التوليد.
+        """
+        encoded = {
+            (turn["role"], turn["text"]): ids
+            for turn, ids in zip(turns, turn_ids) if ids is not None
+        }
+        for turn in self.history:
+            if turn.get("tok") == tokenizer_tag:
+                continue
+            ids = encoded.get((turn["role"], turn["text"]))
+            if ids is not None:
+                turn["ids"] = ids
+                turn["tok"] = tokenizer_tag
+
+    def trim_to_tokens(self, budget: int):
+        """حذف أقدم الأدوار حتى لا تتجاوز الأدوار المُرمَّزة ميزانية الرموز"""
+        total = 0
+        keep = 0
+        for turn in reversed(self.history):
+            total += len(turn.get("ids") or ())
+            if total > budget:
+                break
+            keep += 1
+        while len(self.history) > keep:
+            self.history.popleft()
+
+
+class GroupMemoryStore:
+    """واجهة تخزين ذاكرة المجموعات (داخل العملية أو مشتركة بين عدة عمليات)"""
+
+    def get(self, group_id: str) -> Optional[GroupMemory]:
+        raise NotImplementedError
+
+    def get_or_create(self, group_id: str, dialect: str) -> GroupMemory:
+        raise NotImplementedError
+
+    def save(self, memory: GroupMemory):
+        """حفظ التغييرات بعد كل تفاعل"""
+        raise NotImplementedError
+
+    def remove(self, group_id: str):
+        raise NotImplementedError
+
+    def expire_inactive(self, max_idle_seconds: float, now: float = None) -> List[str]:
+        """حذف المجموعات غير النشطة وإرجاع معرفاتها"""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, group_id: str):
+        return self.get(group_id) is not None
+
+
+class InProcessGroupStore(GroupMemoryStore):
+    """تخزين داخل العملية بترتيب LRU يفرض الحد الأقصى للمجموعات
+
+    ترتيب القاموس هو ترتيب آخر نشاط، لذلك الانتهاء يفحص البداية فقط
+    ولا يكلف شيئًا لكل رسالة.
+    """
+
+    def __init__(self, max_groups: int = 100, max_history: int = 5,
+                 idle_timeout_seconds: float = None):
+        self.max_groups = max(max_groups, 1)
+        self.max_history = max_history
+        self.idle_timeout = idle_timeout_seconds
+        self._groups = OrderedDict()
+
+        # إحصائيات
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, group_id: str) -> Optional[GroupMemory]:
+        return self._groups.get(group_id)
+
+    def get_or_create(self, group_id: str, dialect: str) -> GroupMemory:
+        now = time.time()
+        if self.idle_timeout is not None:
+            self._expire_front(now - self.idle_timeout)
+
+        memory = self._groups.get(group_id)
+        if memory is None:
+            memory = GroupMemory(group_id, dialect, self.max_history, last_active=now)
+            self._groups[group_id] = memory
+            # إخراج المجموعة الأقل نشاطًا عند تجاوز الحد
+            while len(self._groups) > self.max_groups:
+                self._groups.popitem(last=False)
+                self.evicted += 1
+        else:
+            memory.last_active = now
+            self._groups.move_to_end(group_id)
+        return memory
+
+    def save(self, memory: GroupMemory):
+        memory.last_active = time.time()
+        memory.new_turns.clear()
+        if memory.group_id in self._groups:
+            self._groups.move_to_end(memory.group_id)
+
+    def remove(self, group_id: str):
+        self._groups.pop(group_id, None)
+
+    def expire_inactive(self, max_idle_seconds: float, now: float = None) -> List[str]:
+        now = now if now is not None else time.time()
+        return self._expire_front(now - max_idle_seconds)
+
+    def _expire_front(self, cutoff: float) -> List[str]:
+        expired = []
+        while self._groups:
+            group_id, memory = next(iter(self._groups.items()))
+            if memory.last_active >= cutoff:
+                break
+            del self._groups[group_id]
+            expired.append(group_id)
+        self.expired += len(expired)
+        return expired
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, group_id: str):
+        return group_id in self._groups
+
+    def __iter__(self):
+        return iter(self._groups)
+
+
+class RedisGroupStore(GroupMemoryStore):
+    """تخزين مشترك عبر بروتوكول Redis حتى تتشارك عدة عمليات حالة المجموعات
+
+    يقبل أي عميل بواجهة redis-py (بما في ذلك fakeredis للاختبار).
+    """
+
+    def __init__(self, client, max_groups: int = 100, max_history: int = 5,
+                 idle_timeout_seconds: float = None, prefix: str = "bot:group:"):
+        self.client = client
+        self.max_groups = max(max_groups, 1)
+        self.max_history = max_history
+        self.idle_timeout = idle_timeout_seconds
+        self.prefix = prefix
+        # ترتيب المجموعات حسب آخر نشاط
+        self.index_key = f"{prefix}index"
+
+    def _keys(self, group_id: str):
+        base = f"{self.prefix}{group_id}"
+        return base, f"{base}:history", f"{base}:users"
+
+    def get(self, group_id: str) -> Optional[GroupMemory]:
+        info_key, history_key, users_key = self._keys(group_id)
+        pipe = self.client.pipeline()
+        pipe.hgetall(info_key)
+        pipe.lrange(history_key, 0, -1)
+        pipe.smembers(users_key)
+        info, history, users = pipe.execute()
+        if not info:
+            return None
+
+        info = {_text(k): _text(v) for k, v in info.items()}
+        return GroupMemory(
+            group_id,
+            info["dialect"],
+            self.max_history,
+            history=[json.loads(_text(item)) for item in history],
+            users=[_text(user) for user in users],
+            last_active=float(info["last_active"])
+        )
+
+    def get_or_create(self, group_id: str, dialect: str) -> GroupMemory:
+        if self.idle_timeout is not None:
+            self.expire_inactive(self.idle_timeout)
+
+        memory = self.get(group_id)
+        if memory is None:
+            memory = GroupMemory(group_id, dialect, self.max_history)
+            self.save(memory)
+        return memory
+
+    def save(self, memory: GroupMemory):
+        """إضافة الأدوار الجديدة فقط ثم القص بـ LTRIM داخل MULTI واحد
+
+        عمليات أخرى قد تضيف أدوارًا لنفس المجموعة في نفس الوقت، فلا تُعاد كتابة history
+        من النسخة المحلية. القص بعدد الأدوار فقط (max_history * 2)، وميزانية الرموز
+        يطبقها build_input_ids عند بناء كل prompt.
+        """
+        memory.last_active = time.time()
+        info_key, history_key, users_key = self._keys(memory.group_id)
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(info_key, mapping={"dialect": memory.dialect, "last_active": memory.last_active})
+        if memory.new_turns:
+            pipe.rpush(history_key, *[json.dumps(turn, ensure_ascii=False) for turn in memory.new_turns])
+            pipe.ltrim(history_key, -memory.history.maxlen, -1)
+        if memory.users:
+            pipe.sadd(users_key, *memory.users)
+        pipe.zadd(self.index_key, {memory.group_id: memory.last_active})
+        pipe.zcard(self.index_key)
+        group_count = pipe.execute()[-1]
+        memory.new_turns.clear()
+
+        # إخراج المجموعات الأقل نشاطًا عند تجاوز الحد
+        if group_count > self.max_groups:
+            for group_id, _ in self.client.zpopmin(self.index_key, group_count - self.max_groups):
+                self.client.delete(*self._keys(_text(group_id)))
+
+    def remove(self, group_id: str):
+        self.client.delete(*self._keys(group_id))
+        self.client.zrem(self.index_key, group_id)
+
+    def expire_inactive(self, max_idle_seconds: float, now: float = None) -> List[str]:
+        now = now if now is not None else time.time()
+        cutoff = now - max_idle_seconds
+        expired = [_text(g) for g in self.client.zrangebyscore(self.index_key, "-inf", f"({cutoff}")]
+        if expired:
+            pipe = self.client.pipeline()
+            for group_id in expired:
+                pipe.delete(*self._keys(group_id))
+            pipe.zrem(self.index_key, *expired)
+            pipe.execute()
+        return expired
+
+    def __len__(self):
+        return self.client.zcard(self.index_key)
+
+    def __contains__(self, group_id: str):
+        return self.client.zscore(self.index_key, group_id) is not None
+
+
+def create_group_store(performance: dict, max_history: int = 5) -> GroupMemoryStore:
+    """إنشاء مخزن ذاكرة المجموعات حسب الإعدادات"""
+    max_groups = performance.get("max_groups", 100)
+    idle_hours = performance.get("group_idle_hours")
+    idle_timeout = idle_hours * 3600 if idle_hours else None
+
+    if performance.get("group_store", "memory") == "redis":
+        import redis
+        client = redis.Redis.from_url(performance.get("redis_url", "redis://localhost:6379/0"))
+        return RedisGroupStore(client, max_groups, max_history, idle_timeout)
+
+    return InProcessGroupStore(max_groups, max_history, idle_timeout)
+
+
+def _text(value) -> str:
+    """redis-py يُرجع bytes ما لم يُفعَّل decode_responses"""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
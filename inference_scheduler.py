@@ -0,0 +1,235 @@
+# inference_scheduler.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import DeadlineExceeded, Evicted
+from generation_types import GenerationResult, fallback_response
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceScheduler:
+    """مُجدول استدلال يجمع الطلبات المتزامنة من عدة مجموعات في دفعة توليد واحدة
+
+    لكل مجموعة طابورها، والدفعة تأخذ من المجموعات بالتناوب حتى لا تحجز
+    مجموعة مزدحمة الدفعات كلها عن غيرها.
+    """
+
+    def __init__(self, model, batch_window_ms: float = 20, max_batch_size: int = 8, max_concurrency: int = 1,
+                 admission=None):
+        self.model = model
+        self.batch_window = max(batch_window_ms, 0) / 1000
+        self.max_batch_size = max(max_batch_size, 1)
+        # عدد الدفعات المنفذة في نفس الوقت: 1 لنموذج داخل العملية، وعدد العمال لـ ModelWorkerPool
+        self.max_concurrency = max(max_concurrency, 1)
+
+        # خيط لكل دفعة متزامنة؛ مع خيط واحد لا يُستدعى النموذج من خيطين في نفس الوقت
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="inference")
+        # AdmissionController يتعلم سرعة التوليد من زمن كل دفعة
+        self.admission = admission
+
+        self._loop = None
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._arrived = None
+        self._slots = None
+        # طلبات البث التي تنتظر مكانًا في run_exclusive
+        self._waiting = {}
+        self._worker = None
+        self._inflight = set()
+
+        # إحصائيات
+        self.batches_run = 0
+        self.requests_served = 0
+        self.max_batch_seen = 0
+        self.expired = 0
+
+    def submit(self, request) -> asyncio.Future:
+        """إضافة طلب توليد إلى طابور مجموعته فورًا وإرجاع Future لرده
+
+        إلغاء الـ Future (مثل انتهاء مهلة الانتظار) يُخرج الطلب من الطابور فلا يأخذ مكانًا في دفعة.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        queue = self._queues.get(request.group_id)
+        if queue is None:
+            queue = self._queues[request.group_id] = deque()
+        queue.append((request, future))
+        self._queued += 1
+        self._arrived.set()
+        future.add_done_callback(lambda done: done.cancelled() and self.dequeue(request))
+        return future
+
+    def dequeue(self, request) -> bool:
+        """إخراج طلب لم تأخذه دفعة أو لم يبدأ بثه بعد (Evicted لمن ينتظره)؛ False إن بدأ توليده"""
+        queue = self._queues.get(request.group_id, ())
+        for index, (queued, future) in enumerate(queue):
+            if queued is request:
+                del queue[index]
+                self._queued -= 1
+                if not queue:
+                    del self._queues[request.group_id]
+                if not future.done():
+                    future.set_exception(Evicted())
+                return True
+        waiting = self._waiting.pop(id(request), None)
+        if waiting is not None and not waiting.done():
+            waiting.cancel()
+            return True
+        return False
+
+    def run_exclusive(self, fn, *args, request=None) -> asyncio.Task:
+        """تشغيل دالة (مثل البث) على خيوط التوليد بعد أن يتوفر لها مكان من max_concurrency كالدفعات
+
+        request: يسمح بإخراجه بـ dequeue ما دام ينتظر مكانه (فترفع المهمة Evicted).
+        """
+        self._ensure_started()
+        waiting = self._loop.create_task(self._slots.acquire())
+        if request is not None:
+            self._waiting[id(request)] = waiting
+        return self._loop.create_task(self._run_exclusive(waiting, request, fn, args))
+
+    async def _run_exclusive(self, waiting: asyncio.Task, request, fn, args):
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            if waiting.done() and not waiting.cancelled():
+                # أُلغي الانتظار بعد أن حصل على المكان
+                self._slots.release()
+            if request is not None and not asyncio.current_task().cancelling():
+                # أُخرج بـ dequeue، وليس إلغاءً لمن ينتظر
+                raise Evicted() from None
+            raise
+        finally:
+            if request is not None:
+                self._waiting.pop(id(request), None)
+        try:
+            return await self._loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    def _ensure_started(self):
+        """تشغيل حلقة الجدولة داخل حلقة الأحداث الحالية عند الحاجة"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._arrived = asyncio.Event()
+            # أماكن التوليد تتشاركها الدفعات والبث، فلا تُنشأ من جديد إلا مع حلقة أحداث جديدة
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        """جمع الطلبات خلال نافذة زمنية قصيرة ثم تنفيذها كدفعة واحدة"""
+        while True:
+            while not self._queued:
+                await self._wait_for_arrival(None)
+            # لا تُجمع دفعة جديدة قبل أن يتوفر لها مكان (البث يأخذ من نفس الأماكن)، فتكبر الدفعات عند الضغط
+            await self._slots.acquire()
+            if not self._queued:
+                # خرجت الطلبات (إلغاء أو إخراج) أثناء انتظار المكان
+                self._slots.release()
+                continue
+            batch = [self._take()]
+            deadline = self._loop.time() + self.batch_window
+
+            while len(batch) < self.max_batch_size:
+                # سحب ما هو جاهز في الطوابير بدون انتظار
+                if self._queued:
+                    batch.append(self._take())
+                    continue
+
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    await self._wait_for_arrival(timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            task = self._loop.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._batch_done)
+
+    async def _wait_for_arrival(self, timeout):
+        """انتظار وصول طلب جديد"""
+        self._arrived.clear()
+        await asyncio.wait_for(self._arrived.wait(), timeout)
+
+    def _take(self):
+        """الطلب التالي بالتناوب: أقدم طلب للمجموعة الأولى ثم نقلها إلى آخر الدور"""
+        group_id, queue = self._queues.popitem(last=False)
+        item = queue.popleft()
+        if queue:
+            self._queues[group_id] = queue
+        self._queued -= 1
+        return item
+
+    def _batch_done(self, task):
+        """تحرير مكان الدفعة المنتهية"""
+        self._inflight.discard(task)
+        self._slots.release()
+
+    async def _run_batch(self, batch: list):
+        """تنفيذ دفعة في خيط التوليد وتسليم كل رد لصاحبه"""
+        # الطلب الذي انتهت مهلته في الطابور لا يأخذ مكانًا في الدفعة
+        now = time.monotonic()
+        live = []
+        for request, future in batch:
+            if future.done():
+                continue
+            if request.deadline is not None and request.deadline <= now:
+                future.set_exception(DeadlineExceeded())
+                self.expired += 1
+                continue
+            live.append((request, future))
+        batch = live
+        if not batch:
+            return
+
+        requests = [request for request, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(
+                self._executor, self.model.generate_batch, requests
+            )
+            if self.admission is not None:
+                self.admission.observe(time.perf_counter() - started, max(r.tokens_generated for r in results))
+        except Exception as e:
+            logger.error("❌ فشل توليد الدفعة: %s", e)
+            results = [GenerationResult(fallback_response(r.dialect)) for r in requests]
+
+        self.batches_run += 1
+        self.requests_served += len(requests)
+        self.max_batch_seen = max(self.max_batch_seen, len(requests))
+        logger.debug("دفعة توليد بحجم %d", len(requests))
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """إحصائيات المُجدول"""
+        return {
+            "batches_run": self.batches_run,
+            "requests_served": self.requests_served,
+            "avg_batch_size": self.requests_served / self.batches_run if self.batches_run else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "queued": self._queued,
+            "expired": self.expired
+        }
+
+    async def close(self):
+        """إيقاف حلقة الجدولة وخيط التوليد"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,103 @@
+# learning_store.py
+import os
+import pickle
+import struct
+import zlib
+
+# كل سجل: الطول + CRC32 ثم البيانات (pickle)
+_FRAME_HEADER = struct.Struct("<II")
+
+
+class LearningLog:
+    """تخزين بنمط الإلحاق فقط (append-only) مع لقطة كاملة تُستبدل بشكل ذري"""
+
+    def __init__(self, snapshot_path: str, log_path: str):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+
+    def load(self, repair: bool = True):
+        """تحميل آخر لقطة وسجلات الإلحاق التي كُتبت بعدها
+
+        repair: حذف الذيل الناقص من السجل؛ للكاتب المالك للملف فقط، والقارئ
+        (مثل لوحة التحكم) يمرر False حتى لا يقص سجلًا ما زال الكاتب يُلحق به.
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        return snapshot, self._read_log(repair)
+
+    def _read_log(self, repair: bool = True) -> list:
+        """قراءة السجلات السليمة فقط؛ الذيل الناقص بعد انهيار يُحذف عند repair"""
+        if not os.path.exists(self.log_path):
+            return []
+
+        records = []
+        valid_end = 0
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _FRAME_HEADER.size <= len(data):
+            length, checksum = _FRAME_HEADER.unpack_from(data, offset)
+            start = offset + _FRAME_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            records.append(pickle.loads(payload))
+            offset = start + length
+            valid_end = offset
+
+        if repair and valid_end < len(data):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(valid_end)
+
+        return records
+
+    def append(self, records: list):
+        """إلحاق دفعة من السجلات بكتابة واحدة"""
+        if not records:
+            return
+        frames = []
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            frames.append(_FRAME_HEADER.pack(len(payload), zlib.crc32(payload)))
+            frames.append(payload)
+
+        self._ensure_dir(self.log_path)
+        with open(self.log_path, 'ab') as f:
+            f.write(b"".join(frames))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def write_snapshot(self, state):
+        """كتابة لقطة كاملة في ملف مؤقت ثم استبدالها ذريًا وتفريغ السجل"""
+        self.write_snapshot_bytes(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def write_snapshot_bytes(self, payload: bytes):
+        """مثل write_snapshot لحالة مُسلسلة مسبقًا (pickle)"""
+        self._ensure_dir(self.snapshot_path)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # السجلات أصبحت داخل اللقطة (وتُتجاهل حسب رقمها التسلسلي لو بقيت)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(0)
+
+    def log_size(self) -> int:
+        """حجم سجل الإلحاق بالبايت"""
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _ensure_dir(path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
@@ -1,7 +1,12 @@
 # main.py
 import asyncio
+import itertools
 import logging
+import os
+import random
 import sys
+import threading
+import time
 from datetime import datetime
 
 # إعداد التسجيل
@@ -15,172 +20,588 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# استيراد المكونات
-from arabic_model import ArabicChatModel
+# استيراد المكونات (النموذج وtorch يُستوردان عند التحميل فقط)
+from generation_types import GenerationRequest, fallback_response, stop_limits
+from admission import AdmissionController, DeadlineExceeded, Evicted
+from dispatcher import ADAPTERS, MessageDispatcher
+from dialect_classifier import DialectClassifier
 from dialects_database import DialectDatabase
 from adaptive_learner import AdaptiveLearner
+from inference_scheduler import InferenceScheduler
+from response_cache import ResponseCache
+from group_memory import GroupMemory, create_group_store
+from telemetry import InteractionRecorder
+from config_loader import load_config, get_section
+from metrics import REGISTRY, PROFILER, Span
+
+# مقاييس مراحل معالجة الرسالة
+_STAGES = {
+    stage: REGISTRY.histogram("bot_stage_seconds", "زمن كل مرحلة من معالجة الرسالة", stage=stage)
+    for stage in ("detect_dialect", "group_memory", "cache_lookup", "generate",
+                  "refine", "cache_store", "memory_update", "learn", "total")
+}
+_MESSAGES = {
+    outcome: REGISTRY.counter("bot_messages_total", "عدد الرسائل المعالجة حسب النتيجة", outcome=outcome)
+    for outcome in ("cache_hit", "generated", "fallback", "shed", "error")
+}
+
+
+class LazyLearners(dict):
+    """متعلم لكل لهجة يُحمّل من القرص عند أول استخدام فقط"""
+    
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+    
+    def __missing__(self, dialect: str):
+        learner = self[dialect] = self.factory(dialect)
+        return learner
 
 class MultiDialectBot:
-    def __init__(self):
+    def __init__(self, config: dict = None, chat_model=None):
         logger.info("🚀 جارٍ تهيئة البوت المتعدد اللهجات...")
         
+        self.config = config if config is not None else load_config()
+        performance = get_section(self.config, "performance")
+        model_config = get_section(self.config, "model")
+        
         # تهيئة المكونات
-        self.dialect_db = DialectDatabase()
+        dialects_config = get_section(self.config, "dialects")
+        classifier_config = dialects_config.get("classifier") or {}
+        self.dialect_db = DialectDatabase(
+            fallback_dialect=dialects_config.get("fallback_dialect", "standard_arabic"),
+            lexicon_weight=classifier_config.get("lexicon_weight", 0.5),
+            min_confidence=classifier_config.get("min_confidence", 0.5)
+        )
         logger.info("✅ تم تحميل قاعدة بيانات اللهجات")
         
-        try:
-            self.chat_model = ArabicChatModel()
-            logger.info("✅ تم تحميل النموذج اللغوي")
-        except Exception as e:
-            logger.error(f"❌ فشل تحميل النموذج: {e}")
-            raise
+        # مصنف n-grams يتحسن من رسائل المتعلمين كل retrain_every تفاعل
+        self.classifier_path = classifier_config.get("path", "data/dialect_classifier.npz")
+        self.classifier_retrain_every = classifier_config.get("retrain_every", 200)
+        self._interactions_since_fit = 0
+        if classifier_config.get("enabled", True):
+            self.dialect_db.classifier = self._load_classifier(classifier_config)
         
-        # متعلمون تكيفيون لكل لهجة
-        self.learners = {}
-        for dialect in ["iraqi", "khaleeji", "egyptian", "standard_arabic"]:
-            self.learners[dialect] = AdaptiveLearner(dialect)
+        # عمليات توليد منفصلة تتشارك الأوزان (1 = النموذج داخل هذه العملية)
+        self.model_workers = performance.get("model_workers", 1)
+        self.threads_per_worker = performance.get("threads_per_worker")
         
-        logger.info("✅ تم تهيئة نظام التعلم التكيفي")
+        # التحكم في القبول: مهلة لكل رد وطابور محدود بنصيب عادل لكل مجموعة
+        max_batch_size = performance.get("max_batch_size", 8)
+        max_concurrency = getattr(chat_model, "max_concurrency", None) or self.model_workers
+        self.admission = AdmissionController(
+            timeout_seconds=performance.get("response_timeout_seconds", 10),
+            max_queue=performance.get("max_queue", 256),
+            slots=max_batch_size * max_concurrency,
+            min_new_tokens=performance.get("min_reply_tokens", 16)
+        )
+        self.shed_similarity = performance.get("shed_similarity_threshold", 0.5)
+        
+        # مُجدول الدفعات أمام النموذج حتى لا يحجب التوليد حلقة الأحداث
+        self.scheduler = InferenceScheduler(
+            chat_model,
+            batch_window_ms=performance.get("batch_window_ms", 20),
+            max_batch_size=max_batch_size,
+            max_concurrency=max_concurrency,
+            admission=self.admission
+        )
+        
+        # جاهزية النموذج: حتى تكتمل يرد البوت من ذاكرة الردود أو بالرد الافتراضي
+        self.chat_model = None
+        self._owns_model = chat_model is None
+        self.model_ready = threading.Event()
+        self.model_error = None
+        self.model_load_seconds = None
+        self.model_config = model_config
+        self.warmup_enabled = model_config.get("warmup", True)
+        self._init_started = time.perf_counter()
+        
+        # يمكن تمرير نموذج جاهز (مثلاً نموذج وهمي في قياسات الأداء)
+        if chat_model is not None:
+            self._set_model(chat_model)
+        elif model_config.get("background_load", True):
+            threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        else:
+            self._load_model()
+            if self.model_error is not None:
+                raise self.model_error
+        
+        # متعلمون تكيفيون لكل لهجة (يُحمّل كل منهم عند أول رسالة بلهجته)
+        learning = get_section(self.config, "learning")
+        self.learners = LazyLearners(lambda dialect: AdaptiveLearner(
+            dialect,
+            save_interval_minutes=learning.get("save_interval_minutes", 30),
+            ngram_mode=learning.get("ngram_mode", "exact"),
+            ngram_memory_kb=learning.get("ngram_memory_kb", 4096),
+            decay_factor=learning.get("decay_factor", 0.9),
+            decay_every=learning.get("decay_every", 1000),
+            max_responses=learning.get("max_responses", 5000)
+        ))
+        
+        # ذاكرة ردود لكل لهجة تجيب عن التحيات والكلام المتكرر بدون النموذج
+        self.cache_size = performance.get("cache_size", 1000)
+        self.cache_similarity = performance.get("cache_similarity_threshold", 0.85)
+        self.cache_max_words = performance.get("cache_max_words", 8)
+        self.response_caches = {}
         
         # ذاكرة المجموعات
-        self.group_memories = {}
-        self.max_history = 5  # عدد الرسائل المحفوظة في التاريخ
+        self.max_history = 10  # حد أعلى لأزواج الرسائل؛ القص الفعلي بميزانية الرموز
+        self.history_tokens = model_config.get("history_tokens", 512)
+        self.group_memories = create_group_store(performance, self.max_history)
+        
+        # تسجيل التفاعلات في bot_data.db عبر خيط منفصل (للوحة التحكم)
+        telemetry = get_section(self.config, "telemetry")
+        self.telemetry = None
+        if telemetry.get("enabled", True):
+            self.telemetry = InteractionRecorder(
+                db_path=telemetry.get("db_path", "bot_data.db"),
+                max_queue=telemetry.get("max_queue", 10000),
+                batch_size=telemetry.get("batch_size", 500),
+                anonymize=get_section(self.config, "privacy").get("anonymize_data", True)
+            )
+            self.telemetry.start()
+        
+        # مقاييس الأداء: محلل cProfile لنسبة من استدعاءات التوليد، ومقاييس لحظية لـ /metrics
+        metrics = get_section(self.config, "metrics")
+        PROFILER.sample_rate = metrics.get("profile_sample_rate", 0.0)
+        PROFILER.output_dir = metrics.get("profile_dir", "profiles")
+        REGISTRY.register_collector("bot", self._collect_metrics)
         
         logger.info("🎉 اكتمل تهيئة البوت!")
     
+    def _load_classifier(self, classifier_config: dict) -> DialectClassifier:
+        """المصنف المحفوظ، أو مصنف جديد يبدأ من كلمات المعجم"""
+        if os.path.exists(self.classifier_path):
+            try:
+                classifier = DialectClassifier.load(self.classifier_path)
+                logger.info("✅ تم تحميل مصنف اللهجات (%d مثال)", classifier.samples_seen)
+                return classifier
+            except Exception as e:
+                logger.warning("⚠️ تعذر تحميل مصنف اللهجات، سيُبنى من جديد: %s", e)
+        classifier = DialectClassifier(n_features=classifier_config.get("n_features", 2 ** 18))
+        classifier.fit_from_lexicon(self.dialect_db.dialects)
+        return classifier
+    
+    def _update_classifier(self):
+        """تدريب المصنف على ما جمعه المتعلمون منذ آخر تحديث"""
+        classifier = self.dialect_db.classifier
+        if classifier is None:
+            return
+        self._interactions_since_fit += 1
+        if self._interactions_since_fit >= self.classifier_retrain_every:
+            self._interactions_since_fit = 0
+            added = classifier.fit_from_learners(self.learners)
+            logger.debug("تحديث مصنف اللهجات بـ %d مثال", added)
+    
+    def _load_model(self):
+        """تحميل النموذج وتسخينه (في خيط منفصل عند التحميل في الخلفية)"""
+        try:
+            if self.model_workers > 1:
+                from model_server import ModelWorkerPool
+                model = ModelWorkerPool(
+                    config=self.model_config,
+                    num_workers=self.model_workers,
+                    threads_per_worker=self.threads_per_worker
+                )
+            else:
+                from arabic_model import ArabicChatModel
+                model = ArabicChatModel(config=self.model_config)
+            logger.info("✅ تم تحميل النموذج اللغوي")
+            self._set_model(model)
+        except Exception as e:
+            self.model_error = e
+            logger.error("❌ فشل تحميل النموذج: %s", e)
+    
+    def _set_model(self, model):
+        """تسخين النموذج ثم إعلان الجاهزية"""
+        if self.warmup_enabled:
+            # توليد تجريبي واحد حتى لا يدفع أول مستخدم تكلفة تهيئة النواة والذاكرة
+            warmup_started = time.perf_counter()
+            model.generate_batch([GenerationRequest("مرحبا", self.dialect_db.fallback_dialect)])
+            logger.info("🔥 تم تسخين النموذج خلال %.2f ثانية", time.perf_counter() - warmup_started)
+        
+        self.chat_model = model
+        self.scheduler.model = model
+        self.model_load_seconds = time.perf_counter() - self._init_started
+        self.model_ready.set()
+        logger.info("✅ النموذج جاهز بعد %.2f ثانية", self.model_load_seconds)
+    
+    def is_ready(self) -> bool:
+        """هل النموذج محمّل وجاهز للتوليد"""
+        return self.model_ready.is_set()
+    
+    async def wait_until_ready(self, timeout: float = None) -> bool:
+        """انتظار جاهزية النموذج بدون حجب حلقة الأحداث"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.model_ready.wait, timeout)
+    
+    def get_status(self) -> dict:
+        """حالة الجاهزية (لفحص الجاهزية أثناء النشر التدريجي)"""
+        return {
+            "ready": self.is_ready(),
+            "model_load_seconds": self.model_load_seconds,
+            "error": str(self.model_error) if self.model_error is not None else None,
+            "loaded_learners": sorted(self.learners)
+        }
+    
     async def process_message(self, message_text: str, group_id: str, user_id: str = None) -> str:
         """معالجة رسالة وإرجاع رد"""
+        started = time.perf_counter()
         try:
-            logger.info(f"📨 معالجة رسالة من المجموعة {group_id}: {message_text[:50]}...")
+            logger.info("📨 معالجة رسالة من المجموعة %s: %.50s...", group_id, message_text)
             
             # كشف اللهجة
-            dialect = self.dialect_db.detect_dialect(message_text)
-            logger.info(f"🌍 اللهجة المكتشفة: {dialect}")
+            with Span(_STAGES["detect_dialect"]):
+                dialect = self.dialect_db.detect_dialect(message_text)
+            logger.info("🌍 اللهجة المكتشفة: %s", dialect)
             
             # استرجاع أو إنشاء ذاكرة المجموعة
-            if group_id not in self.group_memories:
-                self.group_memories[group_id] = {
-                    "dialect": dialect,
-                    "history": [],
-                    "users": set(),
-                    "last_active": datetime.now()
-                }
-            
-            memory = self.group_memories[group_id]
-            
-            # إضافة المستخدم إذا كان موجودًا
-            if user_id:
-                memory["users"].add(user_id)
-            
-            # توليد الرد
-            response = self.chat_model.generate_response(
-                text=message_text,
-                dialect=dialect,
-                history=memory["history"]
-            )
+            with Span(_STAGES["group_memory"]):
+                memory = self._get_group_memory(group_id, dialect, user_id)
             
-            # تحسين الرد حسب اللهجة
-            refined_response = self.refine_for_dialect(response, dialect)
-            logger.info(f"🤖 الرد المُولد: {refined_response[:50]}...")
+            # رد محفوظ لرسالة مطابقة أو شبه مطابقة
+            with Span(_STAGES["cache_lookup"]):
+                cache = self._get_response_cache(dialect)
+                refined_response = cache.get(message_text)
+            cache_hit = refined_response is not None
+            tokens_generated = 0
+            request = result = None
             
-            # تحديث الذاكرة
-            memory["history"].append(f"المستخدم: {message_text}")
-            memory["history"].append(f"البوت: {refined_response}")
-            memory["last_active"] = datetime.now()
+            if not cache_hit and not self.model_ready.is_set():
+                # النموذج ما زال يُحمّل: رد افتراضي بدون تخزينه أو التعلم منه
+                self._record_interaction(group_id, user_id, dialect, started, False, 0)
+                _MESSAGES["fallback"].inc()
+                return fallback_response(dialect)
             
-            # الاحتفاظ بآخر الرسائل فقط
-            if len(memory["history"]) > self.max_history * 2:
-                memory["history"] = memory["history"][-(self.max_history * 2):]
+            if not cache_hit:
+                # قبول الطلب كاملًا أو بعدد رموز أقل، أو الرد بدون النموذج إن لم يلحق مهلته
+                admission = self.admission.admit(group_id, stop_limits(self.model_config, dialect)[0])
+                if admission.admitted:
+                    # توليد الرد عبر مُجدول الدفعات (يشمل وقت الانتظار في الطابور)
+                    request = GenerationRequest(
+                        text=message_text,
+                        dialect=dialect,
+                        history=list(memory.history),
+                        group_id=group_id,
+                        max_new_tokens=admission.max_new_tokens,
+                        deadline=admission.deadline
+                    )
+                    generation = self.scheduler.submit(request)
+                    # الطابور الممتلئ يُخرج الطلب لطلب مجموعة أخرى ما دام لم يبدأ توليده
+                    admission.dequeue = lambda: self.scheduler.dequeue(request)
+                    expired = False
+                    try:
+                        with Span(_STAGES["generate"]):
+                            result = await asyncio.wait_for(generation, admission.remaining())
+                    except (asyncio.TimeoutError, DeadlineExceeded):
+                        expired = True
+                    except Evicted:
+                        pass
+                    finally:
+                        self.admission.release(admission, expired)
+                
+                if result is None:
+                    self._record_interaction(group_id, user_id, dialect, started, False, 0)
+                    _MESSAGES["shed"].inc()
+                    logger.warning("⏳ رد بدون النموذج للمجموعة %s (%s)", group_id, admission.reason or "expired")
+                    return self._degraded_response(cache, message_text, dialect)
+                
+                tokens_generated = result.tokens_generated
+                
+                # تحسين الرد حسب اللهجة
+                with Span(_STAGES["refine"]):
+                    refined_response = self.refine_for_dialect(result.text, dialect)
+                with Span(_STAGES["cache_store"]):
+                    cache.put(message_text, refined_response)
+                logger.info("🤖 الرد المُولد: %.50s...", refined_response)
+            else:
+                logger.info("⚡ رد من الذاكرة: %.50s...", refined_response)
             
-            # التعلم من التفاعل (محاكاة النجاح)
-            self.learners[dialect].learn_from_interaction(
-                user_input=message_text,
-                bot_response=refined_response,
-                success_score=0.8
+            self._remember_interaction(memory, message_text, refined_response, dialect, request, result)
+            self._record_interaction(
+                group_id, user_id, dialect, started, cache_hit, tokens_generated
             )
+            _MESSAGES["cache_hit" if cache_hit else "generated"].inc()
             
             return refined_response
             
         except Exception as e:
-            logger.error(f"❌ خطأ في معالجة الرسالة: {e}")
+            _MESSAGES["error"].inc()
+            logger.error("❌ خطأ في معالجة الرسالة: %s", e)
             return "عفواً، حدث خطأ في معالجتي. الرجاء المحاولة مرة أخرى."
     
+    async def stream_message(self, message_text: str, group_id: str, user_id: str = None):
+        """معالجة رسالة مع إرجاع الرد على شكل أجزاء نصية أثناء التوليد"""
+        started = time.perf_counter()
+        try:
+            logger.info("📨 معالجة رسالة (بث) من المجموعة %s: %.50s...", group_id, message_text)
+            
+            dialect = self.dialect_db.detect_dialect(message_text)
+            memory = self._get_group_memory(group_id, dialect, user_id)
+            
+            cache = self._get_response_cache(dialect)
+            cached = cache.get(message_text)
+            if cached is not None:
+                yield cached
+                self._remember_interaction(memory, message_text, cached, dialect)
+                self._record_interaction(group_id, user_id, dialect, started, True, 0)
+                _MESSAGES["cache_hit"].inc()
+                return
+            
+            if not self.model_ready.is_set():
+                yield fallback_response(dialect)
+                self._record_interaction(group_id, user_id, dialect, started, False, 0)
+                _MESSAGES["fallback"].inc()
+                return
+            
+            # جسر بين خيط التوليد وحلقة الأحداث
+            loop = asyncio.get_running_loop()
+            chunks = asyncio.Queue()
+            
+            def on_text(text):
+                loop.call_soon_threadsafe(chunks.put_nowait, text)
+            
+            admission = self.admission.admit(
+                group_id, stop_limits(self.model_config, dialect)[0], slots=self.scheduler.max_concurrency
+            )
+            if not admission.admitted:
+                yield self._degraded_response(cache, message_text, dialect)
+                self._record_interaction(group_id, user_id, dialect, started, False, 0)
+                _MESSAGES["shed"].inc()
+                return
+            
+            request = GenerationRequest(
+                text=message_text, dialect=dialect, history=list(memory.history), group_id=group_id,
+                max_new_tokens=admission.max_new_tokens, deadline=admission.deadline
+            )
+            
+            def generate():
+                # البث رد منفرد، وزمنه يدخل في تقدير سرعة التوليد مثل الدفعات
+                if time.monotonic() >= request.deadline:
+                    # انتهت مهلته قبل أن يبدأ
+                    raise DeadlineExceeded()
+                generation_started = time.perf_counter()
+                result = self.chat_model.stream_response(request, on_text)
+                loop.call_soon_threadsafe(
+                    self.admission.observe, time.perf_counter() - generation_started, result.tokens_generated
+                )
+                return result
+            
+            # البث يأخذ مكانًا من نفس أماكن الدفعات، ويُخرج لطلب مجموعة أخرى ما دام ينتظره
+            generation = self.scheduler.run_exclusive(generate, request=request)
+            admission.dequeue = lambda: self.scheduler.dequeue(request)
+            generation.add_done_callback(lambda _: chunks.put_nowait(None))
+            generation.add_done_callback(lambda future: self.admission.release(
+                admission, not future.cancelled() and isinstance(future.exception(), DeadlineExceeded)
+            ))
+            
+            parts = []
+            greeting = self._pick_greeting(dialect)
+            if greeting:
+                parts.append(f"{greeting}، ")
+                yield parts[-1]
+            
+            # إعادة كتابة الجزء المحسوم فقط، والاحتفاظ بالذيل حتى تكتمل الكلمة أو العبارة
+            rewriter = self.dialect_db.get_rewriter(dialect)
+            buffer = ""
+            reply_started = False
+            while True:
+                text = await chunks.get()
+                if text is None:
+                    break
+                buffer += text
+                if not reply_started:
+                    # تجاهل المسافات في بداية الرد
+                    buffer = buffer.lstrip()
+                    reply_started = bool(buffer)
+                
+                refined, buffer = rewriter.rewrite_partial(buffer)
+                if refined:
+                    parts.append(refined)
+                    yield refined
+            
+            refined = rewriter.rewrite(buffer)
+            if refined:
+                parts.append(refined)
+                yield refined
+            
+            try:
+                result = await generation
+            except (DeadlineExceeded, Evicted):
+                # انتهت المهلة أو أُخرج الطلب قبل أن يبدأ البث
+                yield self._degraded_response(cache, message_text, dialect)
+                self._record_interaction(group_id, user_id, dialect, started, False, 0)
+                _MESSAGES["shed"].inc()
+                return
+            refined_response = "".join(parts).strip()
+            cache.put(message_text, refined_response)
+            self._remember_interaction(memory, message_text, refined_response, dialect, request, result)
+            self._record_interaction(group_id, user_id, dialect, started, False, result.tokens_generated)
+            _MESSAGES["generated"].inc()
+            
+        except Exception as e:
+            _MESSAGES["error"].inc()
+            logger.error("❌ خطأ في معالجة الرسالة: %s", e)
+            yield "عفواً، حدث خطأ في معالجتي. الرجاء المحاولة مرة أخرى."
+    
+    def _degraded_response(self, cache: ResponseCache, message_text: str, dialect: str) -> str:
+        """رد بدون النموذج عند الضغط: أقرب رد محفوظ بحد تشابه أقل، وإلا الرد الافتراضي للهجة"""
+        return cache.nearest(message_text, self.shed_similarity) or fallback_response(dialect)
+    
+    def _get_response_cache(self, dialect: str) -> ResponseCache:
+        """ذاكرة ردود اللهجة، تُملأ أول مرة من الردود الناجحة التي تعلمها البوت"""
+        cache = self.response_caches.get(dialect)
+        if cache is None:
+            cache = ResponseCache(
+                capacity=self.cache_size,
+                similarity_threshold=self.cache_similarity,
+                max_words=self.cache_max_words
+            )
+            responses = self.learners[dialect].learned_patterns["responses"]
+            for item in itertools.islice(responses, max(len(responses) - self.cache_size, 0), None):
+                if "input" in item:
+                    cache.put(item["input"], item["response"])
+            self.response_caches[dialect] = cache
+        return cache
+    
+    def _get_group_memory(self, group_id: str, dialect: str, user_id: str = None) -> GroupMemory:
+        """استرجاع أو إنشاء ذاكرة المجموعة"""
+        memory = self.group_memories.get_or_create(group_id, dialect)
+        
+        # إضافة المستخدم إذا كان موجودًا
+        if user_id:
+            memory.users.add(user_id)
+        
+        return memory
+    
+    def _remember_interaction(self, memory: GroupMemory, message_text: str, response: str, dialect: str,
+                              request: GenerationRequest = None, result=None):
+        """تحديث ذاكرة المجموعة والتعلم من التفاعل"""
+        # حفظ رموز الأدوار التي رمّزها النموذج حتى لا تُرمَّز مرة أخرى، ثم القص بميزانية الرموز
+        with Span(_STAGES["memory_update"]):
+            user_ids = None
+            if result is not None and result.turn_ids:
+                memory.cache_token_ids(request.history, result.turn_ids[:-1], result.tokenizer_tag)
+                user_ids = result.turn_ids[-1]
+            memory.add_turn("user", message_text, user_ids, result.tokenizer_tag if user_ids else None)
+            # رموز الرد كما ولّده النموذج (قبل تحسين اللهجة) حتى يُحسب الدور في ميزانية الرموز
+            reply_ids = result.reply_ids if result is not None else None
+            memory.add_turn("assistant", response, reply_ids, result.tokenizer_tag if reply_ids else None)
+            memory.trim_to_tokens(self.history_tokens)
+            self.group_memories.save(memory)
+        
+        # التعلم من التفاعل (محاكاة النجاح)
+        with Span(_STAGES["learn"]):
+            self.learners[dialect].learn_from_interaction(
+                user_input=message_text,
+                bot_response=response,
+                success_score=0.8
+            )
+            self._update_classifier()
+    
+    def _record_interaction(self, group_id: str, user_id: str, dialect: str,
+                            started: float, cache_hit: bool, tokens_generated: int):
+        """إضافة التفاعل إلى طابور القياسات (بدون أي كتابة على القرص هنا)"""
+        response_time = time.perf_counter() - started
+        _STAGES["total"].observe(response_time)
+        if self.telemetry is not None:
+            self.telemetry.record(
+                group_id, dialect, response_time,
+                cache_hit=cache_hit, tokens_generated=tokens_generated, user_id=user_id
+            )
+    
+    def _collect_metrics(self) -> list:
+        """مقاييس لحظية لمسار /metrics: المُجدول والذاكرات والتسجيل"""
+        collected = [
+            ("bot_ready", "جاهزية النموذج (1 = جاهز)", int(self.is_ready()), {}),
+            ("bot_active_groups", "عدد المجموعات في الذاكرة", len(self.group_memories), {})
+        ]
+        if self.model_load_seconds is not None:
+            collected.append(("bot_model_load_seconds", "زمن تحميل النموذج وتسخينه", self.model_load_seconds, {}))
+        for key, value in self.scheduler.get_stats().items():
+            collected.append((f"scheduler_{key}", "إحصائيات مُجدول الدفعات", value, {}))
+        for key, value in self.admission.get_stats().items():
+            collected.append((f"admission_{key}", "إحصائيات قبول طلبات التوليد", value, {}))
+        if hasattr(self.chat_model, "get_stats"):
+            for key, value in self.chat_model.get_stats().items():
+                collected.append((f"model_pool_{key}", "إحصائيات عمال النموذج", value, {}))
+        for dialect, cache in self.response_caches.items():
+            stats = cache.get_stats()
+            collected.append(("response_cache_size", "عدد الردود المحفوظة", stats["size"], {"dialect": dialect}))
+            collected.append(("response_cache_hit_rate", "نسبة الإصابة في ذاكرة الردود",
+                              stats["hit_rate"], {"dialect": dialect}))
+        if self.telemetry is not None:
+            for key, value in self.telemetry.get_stats().items():
+                collected.append((f"telemetry_{key}", "إحصائيات تسجيل التفاعلات", value, {}))
+        return collected
+    
     def refine_for_dialect(self, text: str, dialect: str) -> str:
         """تحسين النص ليناسب اللهجة المحددة"""
         try:
-            dialect_data = self.dialect_db.dialects.get(dialect, {})
+            # استبدال الكلمات والعبارات الفصيحة بمقابلها في اللهجة
+            text = self.dialect_db.get_rewriter(dialect).rewrite(text)
             
-            # إذا كانت اللهجة موجودة في قاعدة البيانات
-            if dialect_data:
-                # استبدال الكلمات العامة بكلمات اللهجة (محسّن)
-                common_words = dialect_data.get("common_words", {})
-                
-                # تجزئة النص إلى كلمات مع الحفاظ على المسافات
-                words = text.split()
-                refined_words = []
-                
-                for word in words:
-                    # تحويل الكلمة إلى صيغة يمكن مقارنتها
-                    clean_word = word.strip('.,!?؛،')
-                    
-                    if clean_word in common_words.values():
-                        # البحث عن الكلمة المحلية المقابلة
-                        for local_word, std_word in common_words.items():
-                            if std_word == clean_word:
-                                refined_words.append(local_word)
-                                break
-                        else:
-                            refined_words.append(word)
-                    else:
-                        refined_words.append(word)
-                
-                text = ' '.join(refined_words)
-                
-                # إضافة تحية عشوائية
-                import random
-                greetings = dialect_data.get("greetings", [])
-                if greetings and random.random() > 0.5:
-                    text = f"{random.choice(greetings)}، {text}"
+            # إضافة تحية عشوائية
+            greeting = self._pick_greeting(dialect)
+            if greeting:
+                text = f"{greeting}، {text}"
             
             return text
             
         except Exception as e:
-            logger.error(f"❌ خطأ في تحسين اللهجة: {e}")
+            logger.error("❌ خطأ في تحسين اللهجة: %s", e)
             return text
     
+    def _pick_greeting(self, dialect: str):
+        """اختيار تحية عشوائية للهجة (أو None)"""
+        greetings = self.dialect_db.dialects.get(dialect, {}).get("greetings", [])
+        if greetings and random.random() > 0.5:
+            return random.choice(greetings)
+        return None
+    
+    async def shutdown(self):
+        """إيقاف المُجدول وحفظ ما تعلمه البوت"""
+        await self.scheduler.close()
+        if self._owns_model and hasattr(self.chat_model, "close"):
+            self.chat_model.close()
+        for learner in self.learners.values():
+            learner.close()
+        if self.dialect_db.classifier is not None:
+            self.dialect_db.classifier.fit_from_learners(self.learners)
+            self.dialect_db.classifier.save(self.classifier_path)
+        if self.telemetry is not None:
+            self.telemetry.close()
+        logger.info("💾 تم حفظ بيانات التعلم")
+    
     def get_group_stats(self, group_id: str) -> dict:
         """الحصول على إحصائيات المجموعة"""
-        if group_id in self.group_memories:
-            memory = self.group_memories[group_id]
+        memory = self.group_memories.get(group_id)
+        if memory is not None:
             return {
-                "dialect": memory["dialect"],
-                "message_count": len(memory["history"]) // 2,
-                "user_count": len(memory["users"]),
-                "last_active": memory["last_active"].strftime("%Y-%m-%d %H:%M:%S")
+                "dialect": memory.dialect,
+                "message_count": len(memory.history) // 2,
+                "user_count": len(memory.users),
+                "last_active": datetime.fromtimestamp(memory.last_active).strftime("%Y-%m-%d %H:%M:%S")
             }
         return {}
     
     def cleanup_inactive_groups(self, hours_inactive=24):
         """تنظيف المجموعات غير النشطة"""
-        current_time = datetime.now()
-        inactive_groups = []
-        
-        for group_id, memory in self.group_memories.items():
-            time_diff = current_time - memory["last_active"]
-            if time_diff.total_seconds() > hours_inactive * 3600:
-                inactive_groups.append(group_id)
+        inactive_groups = self.group_memories.expire_inactive(hours_inactive * 3600)
         
         for group_id in inactive_groups:
-            del self.group_memories[group_id]
-            logger.info(f"🧹 تم تنظيف المجموعة غير النشطة: {group_id}")
+            logger.info("🧹 تم تنظيف المجموعة غير النشطة: %s", group_id)
         
         return len(inactive_groups)
 
 
 # نموذج استخدام البوت
-async def demo_bot():
-    """عرض توضيحي للبوت"""
-    bot = MultiDialectBot()
+async def demo_bot(bot: MultiDialectBot = None):
+    """عرض توضيحي للبوت (يستخدم البوت الممرر بدل تحميل النموذج مرة ثانية)"""
+    owns_bot = bot is None
+    if owns_bot:
+        bot = MultiDialectBot()
+    await bot.wait_until_ready()
     
     # رسائل تجريبية
     test_messages = [
@@ -211,29 +632,62 @@ async def demo_bot():
     stats = bot.get_group_stats("test_group")
     for key, value in stats.items():
         print(f"  {key}: {value}")
+    
+    if owns_bot:
+        await bot.shutdown()
 
 # دالة التشغيل الرئيسية
+def start_dashboard(bot: MultiDialectBot, settings: dict):
+    """تشغيل لوحة التحكم في خيط داخل عملية البوت (None إذا كانت معطلة أو تعذر تشغيلها)"""
+    if not settings.get("enabled", True):
+        return None
+    try:
+        import admin_dashboard
+        # /ready وإحصائيات التعلم من البوت الحي
+        admin_dashboard.attach_bot(bot)
+        server = admin_dashboard.start_server(settings.get("host", "127.0.0.1"), settings.get("port", 5000))
+    except (ImportError, OSError) as e:
+        logger.warning("⚠️ تعذر تشغيل لوحة التحكم: %s", e)
+        return None
+    logger.info("📊 لوحة التحكم و/metrics على http://%s:%d", server.host, server.server_port)
+    return server
+
 async def main():
     """الدالة الرئيسية لتشغيل البوت"""
     print("🚀 بدء تشغيل البوت المتعدد اللهجات...")
     
+    bot = dispatcher = dashboard = None
     try:
         # إنشاء البوت
         bot = MultiDialectBot()
         
+        # اللوحة في نفس العملية حتى تقرأ REGISTRY الحي
+        dashboard = start_dashboard(bot, get_section(bot.config, "dashboard"))
+        
         # عرض توضيحي
-        await demo_bot()
+        await demo_bot(bot)
         
-        # هنا يمكنك إضافة تكامل مع Telegram أو Discord
-        # ... الكود الخاص بالمنصة
+        # استقبال الرسائل من المنصات المفعّلة في bot.platforms
+        adapters = []
+        for name in get_section(bot.config, "bot").get("platforms") or []:
+            if name in ADAPTERS:
+                adapters.append(ADAPTERS[name]())
+            else:
+                logger.warning("⚠️ لا يوجد محول للمنصة %s", name)
+        
+        settings = get_section(bot.config, "dispatcher")
+        dispatcher = MessageDispatcher(
+            bot, adapters,
+            max_concurrency=settings.get("max_concurrency"),
+            coalesce_window_ms=settings.get("coalesce_window_ms", 0),
+            max_coalesce=settings.get("max_coalesce", 5)
+        )
+        await dispatcher.start()
         
         print("\n✅ البوت جاهز للعمل!")
         
-        # إبقاء البوت يعمل
-        keep_alive = True
-        while keep_alive:
-            # هنا يمكنك إضافة منطق للاستماع للمدخلات
-            await asyncio.sleep(1)
+        # إبقاء البوت يعمل حتى الإيقاف
+        await asyncio.Event().wait()
             
     except KeyboardInterrupt:
         print("\n\n🛑 تم إيقاف البوت بواسطة المستخدم")
@@ -241,6 +695,13 @@ async def main():
         print(f"\n❌ خطأ غير متوقع: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if dispatcher is not None:
+            await dispatcher.stop()
+        if bot is not None:
+            await bot.shutdown()
+        if dashboard is not None:
+            dashboard.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
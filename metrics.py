@@ -0,0 +1,266 @@
+# metrics.py
+import bisect
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# حدود فئات زمن المراحل (بالثواني)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """مدرج تكراري بفئات ثابتة (إضافة قيمة = بحث ثنائي وزيادة عداد)
+
+    تُحدَّث من خيوط المُجدول والكتابة والتوزيع معًا، فالإضافة تحت قفل.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "_lock")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def read(self):
+        """(عدادات الفئات، المجموع، العدد) في لحظة واحدة"""
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.sum = 0.0
+
+    def quantile(self, q: float) -> float:
+        """تقدير الشريحة المئوية من حدود الفئات"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class Counter:
+    """عداد تراكمي (الزيادة تحت قفل مثل Histogram)"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            self.value = 0.0
+
+
+class Span:
+    """قياس زمن مرحلة وإضافته إلى المدرج التكراري الخاص بها"""
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """سجل المقاييس داخل العملية مع تصدير بصيغة Prometheus النصية"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = {}
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+            self._help.setdefault(name, help_text)
+        return histogram
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        key = (name, tuple(sorted(labels.items())))
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = Counter()
+            self._help.setdefault(name, help_text)
+        return counter
+
+    def span(self, name: str, **labels) -> Span:
+        """مدة مرحلة: with REGISTRY.span("bot_stage_seconds", stage="refine"): ..."""
+        return Span(self.histogram(name, **labels))
+
+    def register_collector(self, name: str, collector):
+        """دالة تُستدعى عند التصدير وتُرجع [(الاسم، الوصف، القيمة، الوسوم)] كمقاييس لحظية
+
+        التسجيل بنفس الاسم يستبدل الدالة السابقة (مثلاً عند إنشاء بوت جديد).
+        """
+        self._collectors[name] = collector
+
+    def unregister_collector(self, name: str, collector=None):
+        """إزالة الدالة المسجلة بالاسم (إن كانت collector نفسها عند تمريرها)"""
+        if collector is None or self._collectors.get(name) == collector:
+            self._collectors.pop(name, None)
+
+    def render_prometheus(self) -> str:
+        """تصدير كل المقاييس بصيغة Prometheus النصية"""
+        lines = []
+        emitted = set()
+
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name not in emitted:
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                emitted.add(name)
+            counts, total, count = histogram.read()
+            cumulative = 0
+            for bound, bucket in zip(list(histogram.bounds) + ["+Inf"], counts):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for (name, labels), counter in sorted(self._counters.items()):
+            if name not in emitted:
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                emitted.add(name)
+            lines.append(f"{name}{_labels(labels)} {counter.value}")
+
+        # عينات المقياس الواحد يجب أن تكون متتالية في الصيغة النصية
+        gauges = {}
+        for collector in list(self._collectors.values()):
+            for name, help_text, value, labels in collector():
+                gauges.setdefault(name, (help_text, []))[1].append((labels, value))
+        for name, (help_text, samples) in gauges.items():
+            if name not in emitted:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                emitted.add(name)
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """ملخص المدرجات والعدادات كقاموس (للمقارنة بين التشغيلات)"""
+        summary = {}
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            summary.setdefault(name, {})[_label_key(labels)] = {
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99)
+            }
+        for (name, labels), counter in sorted(self._counters.items()):
+            summary.setdefault(name, {})[_label_key(labels)] = counter.value
+        return summary
+
+    def reset(self):
+        """تصفير القيم مع إبقاء المقاييس نفسها (الوحدات تحتفظ بمراجع إليها)"""
+        for histogram in self._histograms.values():
+            histogram.reset()
+        for counter in self._counters.values():
+            counter.reset()
+
+
+class SamplingProfiler:
+    """تشغيل cProfile على نسبة صغيرة من الاستدعاءات وحفظ النتائج في ملفات"""
+
+    def __init__(self, sample_rate: float = 0.0, output_dir: str = "profiles"):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+
+    def profile(self, name: str):
+        """سياق يُشغّل المحلل فقط إذا وقع الاستدعاء ضمن العينة"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return _NULL_CONTEXT
+        return _ProfileContext(self, name)
+
+
+class _ProfileContext:
+    __slots__ = ("sampler", "name", "profiler")
+
+    def __init__(self, sampler: SamplingProfiler, name: str):
+        self.sampler = sampler
+        self.name = name
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        try:
+            os.makedirs(self.sampler.output_dir, exist_ok=True)
+            path = os.path.join(self.sampler.output_dir, f"{self.name}-{time.time_ns()}.prof")
+            self.profiler.dump_stats(path)
+        except OSError as e:
+            # فشل حفظ التحليل لا يجب أن يُفشل الاستدعاء نفسه
+            logger.warning("⚠️ تعذر حفظ ملف التحليل: %s", e)
+        return False
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def _labels(labels: tuple, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def _label_key(labels: tuple) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels) or "all"
+
+
+# السجل العام المشترك بين البوت والنموذج ولوحة التحكم
+REGISTRY = MetricsRegistry()
+PROFILER = SamplingProfiler()
@@ -0,0 +1,329 @@
+# model_server.py
+"""تشغيل النموذج بعدة عمليات تتشارك نفس الأوزان
+
+العملية الرئيسية تحمّل الأوزان مرة واحدة في ذاكرة مشتركة، وكل عامل يبني النموذج
+حولها بدون نسخها، فتزيد الإنتاجية مع عدد العمال دون أن تتضاعف الذاكرة. كل مجموعة
+تُوجَّه دائمًا إلى نفس العامل (consistent hashing) حتى تبقى ذاكرته المؤقتة دافئة لها.
+"""
+import bisect
+import contextlib
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from generation_types import GenerationRequest, GenerationResult, fallback_response
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_CALL_SECONDS = {
+    kind: REGISTRY.histogram("model_worker_call_seconds", "زمن الطلب عبر عامل النموذج شاملاً الانتظار", kind=kind)
+    for kind in ("batch", "stream")
+}
+
+
+class HashRing:
+    """توزيع ثابت للمفاتيح على العقد بعقد افتراضية: إزالة عقدة تنقل مفاتيحها فقط"""
+
+    def __init__(self, nodes=(), replicas: int = 160):
+        self.replicas = replicas
+        self._hashes = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], "big")
+
+    def add(self, node):
+        """إضافة عقدة بعدد replicas من النقاط على الحلقة"""
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            index = bisect.bisect(self._hashes, point)
+            self._hashes.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node):
+        """إزالة عقدة (مثلاً عامل توقف) فتنتقل مجموعاتها إلى العقد المجاورة"""
+        kept = [(point, n) for point, n in zip(self._hashes, self._nodes) if n != node]
+        self._hashes = [point for point, _ in kept]
+        self._nodes = [n for _, n in kept]
+
+    def get(self, key: str):
+        """العقدة المسؤولة عن المفتاح"""
+        if not self._hashes:
+            raise LookupError("لا توجد عقد في الحلقة")
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+
+class PoolUnavailable(RuntimeError):
+    """كل عمال النموذج متوقفون فلا يوجد من يستقبل الطلب"""
+
+
+def _worker_main(worker_id: int, model_name: str, config: dict, weights: dict, requests, results):
+    """نقطة دخول عملية العامل"""
+    # stdout للعملية الرئيسية (مثل تقرير JSON في قياسات الأداء)، ورسائل العمال إلى stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        _serve(worker_id, model_name, config, weights, requests, results)
+
+
+def _serve(worker_id: int, model_name: str, config: dict, weights: dict, requests, results):
+    """حلقة العامل: بناء النموذج حول الأوزان المشتركة ثم تنفيذ الطلبات حتى استلام None"""
+    from arabic_model import ArabicChatModel
+
+    try:
+        model = ArabicChatModel(model_name, config=config, shared_weights=weights)
+        if config.get("warmup", True):
+            model.generate_batch([GenerationRequest("مرحبا", "standard_arabic")])
+    except Exception as e:
+        results.put((None, worker_id, "error", str(e)))
+        return
+    results.put((None, worker_id, "ready", os.getpid()))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        call_id, kind, payload = message
+        try:
+            if kind == "batch":
+                results.put((call_id, worker_id, "result", model.generate_batch(payload)))
+            else:
+                result = model.stream_response(
+                    payload, lambda text: results.put((call_id, worker_id, "text", text))
+                )
+                results.put((call_id, worker_id, "result", result))
+        except Exception as e:
+            results.put((call_id, worker_id, "error", str(e)))
+
+
+class _Call:
+    """طلب قيد التنفيذ لدى عامل"""
+    __slots__ = ("worker_id", "future", "on_text")
+
+    def __init__(self, worker_id: int, on_text=None):
+        self.worker_id = worker_id
+        self.future = Future()
+        self.on_text = on_text
+
+
+class ModelWorkerPool:
+    """مجموعة عمليات توليد بنفس واجهة ArabicChatModel
+
+    generate_batch تقسم الدفعة حسب العامل المسؤول عن كل مجموعة وتنتظر الأجزاء
+    معًا، وmax_concurrency يخبر InferenceScheduler كم دفعة يرسل في نفس الوقت.
+    الأوزان float (bfloat16 عند دعمه)؛ int8 الديناميكي يُحزم داخل كل عملية فلا يُشارك.
+    """
+
+    def __init__(self, model_name: str = None, config: dict = None, num_workers: int = 2,
+                 threads_per_worker: int = None, start_timeout: float = 600):
+        import torch.multiprocessing as mp
+        from arabic_model import DEFAULT_MODEL, load_shared_weights
+
+        config = dict(config or {})
+        model_name = model_name or config.get("base_model", DEFAULT_MODEL)
+        self.num_workers = max(num_workers, 1)
+        self.max_concurrency = self.num_workers
+        self.prefix_cache = None
+
+        # تقسيم أنوية المعالج على العمال حتى لا تتنافس خيوطهم
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.num_workers)
+        cpu = dict(config.get("cpu") or {}, num_threads=threads, num_interop_threads=1, compile=False)
+        if cpu.get("dtype") == "int8":
+            logger.warning("⚠️  العمال يتشاركون أوزان float؛ تكميم int8 غير مدعوم مع model_workers > 1")
+            cpu["dtype"] = "auto"
+        worker_config = dict(config, device="cpu", use_quantization=False, cpu=cpu)
+
+        started = time.perf_counter()
+        weights = load_shared_weights(model_name, cpu)
+        logger.info("✅ الأوزان في الذاكرة المشتركة خلال %.2f ثانية", time.perf_counter() - started)
+
+        # spawn وليس fork: العملية الرئيسية فيها خيوط (حلقة الأحداث والقياسات) وقد استخدمت OpenMP
+        context = mp.get_context("spawn")
+        self._results = context.Queue()
+        self._queues = []
+        self._processes = []
+        for worker_id in range(self.num_workers):
+            requests = context.Queue()
+            process = context.Process(
+                target=_worker_main,
+                args=(worker_id, model_name, worker_config, weights, requests, self._results),
+                name=f"model-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self._queues.append(requests)
+            self._processes.append(process)
+
+        self._ring = HashRing()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._call_ids = itertools.count()
+        self._closed = False
+        try:
+            self._wait_for_workers(start_timeout)
+        except Exception:
+            self.close()
+            raise
+        # العمال يحملون الأوزان الآن، ولا حاجة لمرجع في العملية الرئيسية
+        del weights
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="model-pool-results", daemon=True)
+        self._dispatcher.start()
+
+    def _wait_for_workers(self, timeout: float):
+        """انتظار رسالة الجاهزية من كل عامل وإضافته إلى الحلقة"""
+        deadline = time.monotonic() + timeout
+        waiting = set(range(self.num_workers))
+        while waiting:
+            try:
+                _, worker_id, kind, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [w for w in waiting if not self._processes[w].is_alive()]
+                if dead:
+                    raise RuntimeError(f"توقف العامل {dead[0]} أثناء التحميل (exit code {self._processes[dead[0]].exitcode})")
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"العمال {sorted(waiting)} لم يجهزوا خلال {timeout} ثانية")
+                continue
+            if kind == "error":
+                raise RuntimeError(f"فشل تحميل النموذج في العامل {worker_id}: {payload}")
+            waiting.discard(worker_id)
+            self._ring.add(worker_id)
+            logger.info("✅ العامل %d جاهز (pid %s)", worker_id, payload)
+
+    def _dispatch(self):
+        """تسليم النتائج والنص المبثوث من العمال لأصحابها ومراقبة العمال المتوقفين"""
+        while not self._closed:
+            try:
+                call_id, worker_id, kind, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            if kind == "text":
+                with self._lock:
+                    call = self._pending.get(call_id)
+                if call is not None and call.on_text is not None:
+                    call.on_text(payload)
+                continue
+
+            with self._lock:
+                call = self._pending.pop(call_id, None)
+            if call is None:
+                continue
+            if kind == "result":
+                call.future.set_result(payload)
+            else:
+                call.future.set_exception(RuntimeError(f"العامل {worker_id}: {payload}"))
+
+    def _check_workers(self):
+        """إخراج العامل المتوقف من الحلقة وإفشال طلباته المعلقة"""
+        for worker_id, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            with self._lock:
+                if worker_id not in self._ring:
+                    continue
+                self._ring.remove(worker_id)
+                failed = [call_id for call_id, call in self._pending.items() if call.worker_id == worker_id]
+                calls = [self._pending.pop(call_id) for call_id in failed]
+            logger.error("❌ توقف العامل %d (exit code %s)، مجموعاته انتقلت لعمال آخرين",
+                         worker_id, process.exitcode)
+            for call in calls:
+                call.future.set_exception(RuntimeError(f"توقف العامل {worker_id}"))
+
+    def _worker_for(self, request: GenerationRequest) -> int:
+        """العامل المسؤول عن مجموعة الطلب (أو لهجته عند غياب group_id)"""
+        with self._lock:
+            if not len(self._ring):
+                raise PoolUnavailable(f"كل عمال النموذج ({self.num_workers}) متوقفون")
+            return self._ring.get(request.group_id or request.dialect)
+
+    def _submit(self, worker_id: int, kind: str, payload, on_text=None) -> Future:
+        """إرسال طلب إلى عامل وإرجاع Future لنتيجته"""
+        with self._lock:
+            call_id = next(self._call_ids)
+            call = _Call(worker_id, on_text)
+            self._pending[call_id] = call
+        self._queues[worker_id].put((call_id, kind, payload))
+        return call.future
+
+    def generate_batch(self, requests: list) -> list:
+        """توزيع الدفعة على العمال حسب المجموعة وتجميع النتائج بنفس الترتيب"""
+        started = time.perf_counter()
+        parts = {}
+        for index, request in enumerate(requests):
+            parts.setdefault(self._worker_for(request), []).append(index)
+
+        futures = [
+            (indices, self._submit(worker_id, "batch", [requests[i] for i in indices]))
+            for worker_id, indices in parts.items()
+        ]
+        results = [None] * len(requests)
+        for indices, future in futures:
+            try:
+                part = future.result()
+            except Exception as e:
+                logger.error("❌ فشل جزء الدفعة لدى العامل: %s", e)
+                part = [GenerationResult(fallback_response(requests[i].dialect)) for i in indices]
+            for index, result in zip(indices, part):
+                results[index] = result
+        _CALL_SECONDS["batch"].observe(time.perf_counter() - started)
+        return results
+
+    def stream_response(self, request: GenerationRequest, on_text) -> GenerationResult:
+        """بث الرد من العامل المسؤول عن المجموعة (on_text يُستدعى من خيط التوزيع)"""
+        started = time.perf_counter()
+        try:
+            return self._submit(self._worker_for(request), "stream", request, on_text).result()
+        finally:
+            _CALL_SECONDS["stream"].observe(time.perf_counter() - started)
+
+    def generate_response(self, text: str, dialect: str, history: list = None) -> str:
+        return self.generate_batch([GenerationRequest(text, dialect, list(history or []))])[0].text
+
+    def get_fallback_response(self, dialect: str) -> str:
+        return fallback_response(dialect)
+
+    def get_stats(self) -> dict:
+        """عدد العمال الأحياء والطلبات المعلقة"""
+        return {
+            "workers": self.num_workers,
+            "workers_alive": sum(process.is_alive() for process in self._processes),
+            "pending_calls": len(self._pending)
+        }
+
+    def close(self, timeout: float = 10):
+        """إيقاف العمال بعد إنهاء ما في طوابيرهم"""
+        if self._closed:
+            return
+        self._closed = True
+        for requests, process in zip(self._queues, self._processes):
+            if process.is_alive():
+                requests.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            calls = list(self._pending.values())
+            self._pending.clear()
+        for call in calls:
+            call.future.set_exception(RuntimeError("تم إيقاف عمال النموذج"))
@@ -0,0 +1,214 @@
+# ngram_store.py
+import heapq
+import sys
+import zlib
+from array import array
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+# تقدير تقريبي لتكلفة مدخل واحد في الجدول (المفتاح المُدمج + القاموس + العداد)
+_BYTES_PER_ENTRY = 160
+
+
+class NGramCounter:
+    """عداد n-grams بمعرفات مُدمجة وعدادات في مصفوفة، مع حد أقصى لعدد المدخلات"""
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max(max_entries, 16)
+        self._ids = {}
+        self._ngrams = []
+        self._counts = array('d')
+        self._free = []
+        self.total = 0.0
+
+    def add(self, ngram: str, count: float = 1.0):
+        """زيادة عداد n-gram"""
+        ngram_id = self._ids.get(ngram)
+        if ngram_id is None:
+            ngram = sys.intern(ngram)
+            if self._free:
+                ngram_id = self._free.pop()
+                self._ngrams[ngram_id] = ngram
+                self._counts[ngram_id] = 0.0
+            else:
+                ngram_id = len(self._ngrams)
+                self._ngrams.append(ngram)
+                self._counts.append(0.0)
+            self._ids[ngram] = ngram_id
+        self._counts[ngram_id] += count
+        self.total += count
+
+        if len(self._ids) > self.max_entries:
+            self._prune()
+
+    def add_many(self, ngrams: Iterable[str]):
+        for ngram in ngrams:
+            self.add(ngram)
+
+    def get(self, ngram: str) -> float:
+        ngram_id = self._ids.get(ngram)
+        return self._counts[ngram_id] if ngram_id is not None else 0.0
+
+    def top_k(self, k: int = 20) -> List[Tuple[str, float]]:
+        """أكثر n-grams تكرارًا"""
+        ids = heapq.nlargest(k, self._ids.values(), key=self._counts.__getitem__)
+        return [(self._ngrams[i], self._counts[i]) for i in ids]
+
+    def decay(self, factor: float, min_count: float = 0.5):
+        """تقليل وزن العدادات القديمة وحذف ما أصبح ضئيلًا"""
+        counts = self._counts
+        for ngram, ngram_id in list(self._ids.items()):
+            counts[ngram_id] *= factor
+            if counts[ngram_id] < min_count:
+                self._remove(ngram, ngram_id)
+        self.total *= factor
+
+    def _prune(self):
+        """حذف النصف الأقل تكرارًا (عدّ تقريبي يحافظ على الأكثر تكرارًا)"""
+        keep = self.max_entries // 2
+        survivors = set(heapq.nlargest(keep, self._ids.values(), key=self._counts.__getitem__))
+        for ngram, ngram_id in list(self._ids.items()):
+            if ngram_id not in survivors:
+                self._remove(ngram, ngram_id)
+
+    def _remove(self, ngram: str, ngram_id: int):
+        del self._ids[ngram]
+        self._ngrams[ngram_id] = None
+        self._counts[ngram_id] = 0.0
+        self._free.append(ngram_id)
+
+    def keys(self):
+        return self._ids.keys()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, ngram: str):
+        return ngram in self._ids
+
+
+class SketchCounter:
+    """عداد Count-Min بذاكرة ثابتة مع تتبع الأكثر تكرارًا (heavy hitters)
+
+    الجدول مصفوفة NumPy بحجم depth × width فيُحدّث ويُقلل وزنه بعمليات متجهة،
+    والمرشحون في heap أصغر عنصر فيه هو الأضعف، مع حذف كسول للمدخلات القديمة.
+    """
+
+    def __init__(self, width: int = 65536, depth: int = 4, top_capacity: int = 1000):
+        self.width = max(width, 64)
+        self.depth = max(depth, 1)
+        self.top_capacity = max(top_capacity, 1)
+        self._table = np.zeros((self.depth, self.width), dtype=np.float64)
+        self._row_index = np.arange(self.depth)[:, None]
+        self._heavy = {}
+        # (التقدير، n-gram)؛ المدخل قديم إذا لم يعد يطابق _heavy
+        self._heap = []
+        self.total = 0.0
+
+    def __setstate__(self, state):
+        # لقطات قديمة تحفظ الجدول كصفوف array وأصغر تقدير في _heavy_min
+        if "_rows" in state:
+            state["_table"] = np.array([row.tolist() for row in state.pop("_rows")], dtype=np.float64)
+            state.pop("_heavy_min", None)
+        self.__dict__.update(state)
+        self._row_index = np.arange(self.depth)[:, None]
+        self._rebuild_heap()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_row_index"], state["_heap"]
+        return state
+
+    def _cells(self, ngram: str):
+        data = ngram.encode('utf-8')
+        # بذور ثابتة حتى تبقى الفهارس صالحة بعد الحفظ والتحميل
+        return [zlib.crc32(data, seed) % self.width for seed in range(self.depth)]
+
+    def add(self, ngram: str, count: float = 1.0):
+        """زيادة عداد n-gram وتحديث قائمة الأكثر تكرارًا"""
+        self.add_many((ngram,), count)
+
+    def add_many(self, ngrams: Iterable[str], count: float = 1.0):
+        """زيادة عدادات عدة n-grams بعملية واحدة على الجدول"""
+        ngrams = list(ngrams)
+        if not ngrams:
+            return
+        cells = np.array([self._cells(ngram) for ngram in ngrams], dtype=np.int64).T
+        np.add.at(self._table, (self._row_index, cells), count)
+        estimates = self._table[self._row_index, cells].min(axis=0)
+        self.total += count * len(ngrams)
+        for ngram, estimate in zip(ngrams, estimates.tolist()):
+            self._offer(ngram, estimate)
+
+    def _offer(self, ngram: str, estimate: float):
+        """إدخال n-gram في قائمة المرشحين إذا كان أقوى من أضعفها"""
+        heavy = self._heavy
+        if ngram in heavy:
+            heavy[ngram] = estimate
+            heapq.heappush(self._heap, (estimate, ngram))
+        elif len(heavy) < self.top_capacity:
+            ngram = sys.intern(ngram)
+            heavy[ngram] = estimate
+            heapq.heappush(self._heap, (estimate, ngram))
+        else:
+            weakest, weakest_ngram = self._weakest()
+            if estimate <= weakest:
+                return
+            ngram = sys.intern(ngram)
+            del heavy[weakest_ngram]
+            heavy[ngram] = estimate
+            heapq.heapreplace(self._heap, (estimate, ngram))
+
+        # تحديث مرشح موجود يضيف مدخلًا جديدًا، فيُعاد بناء الـ heap قبل أن يكبر كثيرًا
+        if len(self._heap) > 2 * self.top_capacity + 64:
+            self._rebuild_heap()
+
+    def _weakest(self):
+        """أضعف مرشح فعلي بعد إسقاط المدخلات القديمة من أعلى الـ heap"""
+        heap = self._heap
+        while heap[0][0] != self._heavy.get(heap[0][1]):
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _rebuild_heap(self):
+        self._heap = [(count, ngram) for ngram, count in self._heavy.items()]
+        heapq.heapify(self._heap)
+
+    def get(self, ngram: str) -> float:
+        """تقدير العدد (لا يقل أبدًا عن العدد الحقيقي)"""
+        return float(self._table[self._row_index[:, 0], self._cells(ngram)].min())
+
+    def top_k(self, k: int = 20) -> List[Tuple[str, float]]:
+        """أكثر n-grams تكرارًا (من قائمة المرشحين)"""
+        return heapq.nlargest(k, self._heavy.items(), key=lambda item: item[1])
+
+    def decay(self, factor: float, min_count: float = 0.5):
+        """تقليل وزن العدادات القديمة"""
+        self._table *= factor
+        self._heavy = {
+            ngram: count * factor for ngram, count in self._heavy.items()
+            if count * factor >= min_count
+        }
+        self._rebuild_heap()
+        self.total *= factor
+
+    def keys(self):
+        return self._heavy.keys()
+
+    def __len__(self):
+        return len(self._heavy)
+
+    def __contains__(self, ngram: str):
+        return ngram in self._heavy
+
+
+def create_ngram_counter(mode: str = "exact", memory_budget_kb: int = 4096, top_capacity: int = 1000):
+    """إنشاء عداد n-grams حسب النمط وميزانية الذاكرة"""
+    budget = memory_budget_kb * 1024
+    if mode == "sketch":
+        depth = 4
+        # الجزء الأكبر للمصفوفة والباقي لقائمة المرشحين
+        width = max((budget - top_capacity * _BYTES_PER_ENTRY) // (8 * depth), 64)
+        return SketchCounter(width=width, depth=depth, top_capacity=top_capacity)
+    return NGramCounter(max_entries=budget // _BYTES_PER_ENTRY)
@@ -0,0 +1,75 @@
+# prefix_cache.py
+import threading
+import torch
+from transformers.cache_utils import DynamicCache
+
+
+class PrefixCache:
+    """ذاكرة مؤقتة لحالة key/value الخاصة بتعليمات اللهجة الثابتة في بداية كل prompt
+
+    الحالة المحفوظة لا تُنسخ: التوليد يضيف إلى DynamicCache بـ torch.cat فينشئ
+    tensors جديدة ولا يعدّل المحفوظة، لذلك يكفي لكل استدعاء DynamicCache جديد فوقها.
+    """
+
+    def __init__(self, model, tokenizer, device: str = "cpu"):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # إحصائيات
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, header: str):
+        """إرجاع رموز التعليمات وحالتها المحسوبة مسبقًا (تُحسب مرة واحدة لكل لهجة)"""
+        header_ids, past_key_values = self.get_batch([(key, header)])
+        return header_ids[0], past_key_values
+
+    def get_batch(self, items: list):
+        """رموز التعليمات لكل صف وحالة الدفعة كلها: items قائمة (key, header) بترتيب الصفوف
+
+        التعليمات الأقصر تُحشى من اليسار بأصفار حتى أطولها، والصف يضع padding
+        مقابلها في input_ids مع 0 في attention_mask.
+        """
+        with self._lock:
+            entries = [self._entry(key, header) for key, header in items]
+
+        width = max(len(header_ids) for header_ids, _ in entries)
+        layers = []
+        for index in range(len(entries[0][1])):
+            keys, values = [], []
+            for header_ids, entry_layers in entries:
+                key_states, value_states = entry_layers[index]
+                padding = (0, 0, width - len(header_ids), 0)
+                keys.append(torch.nn.functional.pad(key_states, padding))
+                values.append(torch.nn.functional.pad(value_states, padding))
+            layers.append((torch.cat(keys), torch.cat(values)))
+        return [header_ids for header_ids, _ in entries], DynamicCache(layers, config=self.model.config)
+
+    def _entry(self, key: str, header: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != header:
+            entry = (header,) + self._compute(header)
+            self._entries[key] = entry
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry[1:]
+
+    def _compute(self, header: str):
+        """تمرير التعليمات عبر النموذج مرة واحدة وحفظ key/value كل طبقة"""
+        header_ids = self.tokenizer(header).input_ids
+        with torch.no_grad():
+            outputs = self.model(input_ids=torch.tensor([header_ids], device=self.device), use_cache=True)
+        layers = [(layer.keys, layer.values) for layer in outputs.past_key_values.layers]
+        return header_ids, layers
+
+    def clear(self):
+        """مسح جميع الحالات المحفوظة"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
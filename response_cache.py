@@ -0,0 +1,153 @@
+# response_cache.py
+import re
+from collections import OrderedDict
+from typing import Optional
+
+# التشكيل والتطويل
+_DIACRITICS_RE = re.compile(r"[\u064B-\u065F\u0670\u0640]")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_SPACES_RE = re.compile(r"\s+")
+_LETTER_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي",
+    "ة": "ه"
+})
+
+
+def normalize_arabic(text: str) -> str:
+    """توحيد الكتابة العربية: الألف والياء والتاء المربوطة وحذف التشكيل والتطويل والترقيم"""
+    text = _DIACRITICS_RE.sub("", text).translate(_LETTER_MAP)
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip().lower()
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """n-grams على مستوى الحروف مع حدود الكلمات"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class ResponseCache:
+    """ذاكرة ردود تعتمد على النص الموحّد مع بحث تقريبي عبر فهرس n-grams مقلوب"""
+
+    def __init__(self, capacity: int = 1000, similarity_threshold: float = 0.85,
+                 max_words: int = 8, ngram_size: int = 3, eviction_sample: int = 8):
+        self.capacity = max(capacity, 1)
+        self.similarity_threshold = similarity_threshold
+        self.max_words = max_words
+        self.ngram_size = ngram_size
+        self.eviction_sample = max(eviction_sample, 1)
+
+        # المفتاح الموحّد -> [الرد، عدد مرات الاستخدام، n-grams]
+        self._entries = OrderedDict()
+        self._index = {}
+
+        # إحصائيات
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def cacheable(self, key: str) -> bool:
+        """الرسائل القصيرة فقط (تحيات وكلام عابر) تُخزن وتُسترجع"""
+        return bool(key) and key.count(" ") < self.max_words
+
+    def get(self, text: str) -> Optional[str]:
+        """البحث عن رد مطابق أو شبه مطابق"""
+        key = normalize_arabic(text)
+        if not self.cacheable(key):
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            key = self._find_similar(key)
+            if key is None:
+                self.misses += 1
+                return None
+            entry = self._entries[key]
+            self.near_hits += 1
+        else:
+            self.hits += 1
+
+        entry[1] += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, text: str, response: str):
+        """تخزين رد لرسالة"""
+        key = normalize_arabic(text)
+        if not self.cacheable(key) or not response:
+            return
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[0] = response
+            self._entries.move_to_end(key)
+            return
+
+        if len(self._entries) >= self.capacity:
+            self._evict()
+
+        grams = char_ngrams(key, self.ngram_size)
+        self._entries[key] = [response, 0, grams]
+        for gram in grams:
+            self._index.setdefault(gram, set()).add(key)
+
+    def nearest(self, text: str, similarity_threshold: float) -> Optional[str]:
+        """أقرب رد بحد تشابه أقل، بدون تغيير الإحصائيات أو ترتيب الإخراج (للرد المخفّض عند الضغط)"""
+        key = normalize_arabic(text)
+        if not self.cacheable(key):
+            return None
+        if key not in self._entries:
+            key = self._find_similar(key, similarity_threshold)
+        return self._entries[key][0] if key is not None else None
+
+    def _find_similar(self, key: str, similarity_threshold: float = None) -> Optional[str]:
+        """أقرب مفتاح حسب تشابه Jaccard على n-grams الحروف"""
+        grams = char_ngrams(key, self.ngram_size)
+        overlaps = {}
+        for gram in grams:
+            for candidate in self._index.get(gram, ()):
+                overlaps[candidate] = overlaps.get(candidate, 0) + 1
+
+        if similarity_threshold is None:
+            similarity_threshold = self.similarity_threshold
+        best_key, best_score = None, similarity_threshold
+        for candidate, overlap in overlaps.items():
+            candidate_grams = self._entries[candidate][2]
+            score = overlap / (len(grams) + len(candidate_grams) - overlap)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+    def _evict(self):
+        """إخراج الأقل استخدامًا من بين أقدم المدخلات (LRU مع مراعاة التكرار)"""
+        oldest = []
+        for key in self._entries:
+            oldest.append(key)
+            if len(oldest) >= self.eviction_sample:
+                break
+        victim = min(oldest, key=lambda k: self._entries[k][1])
+
+        _, _, grams = self._entries.pop(victim)
+        for gram in grams:
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(victim)
+                if not keys:
+                    del self._index[gram]
+
+    def get_stats(self) -> dict:
+        """إحصائيات الذاكرة"""
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,287 @@
+# telemetry.py
+import bisect
+import hashlib
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INTERACTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS interactions (
+        id INTEGER PRIMARY KEY,
+        chat_id TEXT NOT NULL,
+        user_id TEXT,
+        dialect TEXT NOT NULL,
+        response_time REAL NOT NULL,
+        cache_hit INTEGER NOT NULL DEFAULT 0,
+        tokens_generated INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    )
+'''
+
+# جداول مجمّعة تُحدَّث مع كل دفعة حتى لا تمسح لوحة التحكم كل التفاعلات
+ROLLUP_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_interactions_dialect_time ON interactions (dialect, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_chat ON interactions (chat_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS dialect_rollup (
+        dialect TEXT PRIMARY KEY,
+        message_count INTEGER NOT NULL,
+        latency_sum REAL NOT NULL,
+        latency_min REAL NOT NULL,
+        latency_max REAL NOT NULL,
+        cache_hits INTEGER NOT NULL,
+        tokens_sum INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS hourly_rollup (
+        hour INTEGER NOT NULL,
+        dialect TEXT NOT NULL,
+        message_count INTEGER NOT NULL,
+        latency_sum REAL NOT NULL,
+        latency_min REAL NOT NULL,
+        latency_max REAL NOT NULL,
+        cache_hits INTEGER NOT NULL,
+        tokens_sum INTEGER NOT NULL,
+        PRIMARY KEY (hour, dialect)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS latency_histogram (
+        dialect TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (dialect, bucket)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS dialect_groups (
+        dialect TEXT NOT NULL,
+        chat_id TEXT NOT NULL,
+        PRIMARY KEY (dialect, chat_id)
+    ) WITHOUT ROWID
+    '''
+]
+
+# الحدود العليا لفئات زمن الاستجابة (بالثواني)، والفئة الأخيرة لما يتجاوزها
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_UPSERT_DIALECT = '''
+    INSERT INTO dialect_rollup
+        (dialect, message_count, latency_sum, latency_min, latency_max, cache_hits, tokens_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (dialect) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        latency_sum = latency_sum + excluded.latency_sum,
+        latency_min = MIN(latency_min, excluded.latency_min),
+        latency_max = MAX(latency_max, excluded.latency_max),
+        cache_hits = cache_hits + excluded.cache_hits,
+        tokens_sum = tokens_sum + excluded.tokens_sum
+'''
+
+_UPSERT_HOURLY = '''
+    INSERT INTO hourly_rollup
+        (hour, dialect, message_count, latency_sum, latency_min, latency_max, cache_hits, tokens_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (hour, dialect) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        latency_sum = latency_sum + excluded.latency_sum,
+        latency_min = MIN(latency_min, excluded.latency_min),
+        latency_max = MAX(latency_max, excluded.latency_max),
+        cache_hits = cache_hits + excluded.cache_hits,
+        tokens_sum = tokens_sum + excluded.tokens_sum
+'''
+
+_UPSERT_HISTOGRAM = '''
+    INSERT INTO latency_histogram (dialect, bucket, count) VALUES (?, ?, ?)
+    ON CONFLICT (dialect, bucket) DO UPDATE SET count = count + excluded.count
+'''
+
+_INSERT_INTERACTION = '''
+    INSERT INTO interactions
+        (chat_id, user_id, dialect, response_time, cache_hit, tokens_generated, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """فتح قاعدة البيانات بنمط WAL حتى لا تحجب الكتابة القراءة (لوحة التحكم)"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """إنشاء جدول التفاعلات والجداول المجمّعة، وبناء المجاميع لبيانات قديمة إن وُجدت"""
+    conn.execute(INTERACTIONS_SCHEMA)
+    for statement in ROLLUP_SCHEMA:
+        conn.execute(statement)
+
+    rollup_empty = conn.execute("SELECT 1 FROM dialect_rollup LIMIT 1").fetchone() is None
+    has_interactions = conn.execute("SELECT 1 FROM interactions LIMIT 1").fetchone() is not None
+    if rollup_empty and has_interactions:
+        rebuild_rollups(conn)
+    conn.commit()
+
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """إعادة حساب الجداول المجمّعة من جدول التفاعلات بالكامل (مرة واحدة)"""
+    for table in ("dialect_rollup", "hourly_rollup", "latency_histogram", "dialect_groups"):
+        conn.execute(f"DELETE FROM {table}")
+
+    conn.execute('''
+        INSERT INTO dialect_rollup
+        SELECT dialect, COUNT(*), SUM(response_time), MIN(response_time), MAX(response_time),
+               SUM(cache_hit), SUM(tokens_generated)
+        FROM interactions GROUP BY dialect
+    ''')
+    conn.execute('''
+        INSERT INTO hourly_rollup
+        SELECT CAST(created_at / 3600 AS INTEGER) AS hour, dialect, COUNT(*), SUM(response_time),
+               MIN(response_time), MAX(response_time), SUM(cache_hit), SUM(tokens_generated)
+        FROM interactions GROUP BY hour, dialect
+    ''')
+    conn.execute("INSERT OR IGNORE INTO dialect_groups SELECT DISTINCT dialect, chat_id FROM interactions")
+
+    histogram = {}
+    for dialect, response_time in conn.execute("SELECT dialect, response_time FROM interactions"):
+        key = (dialect, latency_bucket(response_time))
+        histogram[key] = histogram.get(key, 0) + 1
+    conn.executemany(_UPSERT_HISTOGRAM, [(d, b, c) for (d, b), c in histogram.items()])
+
+
+def latency_bucket(response_time: float) -> int:
+    """رقم فئة زمن الاستجابة"""
+    return bisect.bisect_left(LATENCY_BUCKETS, response_time)
+
+
+def _merge(aggregates: dict, key, response_time: float, cache_hit: int, tokens: int):
+    """دمج تفاعل في مجاميع الدفعة: [العدد، المجموع، الأدنى، الأعلى، الإصابات، الرموز]"""
+    current = aggregates.get(key)
+    if current is None:
+        aggregates[key] = [1, response_time, response_time, response_time, cache_hit, tokens]
+    else:
+        current[0] += 1
+        current[1] += response_time
+        current[2] = min(current[2], response_time)
+        current[3] = max(current[3], response_time)
+        current[4] += cache_hit
+        current[5] += tokens
+
+
+class InteractionRecorder:
+    """تسجيل التفاعلات خارج مسار الرسائل: طابور محدود في الذاكرة وخيط يكتب بالدفعات"""
+
+    def __init__(self, db_path: str = "bot_data.db", max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 1.0, anonymize: bool = True):
+        self.db_path = db_path
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.anonymize = anonymize
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+        # إحصائيات
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        """تشغيل خيط الكتابة"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+            self._thread.start()
+
+    def record(self, chat_id: str, dialect: str, response_time: float,
+               cache_hit: bool = False, tokens_generated: int = 0, user_id: str = None):
+        """إضافة تفاعل إلى الطابور؛ عند امتلائه يُهمل السجل ويُزاد عداد المفقودات"""
+        try:
+            self._queue.put_nowait((
+                chat_id, user_id, dialect, response_time,
+                int(cache_hit), tokens_generated, time.time()
+            ))
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        """سحب السجلات من الطابور وكتابتها بـ executemany"""
+        conn = connect(self.db_path)
+        ensure_schema(conn)
+
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(self._prepare(item))
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write(conn, batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    logger.error("❌ فشل حفظ بيانات التفاعلات: %s", e)
+
+        conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: list):
+        """إدراج الدفعة وتحديث الجداول المجمّعة في نفس المعاملة"""
+        per_dialect, per_hour, histogram, groups = {}, {}, {}, set()
+        for chat_id, _, dialect, response_time, cache_hit, tokens, created_at in batch:
+            _merge(per_dialect, dialect, response_time, cache_hit, tokens)
+            _merge(per_hour, (int(created_at // 3600), dialect), response_time, cache_hit, tokens)
+            bucket = (dialect, latency_bucket(response_time))
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+            groups.add((dialect, chat_id))
+
+        with conn:
+            conn.executemany(_INSERT_INTERACTION, batch)
+            conn.executemany(_UPSERT_DIALECT, [(d, *values) for d, values in per_dialect.items()])
+            conn.executemany(_UPSERT_HOURLY, [(h, d, *values) for (h, d), values in per_hour.items()])
+            conn.executemany(_UPSERT_HISTOGRAM, [(d, b, c) for (d, b), c in histogram.items()])
+            conn.executemany("INSERT OR IGNORE INTO dialect_groups VALUES (?, ?)", list(groups))
+
+    def _prepare(self, item: tuple) -> tuple:
+        """إخفاء هوية المستخدم قبل الحفظ إذا كان مطلوبًا"""
+        chat_id, user_id, *rest = item
+        if self.anonymize and user_id is not None:
+            user_id = hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:16]
+        return (str(chat_id), user_id, *rest)
+
+    def close(self, timeout: float = 5.0):
+        """كتابة ما تبقى في الطابور ثم إيقاف الخيط"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def get_stats(self) -> dict:
+        """إحصائيات التسجيل"""
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize()
+        }
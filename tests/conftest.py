@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""إعدادات مشتركة: البوت يكتب بياناته (التعلم والقياسات والمصنف) في مجلد مؤقت"""
+import copy
+import os
+
+import pytest
+
+from config_loader import load_config
+
+_CONFIG = load_config(os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.yaml"))
+
+
+@pytest.fixture
+def bot_config(tmp_path, monkeypatch):
+    """نسخة من config.yaml بدون تسجيل القياسات، مع تشغيل الاختبار داخل مجلد مؤقت"""
+    config = copy.deepcopy(_CONFIG)
+    config.setdefault("telemetry", {})["enabled"] = False
+    monkeypatch.chdir(tmp_path)
+    return config
+
+
+@pytest.fixture(scope="session")
+def tiny_model_path(tmp_path_factory):
+    """نموذج Qwen2 صغير بأوزان عشوائية ومرمّز مُدرب محليًا (مرة واحدة لكل الاختبارات)"""
+    from benchmarks.stub_model import build_tiny_model
+    return build_tiny_model(str(tmp_path_factory.mktemp("tiny_model")))
+
+
+@pytest.fixture(scope="session")
+def tiny_draft_path(tiny_model_path, tmp_path_factory):
+    """نموذج مسودة أصغر بنفس مرمّز tiny_model_path"""
+    from benchmarks.stub_model import build_tiny_model
+    return build_tiny_model(
+        str(tmp_path_factory.mktemp("tiny_draft")), layers=1, seed=1, tokenizer_path=tiny_model_path
+    )
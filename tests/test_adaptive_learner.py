@@ -0,0 +1,97 @@
+# tests/test_adaptive_learner.py
+"""اختبارات حفظ ما يتعلمه AdaptiveLearner"""
+import os
+import threading
+import time
+
+import pytest
+
+from adaptive_learner import AdaptiveLearner
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_log_and_compaction_run_on_the_writer_thread():
+    learner = AdaptiveLearner("iraqi", max_pending=1, compact_threshold_bytes=0)
+    threads = []
+    for name in ("append", "write_snapshot_bytes"):
+        original = getattr(learner._store, name)
+
+        def record(*args, _original=original):
+            threads.append(threading.current_thread().name)
+            return _original(*args)
+
+        setattr(learner._store, name, record)
+
+    for i in range(5):
+        learner.learn_from_interaction(f"شلونك اليوم {i}", "زين", 0.9)
+    learner.close()
+
+    assert threads and all(name.startswith("learning-writer") for name in threads)
+    reloaded = AdaptiveLearner("iraqi")
+    assert reloaded.learned_patterns["interaction_count"] == 5
+    assert len(reloaded.learned_patterns["responses"]) == 5
+
+
+def test_pending_interactions_are_saved_on_close():
+    learner = AdaptiveLearner("egyptian", save_interval_minutes=60)
+    learner.learn_from_interaction("ازيك عامل ايه", "كويس", 0.9)
+    assert learner._store.log_size() == 0
+
+    learner.close()
+    assert AdaptiveLearner("egyptian").learned_patterns["interaction_count"] == 1
+
+
+def test_read_only_load_stops_at_torn_tail_without_truncating():
+    learner = AdaptiveLearner("iraqi", max_pending=1)
+    for i in range(3):
+        learner.learn_from_interaction(f"هلا {i}", "هلا بيك", 0.9)
+    learner.close()
+    # سجل ناقص كأن الكاتب انقطع في منتصف الإلحاق
+    with open(learner.log_file, "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+    size = os.path.getsize(learner.log_file)
+
+    reader = AdaptiveLearner("iraqi", read_only=True)
+    assert reader.learned_patterns["interaction_count"] == 3
+    assert os.path.getsize(learner.log_file) == size
+    reader.close()
+    assert os.path.getsize(learner.log_file) == size
+
+    AdaptiveLearner("iraqi")
+    assert os.path.getsize(learner.log_file) < size
+
+
+def test_responses_keep_only_the_latest_window():
+    learner = AdaptiveLearner("iraqi", max_responses=3)
+    for i in range(10):
+        learner.learn_from_interaction(f"هلا {i}", "هلا بيك", 0.9)
+    learner.close()
+
+    responses = learner.learned_patterns["responses"]
+    assert [item["input"] for item in responses] == ["هلا 7", "هلا 8", "هلا 9"]
+    assert learner.learned_patterns["responses_total"] == 10
+
+    reloaded = AdaptiveLearner("iraqi", max_responses=3)
+    assert len(reloaded.learned_patterns["responses"]) == 3
+    assert reloaded.learned_patterns["responses_total"] == 10
+
+
+def test_pending_interactions_are_written_after_an_idle_interval():
+    learner = AdaptiveLearner("khaleeji", save_interval_minutes=0.002, max_pending=100)
+    learner.learn_from_interaction("شحوالك اليوم", "زين", 0.9)
+    assert learner._pending
+
+    # لا تفاعل جديد بعده: المؤقت يكتبه في خيط الكتابة
+    for _ in range(50):
+        if learner._last_write is not None:
+            break
+        time.sleep(0.02)
+    learner._last_write.result(timeout=5)
+
+    assert not learner._pending and learner._timer is None
+    assert AdaptiveLearner("khaleeji", read_only=True).learned_patterns["interaction_count"] == 1
+    learner.close()
@@ -0,0 +1,80 @@
+# tests/test_admin_dashboard.py
+"""اختبارات لوحة التحكم عند تشغيلها داخل عملية البوت"""
+import asyncio
+import threading
+import urllib.request
+
+import pytest
+
+import admin_dashboard
+from metrics import REGISTRY
+
+
+def test_metrics_served_from_the_process_registry():
+    REGISTRY.counter("test_dashboard_total", "عداد للاختبار").inc(3)
+    server = admin_dashboard.start_server(port=0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert "test_dashboard_total 3" in body
+
+
+def test_ready_turns_200_once_warmup_finishes(bot_config, monkeypatch):
+    from benchmarks.stub_model import StubChatModel
+    from main import MultiDialectBot, start_dashboard
+
+    # تحميل النموذج في الخلفية ينتظر حتى يسمح له الاختبار
+    release = threading.Event()
+
+    def load_model(bot):
+        release.wait(10)
+        bot._set_model(StubChatModel(latency_ms=1))
+
+    monkeypatch.setattr(MultiDialectBot, "_load_model", load_model)
+    bot = MultiDialectBot(bot_config)
+    server = start_dashboard(bot, {"port": 0})
+    try:
+        client = admin_dashboard.app.test_client()
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.get_json()["ready"] is False
+
+        release.set()
+        assert bot.model_ready.wait(10)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.get_json()["ready"] is True
+    finally:
+        release.set()
+        server.shutdown()
+        admin_dashboard.attach_bot(None)
+        asyncio.run(bot.shutdown())
+
+
+def test_dashboard_reads_the_rollups(tmp_path, monkeypatch):
+    import threading as threading_module
+
+    from flask import jsonify
+    from telemetry import InteractionRecorder
+
+    db_path = str(tmp_path / "bot_data.db")
+    recorder = InteractionRecorder(db_path)
+    for chat_id, dialect, response_time in (("a", "iraqi", 0.2), ("b", "iraqi", 0.4), ("a", "egyptian", 1.0)):
+        recorder.record(chat_id, dialect, response_time)
+    recorder.start()
+    recorder.close()
+
+    monkeypatch.setattr(admin_dashboard, "DB_PATH", db_path)
+    monkeypatch.setattr(admin_dashboard, "_local", threading_module.local())
+    monkeypatch.setattr(admin_dashboard, "render_template", lambda name, stats: jsonify([list(row) for row in stats]))
+    client = admin_dashboard.app.test_client()
+
+    rows = sorted(client.get("/dashboard").get_json(), key=lambda row: row[3])
+    assert rows == [[1, 1, 1.0, "egyptian", 1], [2, 2, pytest.approx(0.3), "iraqi", 2]]
+
+    latency = client.get("/api/latency/iraqi").get_json()
+    assert [hour["messages"] for hour in latency["hourly"]] == [2]
+    assert sum(bucket["count"] for bucket in latency["histogram"]) == 2
@@ -0,0 +1,127 @@
+# tests/test_admission.py
+"""اختبارات حد الطابور والنصيب العادل في AdmissionController"""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController
+
+
+def test_max_queue_is_a_hard_cap_with_more_groups_than_slots():
+    controller = AdmissionController(max_queue=4)
+    admissions = [controller.admit(f"group-{i}", 100) for i in range(50)]
+
+    assert sum(admission.admitted for admission in admissions) == 4
+    assert controller.pending == 4
+    assert all(admission.reason == "queue_full" for admission in admissions[4:])
+
+
+def test_cap_holds_before_the_first_batch_is_observed():
+    controller = AdmissionController(max_queue=8)
+    assert controller.token_seconds is None
+
+    for _ in range(20):
+        controller.admit("noisy", 100)
+    assert controller.pending == 8
+
+
+def test_group_under_its_share_evicts_newest_waiting_request_of_most_over_share_group():
+    controller = AdmissionController(max_queue=4)
+    noisy = [controller.admit("noisy", 100) for _ in range(4)]
+    evicted = []
+    for admission in noisy:
+        admission.dequeue = lambda admission=admission: evicted.append(admission) or True
+
+    quiet = controller.admit("quiet", 100)
+
+    assert quiet.admitted
+    assert evicted == [noisy[-1]]
+    assert noisy[-1].evicted and not noisy[-1].admitted and noisy[-1].reason == "queue_full"
+    assert all(admission.admitted for admission in noisy[:-1])
+    assert controller.pending == 4
+
+
+def test_started_requests_are_never_evicted():
+    controller = AdmissionController(max_queue=4)
+    noisy = [controller.admit("noisy", 100) for _ in range(4)]
+    # الطلبان الأحدث أخذتهما دفعة، والأقدمان بلا dequeue
+    for admission in noisy[2:]:
+        admission.dequeue = lambda: False
+
+    quiet = controller.admit("quiet", 100)
+
+    assert not quiet.admitted and quiet.reason == "queue_full"
+    assert all(admission.admitted and not admission.evicted for admission in noisy)
+    assert controller.pending == 4
+
+
+def test_group_at_its_share_is_rejected_when_full():
+    controller = AdmissionController(max_queue=4)
+    for group_id in ("a", "a", "b", "b"):
+        assert controller.admit(group_id, 100).admitted
+
+    assert not controller.admit("a", 100).admitted
+    assert controller.pending == 4
+
+
+def test_release_of_evicted_admission_does_not_free_another_slot():
+    controller = AdmissionController(max_queue=2)
+    first, second = controller.admit("noisy", 100), controller.admit("noisy", 100)
+    second.dequeue = lambda: True
+    controller.admit("quiet", 100)
+
+    controller.release(second)
+    assert controller.pending == 2
+    controller.release(first)
+    assert controller.pending == 1
+
+
+@pytest.fixture
+def slow_bot(bot_config):
+    from benchmarks.stub_model import StubChatModel
+    from main import MultiDialectBot
+
+    bot_config["performance"].update(max_queue=2, max_batch_size=1, batch_window_ms=0)
+    bot_config["model"]["warmup"] = False
+    model = StubChatModel(latency_ms=200)
+    return MultiDialectBot(bot_config, chat_model=model), model
+
+
+def test_eviction_only_takes_requests_still_waiting_for_the_model(slow_bot):
+    bot, model = slow_bot
+
+    async def scenario():
+        running = asyncio.create_task(bot.process_message("هلا شلونك اليوم", "noisy"))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.create_task(bot.process_message("شنو الأخبار عندكم", "noisy"))
+        await asyncio.sleep(0.05)
+        quiet = await bot.process_message("ازيك عامل ايه", "quiet")
+        replies = await asyncio.gather(running, waiting)
+        await bot.shutdown()
+        return replies, quiet
+
+    (running, waiting), quiet = asyncio.run(scenario())
+
+    # الطلب الجاري أكمل توليده، والمنتظر أُخرج فلم يصل النموذج
+    assert model.calls == 2
+    assert bot.admission.pending == 0
+    # ردود النموذج الوهمي كلمات "كلمةN"، والطلب المُخرج يأخذ رد اللهجة الافتراضي
+    assert "كلمة" not in waiting
+    assert "كلمة" in running and "كلمة" in quiet
+
+
+def test_cancelling_a_waiting_message_is_not_swallowed(slow_bot):
+    bot, _ = slow_bot
+
+    async def scenario():
+        task = asyncio.create_task(bot.process_message("هلا شلونك اليوم", "g"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert bot.admission.pending == 0
+        finally:
+            await bot.shutdown()
+
+    asyncio.run(scenario())
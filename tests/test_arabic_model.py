@@ -0,0 +1,169 @@
+# tests/test_arabic_model.py
+"""اختبارات إيقاف الرد عند اكتماله"""
+import pytest
+import torch
+
+from arabic_model import _IncrementalText, _ReplyStoppingCriteria, _ReplyStreamer
+
+MARKERS = ("\nالمستخدم:", "\nالبوت:")
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tiny_model_path):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(tiny_model_path)
+
+
+def _run(tokenizer, reply: str, limits=(1000, None)):
+    """تمرير الرد رمزًا رمزًا وإرجاع (سبب التوقف، عدد الرموز عنده، المعيار)"""
+    prompt = tokenizer.encode("مرحبا")
+    ids = tokenizer.encode(reply)
+    criteria = _ReplyStoppingCriteria(tokenizer, len(prompt), [limits], MARKERS, {tokenizer.eos_token_id})
+    for step in range(1, len(ids) + 1):
+        criteria(torch.tensor([prompt + ids[:step]]), None)
+        if criteria.reasons[0] is not None:
+            break
+    return criteria.reasons[0], criteria.lengths[0], criteria
+
+
+def test_incremental_text_matches_full_decode(tokenizer):
+    ids = tokenizer.encode("هلا والله، شلونك اليوم؟ إن شاء الله زين… أهلين بيك!")
+    text = _IncrementalText()
+    for token in ids:
+        text.extend(tokenizer, [token])
+    assert text.text == tokenizer.decode(ids)
+
+
+def test_stops_when_a_turn_marker_completes_across_tokens(tokenizer):
+    reply = "أهلين بيك\nالمستخدم: وبعدين"
+    reason, length, _ = _run(tokenizer, reply)
+    ids = tokenizer.encode(reply)
+    expected = next(step for step in range(1, len(ids) + 1) if MARKERS[0] in tokenizer.decode(ids[:step]))
+    assert (reason, length) == ("turn_marker", expected)
+
+
+def test_stops_at_sentence_limit(tokenizer):
+    reason, _, criteria = _run(tokenizer, "هلا والله. شلونك؟ زين الحمد لله. وانت", limits=(1000, 2))
+    assert reason == "sentences"
+    assert criteria.texts[0].text.rstrip().endswith("؟")
+
+
+def test_streamer_stops_at_a_marker_that_starts_with_a_special_token(tiny_model_path):
+    from transformers import AutoTokenizer
+    # مثل قوالب ChatML: علامة الدور الجديد تبدأ برمز خاص
+    tokenizer = AutoTokenizer.from_pretrained(tiny_model_path)
+    tokenizer.add_special_tokens({"additional_special_tokens": ["<|im_start|>"]})
+    texts = []
+    streamer = _ReplyStreamer(tokenizer, texts.append, ("<|im_start|>user", "<|im_start|>assistant"))
+
+    streamer.put(torch.tensor([tokenizer.encode("مرحبا")]))
+    for token in tokenizer.encode("هلا والله شلونك<|im_end|>\n<|im_start|>user\nشكو ماكو"):
+        streamer.put(torch.tensor([token]))
+    streamer.end()
+
+    assert streamer.stopped
+    assert streamer.text == "هلا والله شلونك"
+    assert "user" not in "".join(texts) and "<|" not in "".join(texts)
+
+
+@pytest.fixture(scope="module")
+def models(tiny_model_path):
+    from arabic_model import ArabicChatModel
+    config = {"device": "cpu", "max_tokens": 12}
+    return (
+        ArabicChatModel(tiny_model_path, config=config),
+        ArabicChatModel(tiny_model_path, use_prefix_cache=False, config=config)
+    )
+
+
+def _generate(model, requests):
+    torch.manual_seed(0)
+    return [(result.text, result.tokens_generated) for result in model.generate_batch(requests)]
+
+
+@pytest.mark.parametrize("dialects", [("iraqi",), ("iraqi", "egyptian", "iraqi", "standard_arabic")])
+def test_cached_prefix_generation_matches_cold_generation(models, dialects):
+    from generation_types import GenerationRequest
+
+    cached, cold = models
+    requests = [
+        GenerationRequest(text, dialect, history=[{"role": "user", "text": "مرحبا"}] * index)
+        for index, (text, dialect) in enumerate(zip(("هلا شلونك", "ازيك يا صاحبي", "شكو ماكو", "السلام"), dialects))
+    ]
+    hits = cached.prefix_cache.hits + cached.prefix_cache.misses
+
+    assert _generate(cached, requests) == _generate(cold, requests)
+    assert cached.prefix_cache.hits + cached.prefix_cache.misses == hits + len(requests)
+
+
+def test_int8_cache_round_trip_and_stale_files(tiny_model_path, tmp_path, monkeypatch):
+    import os
+    import shutil
+
+    from arabic_model import ArabicChatModel
+    from benchmarks.stub_model import build_tiny_model
+
+    path = build_tiny_model(str(tmp_path / "model"), tokenizer_path=tiny_model_path)
+    cache_dir = tmp_path / "quantized"
+    config = {"device": "cpu", "cpu": {"dtype": "int8", "quantized_cache_dir": str(cache_dir)}}
+    quantizations = []
+    quantize = torch.ao.quantization.quantize_dynamic
+    monkeypatch.setattr(
+        torch.ao.quantization, "quantize_dynamic",
+        lambda *args, **kwargs: quantizations.append(1) or quantize(*args, **kwargs)
+    )
+    ids = torch.tensor([[5, 6, 7, 8]])
+
+    def load():
+        model = ArabicChatModel(path, use_prefix_cache=False, config=config).model
+        with torch.no_grad():
+            return model(ids).logits
+
+    expected = load()
+    assert len(quantizations) == 1 and len(os.listdir(cache_dir)) == 1
+
+    # التحميل الثاني من الملف على meta بدون تكميم، وبنفس النتائج
+    assert torch.equal(load(), expected)
+    assert len(quantizations) == 1
+
+    # أوزان أعيد تدريبها بنفس الاسم والإعدادات: ملف جديد
+    (first,) = os.listdir(cache_dir)
+    weights = os.path.join(path, "model.safetensors")
+    stat = os.stat(weights)
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    load()
+    assert len(quantizations) == 2 and len(os.listdir(cache_dir)) == 2
+
+    # ملف قديم باسم الملف الجديد يُرفض ويُعاد التكميم
+    (second,) = set(os.listdir(cache_dir)) - {first}
+    shutil.copy(cache_dir / first, cache_dir / second)
+    load()
+    assert len(quantizations) == 3
+
+
+def test_input_ids_and_remembered_history_stay_within_token_budget(models, monkeypatch):
+    from generation_types import GenerationRequest
+    from group_memory import GroupMemory
+
+    model = models[1]
+    monkeypatch.setattr(model, "history_tokens", 60)
+    memory = GroupMemory("g", "iraqi", max_history=50)
+    for index in range(8):
+        request = GenerationRequest(f"رسالة رقم {index} شلونك اليوم", "iraqi", history=list(memory.history))
+        body_ids, turn_ids = model.build_input_ids(request)
+        assert len(body_ids) - len(model._generation_prompt_ids) <= model.history_tokens
+
+        # نفس خطوات BotAI._remember_interaction
+        (result,) = model.generate_batch([request])
+        assert result.reply_ids == model.encode_turn({"role": "assistant", "text": result.text})
+        memory.cache_token_ids(request.history, result.turn_ids[:-1], result.tokenizer_tag)
+        memory.add_turn("user", request.text, result.turn_ids[-1], result.tokenizer_tag)
+        memory.add_turn("assistant", result.text, result.reply_ids, result.tokenizer_tag)
+        memory.trim_to_tokens(model.history_tokens)
+        assert sum(len(turn["ids"]) for turn in memory.history) <= model.history_tokens
+    assert len(memory.history) < 16
+
+    # رسالة أطول من الميزانية وحدها تُقص ولا تتجاوزها
+    long_request = GenerationRequest("شلونك " * 200, "iraqi", history=list(memory.history))
+    body_ids, _ = model.build_input_ids(long_request)
+    assert len(body_ids) - len(model._generation_prompt_ids) <= model.history_tokens
@@ -0,0 +1,32 @@
+# tests/test_benchmarks.py
+"""اختبار تشغيل سريع لأداة القياس بالنموذج الوهمي"""
+import json
+import os
+
+from benchmarks.__main__ import main
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+
+
+def test_stub_benchmark_writes_a_report(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(ROOT)
+    workdir = tmp_path / "not" / "created" / "yet"
+    output = tmp_path / "report.json"
+
+    main([
+        "--messages", "12", "--groups", "3", "--stub-latency-ms", "1",
+        "--workdir", str(workdir), "--output", str(output)
+    ])
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert json.loads(capsys.readouterr().out) == report
+    assert report["backend"] == "stub" and report["messages"] == 12
+    assert report["outcomes"]["outcome=error"] == 0
+    assert os.getcwd() == str(workdir)
+
+    # المقارنة مع تقرير سابق
+    main([
+        "--messages", "12", "--groups", "3", "--stub-latency-ms", "1", "--stream",
+        "--config", os.path.join(ROOT, "config.yaml"), "--baseline", str(output)
+    ])
+    assert "comparison" in json.loads(capsys.readouterr().out)
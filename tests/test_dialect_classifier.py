@@ -0,0 +1,54 @@
+# tests/test_dialect_classifier.py
+"""اختبارات تدريب مصنف اللهجات من المتعلمين"""
+import pytest
+
+from adaptive_learner import AdaptiveLearner
+from dialect_classifier import DialectClassifier
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_fit_from_learners_counts_new_responses_past_the_window():
+    learner = AdaptiveLearner("iraqi", max_responses=4)
+    classifier = DialectClassifier(n_features=2 ** 10)
+    for i in range(3):
+        learner.learn_from_interaction(f"شكو ماكو {i}", "ماكو شي", 0.9)
+    assert classifier.fit_from_learners({"iraqi": learner}) == 3
+
+    # النافذة امتلأت وخرج منها الأقدم، والجديد فقط يُتدرب عليه
+    for i in range(3, 9):
+        learner.learn_from_interaction(f"شكو ماكو {i}", "ماكو شي", 0.9)
+    assert classifier.fit_from_learners({"iraqi": learner}) == 4
+    assert classifier.trained["iraqi"] == 9
+
+    learner.learn_from_interaction("شكو ماكو 9", "ماكو شي", 0.9)
+    assert classifier.fit_from_learners({"iraqi": learner}) == 1
+    assert classifier.fit_from_learners({"iraqi": learner}) == 0
+
+
+def test_learns_dialects_incrementally_and_survives_save_and_load(tmp_path):
+    classifier = DialectClassifier(n_features=2 ** 12)
+    assert not classifier.is_trained
+    classifier.fit_from_lexicon({
+        "iraqi": {"common_words": {"شلونك": "", "هسه": "", "اكو": ""}, "greetings": ["شلونك عيني"]},
+        "egyptian": {"common_words": {"ازيك": "", "عايز": "", "دلوقتي": ""}, "greetings": ["ازيك يا باشا"]}
+    })
+    for _ in range(5):
+        classifier.partial_fit(
+            ["شلونك هسه اكو شي", "ازيك عايز ايه دلوقتي"] * 4, ["iraqi", "egyptian"] * 4
+        )
+
+    texts = ["شلونك اليوم", "ازيك عامل ايه"]
+    predictions = classifier.predict(texts)
+    assert [dialect for dialect, _ in predictions] == ["iraqi", "egyptian"]
+    assert all(0.5 < confidence <= 1 for _, confidence in predictions)
+
+    # الأوزان تُحفظ float16، فالاحتمالات تتغير قليلاً فقط
+    path = str(tmp_path / "models" / "classifier.npz")
+    classifier.save(path)
+    loaded = DialectClassifier.load(path)
+    assert loaded.classes == classifier.classes and loaded.samples_seen == classifier.samples_seen
+    assert loaded.predict_proba(texts) == pytest.approx(classifier.predict_proba(texts), abs=1e-2)
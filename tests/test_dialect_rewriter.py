@@ -0,0 +1,46 @@
+# tests/test_dialect_rewriter.py
+"""اختبارات إعادة كتابة النص الفصيح بكلمات اللهجة"""
+import pytest
+
+from dialect_rewriter import DialectRewriter
+
+WORDS = {"شنو": "ماذا", "يعني ايه": "ماذا يعني", "هسه": "الآن", "شلون": "كيف", "اكو": "يوجد"}
+
+
+@pytest.fixture
+def rewriter():
+    return DialectRewriter(WORDS)
+
+
+def test_longest_phrase_wins(rewriter):
+    assert rewriter.rewrite("ماذا يعني هذا") == "يعني ايه هذا"
+    assert rewriter.rewrite("ماذا تريد") == "شنو تريد"
+    # العبارة لا تمتد عبر علامة ترقيم
+    assert rewriter.rewrite("ماذا، يعني") == "شنو، يعني"
+
+
+def test_punctuation_and_spacing_are_kept(rewriter):
+    assert rewriter.rewrite("  كيف حالك؟ الآن!\nيوجد...") == "  شلون حالك؟ هسه!\nاكو..."
+    # الكلمة داخل كلمة أطول لا تُستبدل
+    assert rewriter.rewrite("الآنية كيفما") == "الآنية كيفما"
+
+
+def test_partial_holds_back_the_undecided_tail(rewriter):
+    assert rewriter.rewrite_partial("كيف حال") == ("شلون ", "حال")
+    # "ماذا" قد تكون بداية "ماذا يعني"
+    assert rewriter.rewrite_partial("قل لي ماذا ") == ("قل لي ", "ماذا ")
+    # والكلمة الأخيرة قد تكون ناقصة، فتبقى العبارة كلها معلقة حتى تكتمل
+    assert rewriter.rewrite_partial("قل لي ماذا تريد") == ("قل لي ", "ماذا تريد")
+    assert rewriter.rewrite_partial("قل لي ماذا تريد الآن") == ("قل لي شنو تريد ", "الآن")
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8])
+def test_streamed_chunks_match_a_single_rewrite(rewriter, size):
+    text = "كيف الحال؟ ماذا يعني هذا الآن، ماذا تريد يوجد حل."
+    refined, buffer = [], ""
+    for start in range(0, len(text), size):
+        done, buffer = rewriter.rewrite_partial(buffer + text[start:start + size])
+        refined.append(done)
+    refined.append(rewriter.rewrite(buffer))
+
+    assert "".join(refined) == rewriter.rewrite(text)
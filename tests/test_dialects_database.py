@@ -0,0 +1,63 @@
+# tests/test_dialects_database.py
+"""اختبارات كشف اللهجة بكلمات المعجم (أتمتة Aho-Corasick)"""
+import pytest
+
+from aho_corasick import AhoCorasick
+from dialects_database import DialectDatabase
+
+
+@pytest.fixture
+def db():
+    return DialectDatabase()
+
+
+def test_automaton_reports_overlapping_matches():
+    automaton = AhoCorasick()
+    for pattern in ("هلا", "هلا والله", "والله"):
+        automaton.add(pattern, pattern)
+
+    matches = automaton.find_all("هلا والله بيك")
+
+    assert sorted(payload for _, _, payload in matches) == ["هلا", "هلا والله", "والله"]
+    assert (0, 9, "هلا والله") in matches
+
+
+@pytest.mark.parametrize("text, dialect", [
+    # "خل" داخل كلمة فصحى ليس كلمة عراقية
+    ("داخل البيت", "standard_arabic"),
+    ("تمامًا كما قلت", "standard_arabic"),
+    ("وشلونك اليوم", "iraqi"),
+    ("فعايز ايه", "egyptian"),
+    # سابقة واحدة فقط تُقبل
+    ("ووشلونك", "standard_arabic"),
+    ("شلونك، شكو ماكو؟", "iraqi"),
+    # العبارة متعددة الكلمات أثقل من كلمتها الأولى ("هلا" عراقية)
+    ("هلا والله", "khaleeji"),
+])
+def test_whole_words_and_attached_prefixes(db, text, dialect):
+    assert db.detect_dialect(text) == dialect
+
+
+def test_tie_falls_back_to_standard_arabic(db):
+    # كلمة خليجية وكلمة مصرية بنفس الوزن
+    assert db.detect_dialect_with_confidence("اشوفك تمام") == ("standard_arabic", 0.0)
+
+
+def test_lexicon_changes_rebuild_the_detector(db):
+    assert db.detect_dialect("فين الكتاب") == "standard_arabic"
+    detector = db._get_detector()
+
+    db.add_words("egyptian", {"فين": "أين"})
+    assert db.detect_dialect("فين الكتاب") == "egyptian"
+    assert db._get_detector() is not detector
+
+    # تعديل البيانات مباشرة يحتاج invalidate
+    db.dialects["iraqi"]["common_words"]["ماكو"] = "لا يوجد"
+    assert db.detect_dialect("ماكو شي") == "standard_arabic"
+    db.invalidate()
+    assert db.detect_dialect("ماكو شي") == "iraqi"
+
+
+def test_detect_many_matches_detect_dialect(db):
+    texts = ["وشلونك", "داخل البيت", "ازيك عامل ايه", "اشوفك تمام"]
+    assert db.detect_many(texts) == [db.detect_dialect_with_confidence(text) for text in texts]
@@ -0,0 +1,126 @@
+# tests/test_dispatcher.py
+"""اختبارات توزيع الرسائل: الترتيب داخل المجموعة والدمج وإنهاء الطوابير عند الإيقاف"""
+import asyncio
+
+import pytest
+
+from benchmarks.stub_model import StubChatModel
+from dispatcher import InMemoryAdapter, MessageDispatcher
+
+
+@pytest.fixture
+def bot(bot_config):
+    from main import MultiDialectBot
+    return MultiDialectBot(bot_config, chat_model=StubChatModel(latency_ms=50))
+
+
+class CallRecorder:
+    """يسجل استدعاءات process_message وعدد المتزامن منها لكل مجموعة"""
+
+    def __init__(self, bot):
+        self.calls = []
+        self.max_active = 0
+        self.max_active_per_group = 0
+        self._active = {}
+        original = bot.process_message
+
+        async def process_message(text, group_id, user_id=None):
+            self.calls.append((group_id, text))
+            self._active[group_id] = self._active.get(group_id, 0) + 1
+            self.max_active_per_group = max(self.max_active_per_group, self._active[group_id])
+            self.max_active = max(self.max_active, sum(self._active.values()))
+            try:
+                return await original(text, group_id, user_id)
+            finally:
+                self._active[group_id] -= 1
+
+        bot.process_message = process_message
+
+    def texts(self, group_id: str) -> list:
+        return [text for group, text in self.calls if group == group_id]
+
+
+def _run(bot, scenario, **settings):
+    async def main():
+        adapter = InMemoryAdapter()
+        dispatcher = MessageDispatcher(bot, [adapter], **settings)
+        await dispatcher.start()
+        try:
+            return await scenario(adapter, dispatcher)
+        finally:
+            await dispatcher.stop()
+            await bot.shutdown()
+    return asyncio.run(main())
+
+
+def test_each_group_is_served_in_order_and_groups_run_concurrently(bot):
+    recorder = CallRecorder(bot)
+
+    async def scenario(adapter, dispatcher):
+        for i in range(4):
+            for group in ("a", "b", "c"):
+                await adapter.receive(group, f"رسالة {i} في {group}")
+            await asyncio.sleep(0.03)
+        await dispatcher.drain()
+        return adapter.sent
+
+    sent = _run(bot, scenario)
+
+    assert recorder.max_active_per_group == 1
+    assert recorder.max_active > 1
+    for group in ("a", "b", "c"):
+        # الرسائل المدمجة تبقى بترتيب وصولها، وكل رد بعد الرد الذي قبله
+        texts = "\n".join(recorder.texts(group)).split("\n")
+        assert texts == [f"رسالة {i} في {group}" for i in range(4)]
+        replies = [int(reply_to) for sent_group, _, reply_to in sent if sent_group == group]
+        assert len(replies) == len(recorder.texts(group)) > 1
+        assert replies == sorted(replies)
+
+
+def test_backlog_is_coalesced_into_one_generation_keeping_newest(bot):
+    recorder = CallRecorder(bot)
+
+    async def scenario(adapter, dispatcher):
+        await adapter.receive("g", "أول رسالة")
+        await asyncio.sleep(0.01)
+        # تصل أثناء توليد الرد الأول فتُدمج، ويُترك الأقدم بعد max_coalesce
+        ids = [await adapter.receive("g", f"تكملة {i}") for i in range(4)]
+        await adapter.wait_for_replies(2, timeout=10)
+        return ids, adapter.sent
+
+    ids, sent = _run(bot, scenario, max_coalesce=2)
+
+    assert recorder.texts("g") == ["أول رسالة", "تكملة 2\nتكملة 3"]
+    assert [reply_to for _, _, reply_to in sent] == ["1", ids[-1]]
+
+
+def test_stop_drains_queued_messages_before_returning(bot):
+    recorder = CallRecorder(bot)
+
+    async def scenario(adapter, dispatcher):
+        for group in range(6):
+            await adapter.receive(f"group-{group}", "هلا شلونك")
+        await dispatcher.stop()
+        return dispatcher, adapter.sent
+
+    dispatcher, sent = _run(bot, scenario, max_concurrency=2)
+
+    assert len(sent) == 6 and len(recorder.calls) == 6
+    assert dispatcher.get_stats()["active_groups"] == 0
+    assert dispatcher.get_stats()["queued"] == 0
+
+
+def test_only_the_running_dispatcher_exports_metrics(bot):
+    from metrics import REGISTRY
+
+    async def scenario(adapter, dispatcher):
+        await adapter.receive("g", "هلا")
+        await adapter.wait_for_replies(1, timeout=10)
+        # موزع آخر أُنشئ ولم يبدأ لا يستبدل مقاييس الموزع العامل
+        MessageDispatcher(bot, [])
+        return REGISTRY.render_prometheus()
+
+    exported = _run(bot, scenario)
+
+    assert "dispatcher_received 1" in exported
+    assert "dispatcher_received" not in REGISTRY.render_prometheus()
@@ -0,0 +1,100 @@
+# tests/test_group_memory.py
+"""اختبارات ذاكرة المجموعات: حد LRU والانتهاء بعد الخمول وطول السجل"""
+import pytest
+
+from group_memory import InProcessGroupStore, as_turn, create_group_store
+
+
+def test_store_evicts_least_recently_active_group():
+    store = InProcessGroupStore(max_groups=3)
+    for group in ("a", "b", "c"):
+        store.get_or_create(group, "iraqi")
+    store.save(store.get("a"))
+
+    store.get_or_create("d", "iraqi")
+
+    assert list(store) == ["c", "a", "d"]
+    assert "b" not in store and store.evicted == 1
+
+
+def test_expiry_stops_at_first_active_group():
+    store = InProcessGroupStore(max_groups=10)
+    for group in ("a", "b", "c"):
+        store.get_or_create(group, "iraqi")
+    store.get("a").last_active = 100
+    store.get("b").last_active = 200
+    store.get("c").last_active = 150
+
+    # c قبل الحد لكنها بعد b في ترتيب النشاط فلا تُفحص
+    assert store.expire_inactive(60, now=250) == ["a"]
+    assert list(store) == ["b", "c"] and store.expired == 1
+
+
+def test_idle_timeout_expires_on_access():
+    store = create_group_store({"max_groups": 10, "group_idle_hours": 1})
+    store.get_or_create("old", "iraqi").last_active -= 7200
+
+    store.get_or_create("new", "gulf")
+
+    assert list(store) == ["new"]
+
+
+def test_history_keeps_last_turns_and_trims_to_token_budget():
+    store = InProcessGroupStore(max_history=2)
+    memory = store.get_or_create("g", "iraqi")
+    for i in range(6):
+        memory.add_turn("user" if i % 2 == 0 else "assistant", f"دور {i}", ids=[i] * 3, tokenizer_tag="t")
+
+    assert [turn["text"] for turn in memory.history] == ["دور 2", "دور 3", "دور 4", "دور 5"]
+    memory.trim_to_tokens(7)
+    assert [turn["text"] for turn in memory.history] == ["دور 4", "دور 5"]
+
+
+def test_legacy_history_entries_become_turns():
+    assert as_turn("البوت: هلا بيك") == {"role": "assistant", "text": "هلا بيك"}
+    assert as_turn("المستخدم: شلونك") == {"role": "user", "text": "شلونك"}
+
+
+def test_redis_store_shares_state_and_enforces_bounds():
+    fakeredis = pytest.importorskip("fakeredis")
+    from group_memory import RedisGroupStore
+
+    client = fakeredis.FakeRedis()
+    writer = RedisGroupStore(client, max_groups=2)
+    reader = RedisGroupStore(client, max_groups=2)
+    memory = writer.get_or_create("a", "iraqi")
+    memory.add_turn("user", "هلا")
+    writer.save(memory)
+
+    assert [turn["text"] for turn in reader.get("a").history] == ["هلا"]
+    writer.get_or_create("b", "gulf")
+    writer.get_or_create("c", "gulf")
+    assert len(reader) == 2 and "a" not in reader
+
+    assert writer.expire_inactive(0, now=writer.get("c").last_active + 1) == ["b", "c"]
+    assert len(reader) == 0
+
+
+def test_redis_store_keeps_turns_from_concurrent_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    from group_memory import RedisGroupStore
+
+    client = fakeredis.FakeRedis()
+    first = RedisGroupStore(client, max_history=2)
+    second = RedisGroupStore(client, max_history=2)
+    first.save(first.get_or_create("g", "iraqi"))
+
+    # عاملان يقرآن نفس الحالة ثم يحفظ كل منهما دوره
+    mine, theirs = first.get("g"), second.get("g")
+    mine.add_turn("user", "من الأول")
+    theirs.add_turn("user", "من الثاني")
+    first.save(mine)
+    second.save(theirs)
+    assert [turn["text"] for turn in first.get("g").history] == ["من الأول", "من الثاني"]
+
+    # الحفظ يضيف الأدوار الجديدة فقط ويقص إلى آخر max_history * 2
+    memory = first.get("g")
+    for i in range(4):
+        memory.add_turn("assistant", f"دور {i}")
+        first.save(memory)
+    assert [turn["text"] for turn in second.get("g").history] == ["دور 0", "دور 1", "دور 2", "دور 3"]
@@ -0,0 +1,169 @@
+# tests/test_inference_scheduler.py
+"""اختبارات مُجدول الدفعات: التناوب بين المجموعات وحدود الدفعة والمهلة وتشارك أماكن التوليد"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import Evicted
+from generation_types import GenerationRequest, GenerationResult
+from inference_scheduler import InferenceScheduler
+
+
+class RecordingModel:
+    """generate_batch وهمي يسجل كل دفعة وعدد الاستدعاءات المتزامنة للنموذج"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def generate_batch(self, requests: list) -> list:
+        self._enter()
+        try:
+            self.batches.append([request.text for request in requests])
+            time.sleep(self.latency)
+            return [GenerationResult(f"رد {request.text}", 1) for request in requests]
+        finally:
+            self._leave()
+
+    def stream(self, text: str) -> str:
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            return f"بث {text}"
+        finally:
+            self._leave()
+
+
+def _request(text: str, group_id: str, deadline: float = None) -> GenerationRequest:
+    return GenerationRequest(text, "iraqi", group_id=group_id, deadline=deadline)
+
+
+def _run(scheduler, scenario):
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await scheduler.close()
+    return asyncio.run(main())
+
+
+def test_streams_share_the_batch_slots():
+    model = RecordingModel()
+    scheduler = InferenceScheduler(model, batch_window_ms=0, max_concurrency=1)
+
+    async def scenario():
+        batch = scheduler.submit(_request("أ", "g1"))
+        streams = [scheduler.run_exclusive(model.stream, text) for text in ("ب", "ج")]
+        return await asyncio.gather(batch, *streams)
+
+    results = _run(scheduler, scenario)
+
+    assert [results[0].text] + results[1:] == ["رد أ", "بث ب", "بث ج"]
+    assert model.max_active == 1
+
+
+def test_waiting_stream_can_be_dequeued_but_a_running_one_cannot():
+    model = RecordingModel(latency=0.1)
+    scheduler = InferenceScheduler(model, batch_window_ms=0, max_concurrency=1)
+
+    async def scenario():
+        running_request, waiting_request = _request("أ", "g1"), _request("ب", "g2")
+        running = scheduler.run_exclusive(model.stream, "أ", request=running_request)
+        waiting = scheduler.run_exclusive(model.stream, "ب", request=waiting_request)
+        await asyncio.sleep(0.02)
+
+        assert not scheduler.dequeue(running_request)
+        assert scheduler.dequeue(waiting_request)
+        with pytest.raises(Evicted):
+            await waiting
+        # المكان لم يُحجز للطلب المُخرج: الطلب التالي يبدأ بعد الجاري مباشرة
+        assert await running == "بث أ"
+        assert await scheduler.run_exclusive(model.stream, "ج") == "بث ج"
+
+    _run(scheduler, scenario)
+
+
+def test_batches_take_groups_in_turn_up_to_max_batch_size():
+    model = RecordingModel()
+    scheduler = InferenceScheduler(model, batch_window_ms=0, max_batch_size=3)
+
+    async def scenario():
+        # كلها تصل قبل أن تبدأ حلقة الجدولة
+        futures = [scheduler.submit(_request(text, group)) for text, group in (
+            ("أ1", "a"), ("أ2", "a"), ("أ3", "a"), ("ب1", "b"), ("ج1", "c")
+        )]
+        return await asyncio.gather(*futures)
+
+    results = _run(scheduler, scenario)
+
+    assert model.batches == [["أ1", "ب1", "ج1"], ["أ2", "أ3"]]
+    assert [result.text for result in results] == ["رد أ1", "رد أ2", "رد أ3", "رد ب1", "رد ج1"]
+    assert scheduler.get_stats()["max_batch_size"] == 3
+
+
+@pytest.mark.parametrize("window_ms, batches", [(200, [["أ", "ب"]]), (0, [["أ"], ["ب"]])])
+def test_batch_window_waits_for_late_arrivals(window_ms, batches):
+    model = RecordingModel()
+    scheduler = InferenceScheduler(model, batch_window_ms=window_ms, max_batch_size=8)
+
+    async def scenario():
+        first = scheduler.submit(_request("أ", "a"))
+        await asyncio.sleep(0.03)
+        second = scheduler.submit(_request("ب", "b"))
+        return await asyncio.gather(first, second)
+
+    _run(scheduler, scenario)
+
+    assert model.batches == batches
+
+
+def test_request_past_its_deadline_is_dropped_from_the_batch():
+    from admission import DeadlineExceeded
+
+    model = RecordingModel()
+    scheduler = InferenceScheduler(model, batch_window_ms=0)
+
+    async def scenario():
+        late = scheduler.submit(_request("متأخر", "a", deadline=time.monotonic() - 1))
+        live = scheduler.submit(_request("حي", "b", deadline=time.monotonic() + 10))
+        with pytest.raises(DeadlineExceeded):
+            await late
+        return await live
+
+    assert _run(scheduler, scenario).text == "رد حي"
+    assert model.batches == [["حي"]]
+    assert scheduler.get_stats()["expired"] == 1
+
+
+def test_cancelled_request_leaves_the_queue():
+    model = RecordingModel(latency=0.1)
+    scheduler = InferenceScheduler(model, batch_window_ms=0, max_concurrency=1)
+
+    async def scenario():
+        running = scheduler.submit(_request("أ", "a"))
+        await asyncio.sleep(0.02)
+        # الدفعة الأولى تشغل المكان الوحيد، فالطلب الثاني ما زال في الطابور
+        waiting = scheduler.submit(_request("ب", "b"))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(waiting, 0.01)
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["queued"] == 0
+        await running
+        return await scheduler.submit(_request("ج", "c"))
+
+    assert _run(scheduler, scenario).text == "رد ج"
+    assert model.batches == [["أ"], ["ج"]]
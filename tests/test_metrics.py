@@ -0,0 +1,31 @@
+# tests/test_metrics.py
+"""اختبارات المقاييس: التحديث من عدة خيوط والتصدير"""
+import threading
+
+from metrics import MetricsRegistry
+
+
+def test_updates_from_many_threads_are_not_lost():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "زمن")
+    counter = registry.counter("test_total", "عدد")
+    start = threading.Barrier(8)
+
+    def work():
+        start.wait()
+        for _ in range(20000):
+            histogram.observe(0.002)
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts, _, count = histogram.read()
+    assert count == sum(counts) == counter.value == 160000
+    assert 'test_seconds_bucket{le="+Inf"} 160000' in registry.render_prometheus()
+
+    registry.reset()
+    assert histogram.read() == ([0] * len(counts), 0.0, 0) and counter.value == 0
@@ -0,0 +1,77 @@
+# tests/test_model_server.py
+"""اختبارات توزيع المجموعات على عمال النموذج وإعادة توجيهها عند توقف عامل"""
+import time
+
+import pytest
+
+from generation_types import GenerationRequest
+from model_server import HashRing, ModelWorkerPool, PoolUnavailable
+
+GROUPS = [f"group-{i}" for i in range(40)]
+
+
+def test_removing_a_node_moves_only_its_keys():
+    ring = HashRing(range(3))
+    before = {group: ring.get(group) for group in GROUPS}
+    assert set(before.values()) == {0, 1, 2}
+
+    ring.remove(1)
+
+    assert 1 not in ring and len(ring) == 2
+    for group, node in before.items():
+        if node != 1:
+            assert ring.get(group) == node
+        else:
+            assert ring.get(group) in (0, 2)
+
+
+@pytest.fixture(scope="module")
+def pool(tiny_model_path):
+    pool = ModelWorkerPool(
+        tiny_model_path, config={"max_tokens": 8, "warmup": False},
+        num_workers=2, threads_per_worker=1, start_timeout=300
+    )
+    yield pool
+    pool.close()
+
+
+def test_groups_stick_to_one_worker_and_results_keep_order(pool):
+    requests = [GenerationRequest(f"هلا {i}", "iraqi", group_id=group) for i, group in enumerate(GROUPS[:6])]
+    owners = [pool._worker_for(request) for request in requests]
+    assert set(owners) == {0, 1}
+    assert owners == [pool._worker_for(request) for request in requests]
+
+    results = pool.generate_batch(requests)
+
+    assert len(results) == len(requests)
+    assert all(result.text for result in results)
+    assert pool.get_stats() == {"workers": 2, "workers_alive": 2, "pending_calls": 0}
+
+
+def test_dead_worker_groups_move_to_the_survivor(pool):
+    owners = {group: pool._worker_for(GenerationRequest("هلا", "iraqi", group_id=group)) for group in GROUPS}
+    lost = [group for group, worker in owners.items() if worker == 1]
+    assert lost
+
+    pool._processes[1].terminate()
+    pool._processes[1].join(10)
+    deadline = time.monotonic() + 10
+    while 1 in pool._ring and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    assert 1 not in pool._ring
+    assert pool.get_stats()["workers_alive"] == 1
+    requests = [GenerationRequest("شلونك", "iraqi", group_id=group) for group in lost[:3]]
+    assert {pool._worker_for(request) for request in requests} == {0}
+    assert all(result.text for result in pool.generate_batch(requests))
+
+
+def test_requests_fail_clearly_when_every_worker_is_dead(pool):
+    pool._processes[0].terminate()
+    pool._processes[0].join(10)
+    deadline = time.monotonic() + 10
+    while len(pool._ring) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    with pytest.raises(PoolUnavailable):
+        pool.generate_batch([GenerationRequest("هلا", "iraqi", group_id="g")])
@@ -0,0 +1,52 @@
+# tests/test_ngram_store.py
+"""اختبارات عداد Count-Min وقائمة الأكثر تكرارًا"""
+import pickle
+import random
+from collections import Counter
+
+from ngram_store import SketchCounter
+
+
+def _stream(seed: int = 0, messages: int = 2000):
+    rng = random.Random(seed)
+    vocab = [f"كلمة{i}" for i in range(3000)]
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    return [rng.choices(vocab, weights, k=8) for _ in range(messages)]
+
+
+def test_heavy_hitters_match_exact_top_counts():
+    sketch = SketchCounter(width=4096, top_capacity=200)
+    exact = Counter()
+    for ngrams in _stream():
+        sketch.add_many(ngrams)
+        exact.update(ngrams)
+
+    assert [ngram for ngram, _ in sketch.top_k(10)] == [ngram for ngram, _ in exact.most_common(10)]
+    assert len(sketch) == 200
+    assert len(sketch._heap) <= 2 * sketch.top_capacity + 64
+    for ngram, count in exact.most_common(50):
+        assert sketch.get(ngram) >= count
+
+
+def test_decay_scales_table_and_candidates():
+    sketch = SketchCounter(width=256, top_capacity=20)
+    for ngrams in _stream(messages=200):
+        sketch.add_many(ngrams)
+    before = dict(sketch.top_k(5))
+
+    sketch.decay(0.5)
+
+    for ngram, count in before.items():
+        assert sketch.get(ngram) == count * 0.5
+        assert dict(sketch.top_k(20))[ngram] == count * 0.5
+
+
+def test_pickle_round_trip_keeps_counts_and_candidates():
+    sketch = SketchCounter(width=256, top_capacity=20)
+    for ngrams in _stream(messages=200):
+        sketch.add_many(ngrams)
+
+    restored = pickle.loads(pickle.dumps(sketch))
+    assert restored.top_k(20) == sketch.top_k(20)
+    restored.add("كلمة0", 3)
+    assert restored.get("كلمة0") == sketch.get("كلمة0") + 3
@@ -0,0 +1,71 @@
+# tests/test_response_cache.py
+"""اختبارات ذاكرة الردود: توحيد الكتابة والبحث التقريبي والإخراج عند الامتلاء"""
+import pytest
+
+from response_cache import ResponseCache, char_ngrams, normalize_arabic
+
+
+@pytest.mark.parametrize("text, normalized", [
+    ("أهلاً وسهلاً!!", "اهلا وسهلا"),
+    ("مرحبـــا   يا  صديقي؟", "مرحبا يا صديقي"),
+    ("السلامُ عليكمْ", "السلام عليكم"),
+    ("إلى المدرسة", "الي المدرسه"),
+    ("Hello, World", "hello world"),
+])
+def test_normalize_arabic(text, normalized):
+    assert normalize_arabic(text) == normalized
+
+
+def _jaccard(a: str, b: str) -> float:
+    a, b = char_ngrams(normalize_arabic(a)), char_ngrams(normalize_arabic(b))
+    return len(a & b) / len(a | b)
+
+
+def test_near_match_uses_trigram_jaccard_threshold():
+    similarity = _jaccard("هلا شلونك", "هلا شلونكم")
+    assert 0 < similarity < 1
+
+    strict = ResponseCache(similarity_threshold=similarity + 0.01)
+    loose = ResponseCache(similarity_threshold=similarity)
+    for cache in (strict, loose):
+        cache.put("هلا شلونك", "زين")
+
+    assert strict.get("هلا شلونكم") is None
+    assert loose.get("هلا شلونكم") == "زين"
+    assert loose.get("هلا، شلونك!") == "زين"
+    assert loose.get_stats()["near_hits"] == 1 and loose.get_stats()["hits"] == 1
+
+
+def test_nearest_uses_its_own_threshold_without_touching_stats():
+    cache = ResponseCache(similarity_threshold=0.9)
+    cache.put("هلا شلونك", "زين")
+
+    assert cache.get("هلا شلونكم اليوم") is None
+    stats = cache.get_stats()
+    assert cache.nearest("هلا شلونكم اليوم", 0.3) == "زين"
+    assert cache.nearest("كلام مختلف تماما", 0.3) is None
+    assert cache.get_stats() == stats
+
+
+def test_long_messages_are_not_cached():
+    cache = ResponseCache(max_words=3)
+    cache.put("هذه رسالة طويلة جدا للتخزين", "رد")
+    assert len(cache) == 0
+    assert cache.get("هذه رسالة طويلة جدا للتخزين") is None
+
+
+def test_eviction_keeps_the_bound_and_spares_frequent_entries():
+    cache = ResponseCache(capacity=10, eviction_sample=4)
+    cache.put("رسالة 0", "رد 0")
+    for _ in range(3):
+        assert cache.get("رسالة 0") == "رد 0"
+    for i in range(1, 100):
+        cache.put(f"رسالة {i}", f"رد {i}")
+        # رسالة 0 تبقى بين الأقدم لكنها الأكثر استخدامًا
+        cache._entries.move_to_end("رساله 0", last=False)
+
+    assert len(cache) == 10
+    assert "رساله 0" in cache._entries
+    # الفهرس المقلوب لا يشير إلا إلى مفاتيح موجودة
+    indexed = set().union(*cache._index.values())
+    assert indexed == set(cache._entries)
@@ -0,0 +1,67 @@
+# tests/test_speculative.py
+"""اختبارات التوليد التخميني بنموذج مسودة"""
+import pytest
+
+from arabic_model import ArabicChatModel, _ForwardCounter, _SpeculationStats
+from generation_types import GenerationRequest
+from metrics import REGISTRY
+
+
+def _model(main_path: str, draft_path: str, **speculative) -> ArabicChatModel:
+    config = {
+        "device": "cpu",
+        "max_tokens": 12,
+        "speculative": dict(speculative, draft_model=draft_path)
+    }
+    return ArabicChatModel(main_path, config=config)
+
+
+def _draft_tokens() -> float:
+    counters = REGISTRY.snapshot().get("model_draft_tokens_total", {})
+    return sum(counters.values())
+
+
+def test_acceptance_below_threshold_falls_back_then_probes_again():
+    stats = _SpeculationStats(min_acceptance=0.5, probe_every=3, smoothing=0.5)
+    stats.observe(drafted=10, accepted=8)
+    assert stats.acceptance == pytest.approx(0.8)
+    stats.observe(drafted=10, accepted=0)
+    assert stats.acceptance == pytest.approx(0.4)
+
+    assert [stats.enabled() for _ in range(3)] == [False, False, True]
+    assert stats.acceptance is None
+
+
+def test_draft_generation_records_acceptance(tiny_model_path, tiny_draft_path):
+    model = _model(tiny_model_path, tiny_draft_path)
+    assert model.draft_model is not None
+
+    before = _draft_tokens()
+    result = model.generate_batch([GenerationRequest("هلا شلونك", "iraqi")])[0]
+
+    assert result.tokens_generated > 0
+    assert model.speculation.acceptance is not None
+    assert 0.0 <= model.speculation.acceptance <= 1.0
+    assert _draft_tokens() > before
+
+
+def test_low_acceptance_generates_without_the_draft(tiny_model_path, tiny_draft_path):
+    model = _model(tiny_model_path, tiny_draft_path, min_acceptance=0.5, probe_every=50)
+    model.speculation.acceptance = 0.0
+
+    draft = _ForwardCounter(model.draft_model)
+    try:
+        result = model.generate_batch([GenerationRequest("هلا شلونك", "iraqi")])[0]
+    finally:
+        draft.close()
+
+    assert result.tokens_generated > 0
+    assert draft.calls == 0
+
+
+def test_unavailable_draft_keeps_plain_generation(tiny_model_path, tmp_path):
+    model = _model(tiny_model_path, str(tmp_path / "missing-draft"))
+
+    assert model.draft_model is None and model.speculation is None
+    result = model.generate_batch([GenerationRequest("هلا شلونك", "iraqi")])[0]
+    assert result.tokens_generated > 0
@@ -0,0 +1,131 @@
+# tests/test_telemetry.py
+"""اختبارات تسجيل التفاعلات في SQLite خارج مسار الرسائل"""
+import hashlib
+import sqlite3
+
+import pytest
+
+from telemetry import InteractionRecorder
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "bot_data.db")
+
+
+def _rows(db_path: str, query: str = "SELECT chat_id, user_id, dialect FROM interactions ORDER BY id"):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(query).fetchall()
+
+
+def test_full_queue_drops_and_counts_without_blocking(db_path):
+    recorder = InteractionRecorder(db_path, max_queue=3)
+    for i in range(5):
+        recorder.record(f"group-{i}", "iraqi", 0.1)
+
+    assert recorder.get_stats() == {"recorded": 3, "written": 0, "dropped": 2, "queued": 3}
+
+    recorder.start()
+    recorder.close()
+    assert [chat_id for chat_id, _, _ in _rows(db_path)] == ["group-0", "group-1", "group-2"]
+    assert recorder.get_stats()["written"] == 3
+
+
+def test_queue_is_written_in_batches(db_path):
+    recorder = InteractionRecorder(db_path, batch_size=2)
+    batches = []
+    original = recorder._write
+
+    def write(conn, batch):
+        batches.append(len(batch))
+        original(conn, batch)
+
+    recorder._write = write
+    for i in range(5):
+        recorder.record("group", "egyptian", 0.2, cache_hit=i % 2 == 0, tokens_generated=10)
+    recorder.start()
+    recorder.close()
+
+    assert batches == [2, 2, 1]
+    assert _rows(db_path, "SELECT COUNT(*), SUM(cache_hit), SUM(tokens_generated) FROM interactions") == [(5, 3, 50)]
+
+
+@pytest.mark.parametrize("anonymize", [True, False])
+def test_user_ids_are_hashed_when_anonymizing(db_path, anonymize):
+    recorder = InteractionRecorder(db_path, anonymize=anonymize)
+    recorder.record(42, "iraqi", 0.1, user_id=1001)
+    recorder.record(42, "iraqi", 0.1)
+    recorder.start()
+    recorder.close()
+
+    hashed = hashlib.sha256(b"1001").hexdigest()[:16]
+    assert _rows(db_path) == [("42", hashed if anonymize else "1001", "iraqi"), ("42", None, "iraqi")]
+
+
+ROLLUPS = {
+    "dialect_rollup": "SELECT * FROM dialect_rollup ORDER BY dialect",
+    "hourly_rollup": "SELECT * FROM hourly_rollup ORDER BY hour, dialect",
+    "latency_histogram": "SELECT * FROM latency_histogram ORDER BY dialect, bucket",
+    "dialect_groups": "SELECT * FROM dialect_groups ORDER BY dialect, chat_id",
+}
+
+
+def _interactions(count: int, start: float = 1_700_000_000):
+    dialects = ("iraqi", "egyptian", "khaleeji")
+    return [
+        (f"group-{i % 7}", None, dialects[i % 3], 0.003 * (i % 40) + 0.001, i % 2, i % 50, start + 600 * i)
+        for i in range(count)
+    ]
+
+
+def _rollups(conn) -> dict:
+    return {table: conn.execute(query).fetchall() for table, query in ROLLUPS.items()}
+
+
+def _assert_same(actual: dict, expected: dict):
+    assert actual.keys() == expected.keys()
+    for table in expected:
+        assert len(actual[table]) == len(expected[table]), table
+        for row, expected_row in zip(actual[table], expected[table]):
+            assert row == pytest.approx(expected_row), table
+
+
+def test_incremental_rollups_match_a_rebuild_from_raw_rows(db_path):
+    from telemetry import connect, ensure_schema, rebuild_rollups
+
+    conn = connect(db_path)
+    ensure_schema(conn)
+    recorder = InteractionRecorder(db_path)
+    interactions = _interactions(120)
+    for start in range(0, len(interactions), 25):
+        recorder._write(conn, interactions[start:start + 25])
+    incremental = _rollups(conn)
+
+    rebuild_rollups(conn)
+    conn.commit()
+
+    _assert_same(incremental, _rollups(conn))
+    totals = conn.execute("SELECT SUM(message_count), SUM(cache_hits), SUM(tokens_sum) FROM dialect_rollup")
+    assert totals.fetchone() == (120, 60, sum(i % 50 for i in range(120)))
+    assert sum(count for _, _, count in incremental["latency_histogram"]) == 120
+    conn.close()
+
+
+def test_ensure_schema_builds_rollups_for_existing_interactions(db_path):
+    from telemetry import INTERACTIONS_SCHEMA, _INSERT_INTERACTION, connect, ensure_schema
+
+    # قاعدة من إصدار قديم فيها جدول التفاعلات فقط
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(INTERACTIONS_SCHEMA)
+        conn.executemany(_INSERT_INTERACTION, _interactions(30))
+
+    conn = connect(db_path)
+    ensure_schema(conn)
+    rebuilt = _rollups(conn)
+
+    fresh = connect(str(db_path) + ".incremental")
+    ensure_schema(fresh)
+    InteractionRecorder()._write(fresh, _interactions(30))
+    _assert_same(rebuilt, _rollups(fresh))
+    conn.close()
+    fresh.close()